@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""Playing animations off the game clock instead of time.sleep().
+
+Sleeping between frames left the event queue alone for seconds at a time and made every animation slower by however
+long the drawing took. A Timeline instead keeps track of when each frame is due and, if drawing falls behind, skips
+frames so the animation still takes as long as it should. Nothing here waits, the game's states.StateMachine tells
+a Timeline how much time went by and asks it to draw.
+"""
+
+from __future__ import with_statement
+
+import logging
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class Timeline(object):
+	"""An animation, being a list of (duration, draw) frames.
+
+	"draw" is called with no arguments, should draw the frame and add what it changed to the dirty rects. The frame
+	stays up for "duration" seconds. Frames whose time is already over when they come up are skipped, except for the
+	last one, so that the animation always ends how it is supposed to.
+
+	>>> drawn = []
+	>>> timeline = Timeline([(0.02, lambda i=i: drawn.append(i)) for i in range(10)])
+	>>> while not timeline.done:
+	... 	timeline.render()
+	... 	timeline.advance(0.05)
+	>>> drawn, timeline.framesSkipped
+	([0, 2, 4, 7, 9], 5)
+	"""
+
+	def __init__(self, frames):
+		self._frames = list(frames)
+		self._ends = []
+		end = 0.0
+		for duration, draw in self._frames:
+			end += duration
+			self._ends.append(end)
+		self._elapsed = 0.0
+		self._index = 0
+		self._drawn = False
+		self.done = not self._frames
+		self.framesDrawn = 0
+		self.framesSkipped = 0
+
+	def advance(self, elapsed):
+		"""Moves the animation on by elapsed seconds"""
+		if self.done:
+			return
+		self._elapsed += elapsed
+		lastIndex = len(self._frames) - 1
+		if not self._drawn or self._elapsed < self._ends[self._index]:
+			return
+		if self._index == lastIndex:
+			self.done = True
+			return
+		self._index += 1
+		while self._index < lastIndex and self._ends[self._index] < self._elapsed:
+			self._index += 1
+			self.framesSkipped += 1
+		self._drawn = False
+
+	def render(self):
+		"""Draws the frame that is up, if it hasn't been drawn yet"""
+		if self.done or self._drawn:
+			return
+		self._frames[self._index][1]()
+		self._drawn = True
+		self.framesDrawn += 1
+
+	def timeout(self):
+		"""How long until the next frame is due"""
+		if self.done or not self._drawn:
+			return 0
+		return max(self._ends[self._index] - self._elapsed, 0)
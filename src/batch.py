@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+"""Playing lots of games without anyone watching, for checking the game's balance and catching changes to the physics.
+
+Every match is played by match.Match between two players that are either an opponent.Opponent or a script of throws,
+with nothing drawn and no pygame at all, spread over a process pool. What comes back is boiled down into statistics:
+how many throws it takes to hit, how often throws hit for each wind and gravity, who wins and how many matches a
+second get played. A match is decided by its seed, so with a budget large enough for the opponents' search to always
+run to the end, the same run gives the same numbers, and numbers that change point at a change in the physics.
+
+	python batch.py --matches 200 --gravity 9.8,3.7 hard medium
+"""
+
+from __future__ import with_statement
+
+import sys
+import time
+import random
+import logging
+import optparse
+
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+import match
+import opponent
+import simulation
+import worldgen
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+MAX_THROWS = 500
+"""Matches that go on for longer than this are called off, as two scripts that never hit would otherwise play
+forever."""
+
+WIND_BUCKET = 5
+
+
+class ScriptedPlayer(object):
+	"""A player that throws the (angle, velocity) pairs it was given over and over, angles being what the player would
+	type in. Read from a file, each line has an angle and a velocity separated by spaces, like "45 50"."""
+
+	def __init__(self, shots):
+		if not shots:
+			raise ValueError("No shots to script")
+		self._shots = shots
+		self._next = 0
+
+	@classmethod
+	def load(cls, path):
+		shots = []
+		with open(path) as scriptFile:
+			for line in scriptFile:
+				line = line.split("#", 1)[0].strip()
+				if line:
+					angle, velocity = line.split()
+					shots.append((float(angle), float(velocity)))
+		return cls(shots)
+
+	def getShot(self, playerNum, wind, gravity, gor1, gor2, skyline):
+		angle, velocity = self._shots[self._next % len(self._shots)]
+		self._next += 1
+		return opponent.worldAngle(playerNum, angle), velocity
+
+
+def makePlayer(spec, budget, rng):
+	"""A player from how it was given on the command line, either a difficulty for an opponent.Opponent or
+	"script:PATH" for a ScriptedPlayer"""
+	if spec.startswith("script:"):
+		return ScriptedPlayer.load(spec[len("script:"):])
+	return opponent.Opponent(spec, budget, rng)
+
+
+class MatchStats(object):
+	"""How a match went. "throws" has a (wind, gravity, playerNum, outcome) for every throw and "shotsToKill" how many
+	throws each round took."""
+
+	def __init__(self, seed, gravity, players):
+		self.seed = seed
+		self.gravity = gravity
+		self.players = players
+		self.throws = []
+		self.shotsToKill = []
+		self.scores = [0, 0]
+		self.calledOff = False
+		self.seconds = 0.0
+
+
+def playMatch(task):
+	"""Plays a match and returns its MatchStats, task being (seed, winPoints, gravity, (p1spec, p2spec), budget). This
+	is what runs in the worker processes.
+
+	>>> stats = playMatch((1, 1, 9.8, ('perfect', 'perfect'), 1.0))
+	>>> max(stats.scores), stats.shotsToKill == [len(stats.throws)], stats.calledOff
+	(1, True, False)
+	"""
+	seed, winPoints, gravity, specs, budget = task
+	start = time.time()
+	rng = random.Random(seed)
+	players = [makePlayer(spec, budget, random.Random(rng.random())) for spec in specs]
+	played = match.Match(specs[0], specs[1], winPoints, gravity)
+	stats = MatchStats(seed, gravity, specs)
+
+	roundThrows = 0
+	while not played.isOver:
+		if len(stats.throws) >= MAX_THROWS:
+			stats.calledOff = True
+			break
+		if played.needsRound:
+			played.newRound(seed=rng.randint(0, worldgen.MAX_SEED))
+			roundThrows = 0
+		city = played.city
+		playerNum = played.turn
+		gor1, gor2 = city.world.gorillas
+		angle, velocity = players[playerNum - 1].getShot(playerNum, city.world.wind, gravity, gor1, gor2, city.mask)
+		shot = played.throw(angle, velocity)
+		roundThrows += 1
+		stats.throws.append((city.world.wind, gravity, playerNum, shot.outcome))
+		if played.needsRound:
+			stats.shotsToKill.append(roundThrows)
+
+	stats.scores = list(played.scores)
+	stats.seconds = time.time() - start
+	return stats
+
+
+def runMatches(tasks, processes=None):
+	"""Plays every match in tasks, yielding their MatchStats as they finish. The matches are spread over processes
+	worker processes (as many as there are CPUs by default), or played one after the other here if there is only the
+	one process or no multiprocessing module to do it with."""
+	if processes is None and multiprocessing is not None:
+		processes = multiprocessing.cpu_count()
+	if multiprocessing is None or processes is None or processes <= 1:
+		for task in tasks:
+			yield playMatch(task)
+		return
+
+	pool = multiprocessing.Pool(processes)
+	try:
+		for stats in pool.imap_unordered(playMatch, tasks, chunksize=4):
+			yield stats
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+
+def _ratio(part, whole):
+	if not whole:
+		return 0.0
+	return float(part) / whole
+
+
+def _hitsOther(playerNum, outcome):
+	return (playerNum, outcome) in ((1, simulation.GORILLA2), (2, simulation.GORILLA1))
+
+
+class Report(object):
+	"""Adds up MatchStats into the numbers that get printed
+
+	>>> report = Report()
+	>>> stats = MatchStats(1, 9.8, ('hard', 'easy'))
+	>>> stats.throws = [(5, 9.8, 1, 'miss'), (5, 9.8, 2, 'building'), (-7, 9.8, 1, 'gorilla2')]
+	>>> stats.shotsToKill, stats.scores = [3], [1, 0]
+	>>> report.add(stats)
+	>>> report.hitRates(report.byWind)
+	[('-10..-6', 1, 1.0), ('5..9', 2, 0.0)]
+	>>> report.wins
+	{1: 1}
+	>>> report.add(MatchStats(2, 9.8, ('hard', 'easy')))
+	>>> report.lines(1.0)[4]
+	'Wins: player 1 (hard) 1, player 2 (easy) 0'
+	"""
+
+	def __init__(self):
+		self.matches = 0
+		self.calledOff = 0
+		self.throws = 0
+		self.shotsToKill = []
+		self.outcomes = {}
+		self.byWind = {}
+		self.byGravity = {}
+		self.wins = {}
+		"""By player number, not by what plays them, as both can be played the same way."""
+		self.players = None
+		self.matchSeconds = 0.0
+
+	def add(self, stats):
+		self.matches += 1
+		self.matchSeconds += stats.seconds
+		if self.players is None:
+			self.players = stats.players
+		if stats.calledOff:
+			self.calledOff += 1
+		elif stats.scores[0] != stats.scores[1]:
+			winner = stats.scores.index(max(stats.scores)) + 1
+			self.wins[winner] = self.wins.get(winner, 0) + 1
+		self.shotsToKill.extend(stats.shotsToKill)
+		for wind, gravity, playerNum, outcome in stats.throws:
+			self.throws += 1
+			self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+			hit = _hitsOther(playerNum, outcome)
+			bucket = (wind // WIND_BUCKET) * WIND_BUCKET
+			for counts, key in ((self.byWind, bucket), (self.byGravity, gravity)):
+				throws, hits = counts.get(key, (0, 0))
+				counts[key] = throws + 1, hits + int(hit)
+
+	def hitRates(self, counts):
+		"""(label, throws, hit rate) for each bucket of counts (byWind or byGravity)"""
+		rates = []
+		for key in sorted(counts.iterkeys()):
+			throws, hits = counts[key]
+			if counts is self.byWind:
+				label = "%d..%d" % (key, key + WIND_BUCKET - 1)
+			else:
+				label = "%g" % key
+			rates.append((label, throws, _ratio(hits, throws)))
+		return rates
+
+	def lines(self, seconds):
+		lines = []
+		lines.append("%d matches (%d called off) in %.2f seconds, %.1f matches a second" % (
+			self.matches, self.calledOff, seconds, _ratio(self.matches, seconds),
+		))
+		lines.append("%d throws, %.1f ms of CPU a match" % (self.throws, _ratio(self.matchSeconds, self.matches) * 1000))
+		if self.shotsToKill:
+			shotsToKill = sorted(self.shotsToKill)
+			lines.append("Shots to kill: mean %.2f, median %d, max %d" % (
+				_ratio(sum(shotsToKill), len(shotsToKill)), shotsToKill[len(shotsToKill) // 2], shotsToKill[-1],
+			))
+		lines.append("Outcomes: %s" % ", ".join(
+			"%s %.1f%%" % (outcome, 100 * _ratio(count, self.throws)) for outcome, count in sorted(self.outcomes.iteritems())
+		))
+		if self.players is not None:
+			lines.append("Wins: %s" % ", ".join(
+				"player %d (%s) %d" % (playerNum, player, self.wins.get(playerNum, 0))
+				for playerNum, player in zip((1, 2), self.players)
+			))
+		for title, counts in (("wind", self.byWind), ("gravity", self.byGravity)):
+			lines.append("Hit rate by %s:" % title)
+			for label, throws, rate in self.hitRates(counts):
+				lines.append("  %-10s %6d throws %6.1f%%" % (label, throws, 100 * rate))
+		return lines
+
+
+def main(args):
+	parser = optparse.OptionParser(
+		usage="%prog [options] PLAYER1 PLAYER2",
+		description="Plays matches between two computer players (%s, or script:PATH for a file of angle velocity lines) and prints statistics on them" % ", ".join(sorted(opponent.NOISE.iterkeys())),
+	)
+	parser.add_option("-n", "--matches", type="int", default=100, help="How many matches to play [%default]")
+	parser.add_option("--points", type="int", default=3, help="Points a match is played to [%default]")
+	parser.add_option("--gravity", default="9.8", help="Gravities to play at, separated by commas, taking turns between matches [%default]")
+	parser.add_option("--seed", type="int", default=0, help="Seed of the first match, the others counting up from it [%default]")
+	parser.add_option("--budget", type="float", default=opponent.BUDGET, help="Seconds the computer players get to search for a throw [%default]")
+	parser.add_option("-j", "--processes", type="int", default=None, help="Worker processes [as many as there are CPUs]")
+	options, players = parser.parse_args(args)
+	if len(players) != 2:
+		parser.error("Two players needed")
+	for spec in players:
+		if not spec.startswith("script:") and spec not in opponent.NOISE:
+			parser.error("Unknown player %r" % spec)
+	gravities = [float(gravity) for gravity in options.gravity.split(",")]
+
+	tasks = [
+		(options.seed + i, options.points, gravities[i % len(gravities)], tuple(players), options.budget)
+		for i in xrange(options.matches)
+	]
+	report = Report()
+	start = time.time()
+	for stats in runMatches(tasks, options.processes):
+		report.add(stats)
+	for line in report.lines(time.time() - start):
+		print line
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
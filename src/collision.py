@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""What parts of the city a banana can hit.
+
+The skyline used to be checked by reading pixels back from its surface for every frame of a throw. Instead,
+SkylineMask keeps a numpy occupancy grid alongside the surface: buildings are filled in once when the city is
+made and explosions carve craters out of it, so checking the banana against the city is a single slice. Craters
+are carved with circleMask(), which is also what they are drawn with, so what is left of the city on the screen and
+what a banana can hit agree to the pixel.
+
+Between two frames the banana can move further than its own size, so fast throws are also swept: the rect is
+slid along the segment a pixel at a time and the first position that touches something is reported.
+"""
+
+from __future__ import with_statement
+
+import math
+import logging
+
+import numpy
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+_CIRCLE_MASKS = {}
+
+
+def circleMask(radius):
+	"""A read only boolean (2 * radius + 1) square array that is True within radius of its middle, made the first
+	time each radius is asked for
+
+	>>> circleMask(2).astype(int).tolist()
+	[[0, 0, 1, 0, 0], [0, 1, 1, 1, 0], [1, 1, 1, 1, 1], [0, 1, 1, 1, 0], [0, 0, 1, 0, 0]]
+	>>> circleMask(2) is circleMask(2)
+	True
+	"""
+	try:
+		return _CIRCLE_MASKS[radius]
+	except KeyError:
+		pass
+	offsets = numpy.arange(-radius, radius + 1)
+	mask = offsets[:, numpy.newaxis] ** 2 + offsets[numpy.newaxis, :] ** 2 <= radius * radius
+	mask.setflags(write=False)
+	_CIRCLE_MASKS[radius] = mask
+	return mask
+
+
+def sweepPositions(x0, y0, x1, y1):
+	"""Returns the positions visited going from x0, y0 to x1, y1 (not including the start), close enough together
+	that a rect never jumps more than a pixel. This is (fractions, xs, ys), fractions being how far along each
+	position is.
+
+	>>> fractions, xs, ys = sweepPositions(0, 0, 4, 2)
+	>>> list(fractions), list(xs), list(ys)
+	([0.25, 0.5, 0.75, 1.0], [1.0, 2.0, 3.0, 4.0], [0.5, 1.0, 1.5, 2.0])
+	"""
+	steps = max(int(math.ceil(max(abs(x1 - x0), abs(y1 - y0)))), 1)
+	fractions = numpy.arange(1, steps + 1) / float(steps)
+	return fractions, x0 + fractions * (x1 - x0), y0 + fractions * (y1 - y0)
+
+
+def sweepRect(xs, ys, width, height, rect):
+	"""Returns the index of the first of the positions from sweepPositions() at which a width x height rect overlaps
+	the (left, top, width, height) rect, or None
+
+	>>> fractions, xs, ys = sweepPositions(0, 0, 20, 0)
+	>>> sweepRect(xs, ys, 2, 2, (10, 1, 1, 1))
+	8
+	"""
+	left, top, rectWidth, rectHeight = rect
+	lefts = xs.astype(int)
+	tops = ys.astype(int)
+	hits = (lefts < left + rectWidth) & (left < lefts + width) & (tops < top + rectHeight) & (top < tops + height)
+	if not hits.any():
+		return None
+	return int(hits.argmax())
+
+
+class SkylineMask(object):
+	"""Occupancy grid of the city, indexed [y, x] with True wherever there is still building left.
+
+	>>> mask = SkylineMask(20, 10)
+	>>> mask.fillRect(5, 5, 10, 10)
+	>>> mask.isSolid(5, 5), mask.isSolid(4, 5), mask.collideRect(0, 0, 6, 6)
+	(True, False, True)
+	>>> mask.carveCircle(10, 9, 3)
+	>>> mask.isSolid(10, 9), mask.isSolid(5, 9)
+	(False, True)
+	>>> fractions, xs, ys = sweepPositions(0, 0, 19, 0)
+	>>> mask.sweepRect(xs, ys, 3, 6), mask.sweepRect(xs, ys, 3, 5)
+	(2, None)
+	"""
+
+	def __init__(self, width, height):
+		self._solid = numpy.zeros((height, width), dtype=bool)
+		self._width = width
+		self._height = height
+
+	@property
+	def width(self):
+		return self._width
+
+	@property
+	def height(self):
+		return self._height
+
+	@property
+	def solid(self):
+		"""The underlying boolean array, don't modify it directly"""
+		return self._solid
+
+	def copy(self):
+		other = SkylineMask(self._width, self._height)
+		other._solid[:] = self._solid
+		return other
+
+	def _clip(self, left, top, width, height):
+		"""Returns the slices of the grid covered by the rect, or None if it is entirely off the grid"""
+		right = min(left + width, self._width)
+		bottom = min(top + height, self._height)
+		left = max(left, 0)
+		top = max(top, 0)
+		if right <= left or bottom <= top:
+			return None
+		return slice(top, bottom), slice(left, right)
+
+	def fillRect(self, left, top, width, height, solid=True):
+		area = self._clip(left, top, width, height)
+		if area is not None:
+			self._solid[area] = solid
+
+	def stamp(self, stampMask, left, top, solid=False):
+		"""Sets everywhere stampMask (a boolean (height, width) array) is True to solid, with the mask's top left
+		corner at left, top. Only the mask's bounding box is touched."""
+		height, width = stampMask.shape
+		area = self._clip(left, top, width, height)
+		if area is None:
+			return
+		rows, cols = area
+		stampArea = slice(rows.start - top, rows.stop - top), slice(cols.start - left, cols.stop - left)
+		self._solid[area][stampMask[stampArea]] = solid
+
+	def carveCircle(self, x, y, radius):
+		"""Clears everything within radius of x, y, see circleMask()"""
+		self.stamp(circleMask(radius), x - radius, y - radius)
+
+	def isSolid(self, x, y):
+		x, y = int(x), int(y)
+		if 0 <= x < self._width and 0 <= y < self._height:
+			return bool(self._solid[y, x])
+		return False
+
+	def collideRect(self, left, top, width, height):
+		"""Whether any part of the rect overlaps a building"""
+		area = self._clip(left, top, width, height)
+		if area is None:
+			return False
+		return bool(self._solid[area].any())
+
+	def sweepRect(self, xs, ys, width, height):
+		"""Returns the index of the first of the positions from sweepPositions() at which a width x height rect
+		overlaps a building, or None. Only the area the rect sweeps over is looked at."""
+		lefts = xs.astype(int)
+		tops = ys.astype(int)
+		left = int(lefts.min())
+		top = int(tops.min())
+		area = self._clip(left, top, int(lefts.max()) - left + width, int(tops.max()) - top + height)
+		if area is None:
+			return None
+		rows, cols = area
+		solid = self._solid[area]
+		if not solid.any():
+			return None
+
+		# A summed area table of the swept region lets every position be checked at once
+		table = numpy.zeros((solid.shape[0] + 1, solid.shape[1] + 1), dtype=int)
+		table[1:, 1:] = solid.cumsum(axis=0).cumsum(axis=1)
+		l = numpy.clip(lefts - cols.start, 0, solid.shape[1])
+		r = numpy.clip(lefts + width - cols.start, 0, solid.shape[1])
+		t = numpy.clip(tops - rows.start, 0, solid.shape[0])
+		b = numpy.clip(tops + height - rows.start, 0, solid.shape[0])
+		counts = table[b, r] - table[t, r] - table[b, l] + table[t, l]
+		hits = 0 < counts
+		if not hits.any():
+			return None
+		return int(hits.argmax())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""Helpers for getting drawing onto the screen cheaply.
+
+Pushing the whole 800x480 display every frame when only the 9x9 banana moved is what makes animations stutter on
+slow devices, so drawing code reports the areas it touched to a DirtyRects and only those get flipped. Likewise,
+rasterizing the same strings with the font every frame is wasted work, so TextCache holds on to rendered text.
+"""
+
+from __future__ import with_statement
+
+import logging
+
+import pygame
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class DirtyRects(object):
+	"""Collects the areas of the display that changed since the last flip().
+
+	>>> dirty = DirtyRects((100, 100))
+	>>> dirty.add((90, 90, 20, 20))
+	<rect(90, 90, 10, 10)>
+	>>> dirty.add((0, 0, 10, 10)), dirty.add((5, 5, 10, 10)), dirty.add((200, 0, 5, 5))
+	(<rect(0, 0, 10, 10)>, <rect(5, 5, 10, 10)>, <rect(0, 0, 0, 0)>)
+	>>> dirty.rects()
+	[<rect(90, 90, 10, 10)>, <rect(0, 0, 15, 15)>]
+	"""
+
+	def __init__(self, size):
+		self._bounds = pygame.Rect((0, 0), size)
+		self._rects = []
+		self._everything = False
+
+	def add(self, rect):
+		"""Marks rect (anything pygame.Rect takes) as changed and returns the part of it that is on the display"""
+		rect = self._bounds.clip(pygame.Rect(rect))
+		if rect.width and rect.height:
+			self._rects.append(rect)
+		return rect
+
+	def addAll(self, rects):
+		for rect in rects:
+			self.add(rect)
+
+	def addScreen(self):
+		"""Marks the whole display as changed, for when everything is redrawn anyway"""
+		self._everything = True
+
+	def rects(self):
+		"""The changed areas, with any that overlap merged together"""
+		if self._everything:
+			return [self._bounds.copy()]
+		merged = []
+		for rect in self._rects:
+			overlapping = rect.collidelistall(merged)
+			while overlapping:
+				for i in reversed(overlapping):
+					rect.union_ip(merged.pop(i))
+				overlapping = rect.collidelistall(merged)
+			merged.append(rect)
+		return merged
+
+	def clear(self):
+		self._rects = []
+		self._everything = False
+
+	def flip(self):
+		"""Pushes the changed areas to the display"""
+		if self._everything:
+			pygame.display.update()
+		elif self._rects:
+			pygame.display.update(self.rects())
+		self.clear()
+
+
+class TextCache(object):
+	"""Least recently used cache of text rendered with a font, keyed by (text, fgcol, bgcol).
+
+	The surfaces handed out are shared, so blit them but don't draw on them.
+
+	>>> class Font(object):
+	... 	def render(self, text, antialias, fgcol, bgcol):
+	... 		return text.upper()
+	>>> cache = TextCache(Font(), maxSize=2)
+	>>> cache.render('a', (0, 0, 0), None), cache.render('b', (0, 0, 0), None), cache.render('a', (0, 0, 0), None)
+	('A', 'B', 'A')
+	>>> cache.render('c', (0, 0, 0), None)
+	'C'
+	>>> ('b', (0, 0, 0), None) in cache, len(cache)
+	(False, 2)
+	>>> cache.hits, cache.misses, cache.evictions
+	(1, 3, 1)
+	"""
+
+	def __init__(self, font, maxSize=128, antialias=True):
+		self._font = font
+		self._maxSize = maxSize
+		self._antialias = antialias
+		self._surfaces = {}
+		self._lastUsed = {}
+		self._uses = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self._surfaces)
+
+	def __contains__(self, key):
+		return key in self._surfaces
+
+	def render(self, text, fgcol, bgcol=None):
+		key = (text, fgcol, bgcol)
+		self._uses += 1
+		try:
+			surface = self._surfaces[key]
+		except KeyError:
+			self.misses += 1
+			if self._maxSize <= len(self._surfaces):
+				self._evict()
+			surface = self._font.render(text, self._antialias, fgcol, bgcol)
+			self._surfaces[key] = surface
+		else:
+			self.hits += 1
+		self._lastUsed[key] = self._uses
+		return surface
+
+	def size(self, text):
+		"""The (width, height) text comes out as, without rendering it"""
+		return self._font.size(text)
+
+	def clear(self):
+		self._surfaces.clear()
+		self._lastUsed.clear()
+
+	def _evict(self):
+		oldest = min(self._lastUsed.iterkeys(), key=self._lastUsed.__getitem__)
+		del self._surfaces[oldest]
+		del self._lastUsed[oldest]
+		self.evictions += 1
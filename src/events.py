@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""Waiting for input without spinning.
+
+Prompts used to go around pygame.event.get() as fast as they could (or at 30 frames a second), which kept a whole
+core busy while nobody was touching the keyboard and ran the handheld's battery down. waitForEvents() sleeps in
+pygame.event.wait() until something happens or a timeout, set up with pygame.time.set_timer() so it works the same
+on pygame versions whose wait() takes no timeout, runs out.
+"""
+
+from __future__ import with_statement
+
+import time
+import logging
+
+import pygame
+import pygame.locals
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+TIMEOUT_EVENT = pygame.locals.USEREVENT
+"""Posted by the timer that wakes up waitForEvents(), never returned by it."""
+
+
+def waitForEvents(timeout=None):
+	"""Sleeps until there is an event and returns it in a list, or returns an empty list once timeout seconds went by
+	without any. With no timeout this waits for as long as it takes.
+
+	Only one event comes back at a time, even if more are waiting, so a prompt that is done after an Enter key
+	leaves whatever was typed after it for the next prompt instead of throwing it away."""
+	if timeout is not None:
+		if timeout <= 0:
+			return _withoutTimeouts([pygame.event.poll()])
+		pygame.time.set_timer(TIMEOUT_EVENT, max(int(timeout * 1000), 1))
+	try:
+		events = [pygame.event.wait()]
+	finally:
+		if timeout is not None:
+			pygame.time.set_timer(TIMEOUT_EVENT, 0)
+	return _withoutTimeouts(events)
+
+
+def _withoutTimeouts(events):
+	return [event for event in events if event.type not in (TIMEOUT_EVENT, pygame.locals.NOEVENT)]
+
+
+class Blinker(object):
+	"""Keeps track of something that switches on and off every period seconds, like a text cursor, so the waiting
+	can be done in waitForEvents() between switches.
+
+	>>> blinker = Blinker(1.0, now=100.0)
+	>>> blinker.isOn, blinker.timeout(now=100.25)
+	(True, 0.75)
+	>>> blinker.update(now=101.5), blinker.isOn, blinker.timeout(now=101.5)
+	(True, False, 0.5)
+	>>> blinker.update(now=101.75)
+	False
+
+	After a stall it switches once and then carries on at the same pace, rather than catching up.
+
+	>>> blinker.update(now=105.2), blinker.timeout(now=105.2), blinker.update(now=105.3)
+	(True, 1.0, False)
+	"""
+
+	def __init__(self, period, now=None):
+		if now is None:
+			now = time.time()
+		self._period = period
+		self._nextSwitch = now + period
+		self.isOn = True
+
+	def timeout(self, now=None):
+		"""How long until the next switch"""
+		if now is None:
+			now = time.time()
+		return max(self._nextSwitch - now, 0)
+
+	def update(self, now=None):
+		"""Switches if it is time to and returns whether it did"""
+		if now is None:
+			now = time.time()
+		if now < self._nextSwitch:
+			return False
+		self.isOn = not self.isOn
+		self._nextSwitch += self._period
+		if self._nextSwitch <= now:
+			self._nextSwitch = now + self._period
+		return True
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""Explosions drawn from sprites made ahead of time.
+
+An explosion used to be drawn as a circle per frame, twice over, on the screen and again on the skyline surface,
+with the shrinking frames first clearing the whole explosion with another pair of circles. The frames of an
+explosion only depend on its size, so an ExplosionSprites makes each size's frames once, as color keyed surfaces
+the size of the explosion, and an explosion is then a blit per frame onto the screen alone. The skyline only needs
+the crater that is left at the end, which gets blown out of it once with stampCrater().
+
+Everything is drawn with collision.circleMask() rather than pygame.draw.circle(), whose circles are a slightly
+different shape, so that the crater on the screen is exactly the one carved out of the city's collision mask.
+"""
+
+from __future__ import with_statement
+
+import logging
+
+import pygame
+import pygame.surfarray
+
+import collision
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+COLOR_KEY = (255, 0, 255)
+"""Stands in for the transparent parts of the sprites, so must not be a color an explosion is drawn in."""
+
+
+def explosionRadii(size):
+	"""The radius of the fire in each frame of an explosion of size, as it grows and then shrinks back down
+
+	>>> explosionRadii(4)
+	[1, 2, 3, 4, 3, 2]
+	"""
+	return range(1, size) + range(size, 1, -1)
+
+
+def maskSurface(size, circles):
+	"""A color keyed surface 2 * size + 1 pixels across, with each (color, radius) of circles drawn in its middle,
+	in order"""
+	surface = pygame.Surface((2 * size + 1, 2 * size + 1), 0, 32)
+	pixels = pygame.surfarray.pixels2d(surface)
+	try:
+		pixels[:] = surface.map_rgb(COLOR_KEY)
+		for color, radius in circles:
+			area = slice(size - radius, size + radius + 1)
+			pixels[area, area][collision.circleMask(radius).T] = surface.map_rgb(color)
+	finally:
+		del pixels
+	"""surfarray is indexed by x then y, the masks by row then column, hence the transpose."""
+	if pygame.display.get_surface() is not None:
+		surface = surface.convert()
+	surface.set_colorkey(COLOR_KEY, pygame.RLEACCEL)
+	return surface
+
+
+class ExplosionSprites(object):
+	"""The frames of explosions and the craters they leave, as surfaces made the first time each size is asked for.
+
+	Each surface is 2 * size + 1 pixels across, with the explosion in the middle, so is blitted at (x - size,
+	y - size). While growing, the fire is drawn over whatever is there. While shrinking, what it burned away
+	is already sky, so those frames are the whole crater in sky with the fire on top.
+
+	>>> explosions = ExplosionSprites((255, 0, 0), (0, 0, 173))
+	>>> frames = explosions.frames(4)
+	>>> len(frames), frames[0].get_size()
+	(6, (9, 9))
+	>>> [tuple(frames[i].get_at((4, 1)))[:3] for i in (0, 2, 3, 5)]
+	[(255, 0, 255), (255, 0, 0), (255, 0, 0), (0, 0, 173)]
+	>>> explosions.frames(4) is frames
+	True
+	>>> screen = pygame.Surface((20, 20))
+	>>> explosions.stampCrater([screen], 0, 10, 4)
+	[<rect(0, 6, 5, 9)>]
+	>>> tuple(screen.get_at((4, 10)))[:3], tuple(screen.get_at((5, 10)))[:3]
+	((0, 0, 173), (0, 0, 0))
+	"""
+
+	def __init__(self, explosionColor, skyColor):
+		self._explosionColor = explosionColor
+		self._skyColor = skyColor
+		self._frames = {}
+		self._craters = {}
+
+	def frames(self, size):
+		try:
+			return self._frames[size]
+		except KeyError:
+			pass
+		frames = []
+		for i, radius in enumerate(explosionRadii(size)):
+			circles = [(self._explosionColor, radius)]
+			if size - 1 <= i:
+				circles.insert(0, (self._skyColor, size))
+			frames.append(maskSurface(size, circles))
+		self._frames[size] = frames
+		return frames
+
+	def crater(self, radius):
+		"""The hole in the sky an explosion of radius leaves"""
+		if radius not in self._craters:
+			self._craters[radius] = maskSurface(radius, [(self._skyColor, radius)])
+		return self._craters[radius]
+
+	def stampCrater(self, surfaces, x, y, radius):
+		"""Blows the crater of radius around x, y out of each of surfaces, returning the area changed on each"""
+		crater = self.crater(radius)
+		return [surface.blit(crater, (x - radius, y - radius)) for surface in surfaces]
+
+	def preload(self, *sizes):
+		for size in sizes:
+			self.frames(size)
+			self.crater(size)
@@ -20,28 +20,47 @@ The Pygame documentation is pretty good, and can be found at http://www.pygame.o
 Unfortunately there is no sound with this game.
 """
 
+from __future__ import with_statement
+
 import os
 import sys
 import time
-import random
-import math
+_importStart = time.time()
+import functools
+import optparse
 import logging
 import logging.handlers
 
+import numpy
 import pygame
 import pygame.locals
 
 import constants
 import images
-from util import pygame_utils
+import instrument
+import display
+import events
+import explosions
+import match
+import network
+import replay
+import resources
+import simulation
+import sprites
+import states
+import textinput
+import worldgen
+from util import concurrent
 
 
 _moduleLogger = logging.getLogger(__name__)
 
-SCR_WIDTH = 800
-SCR_HEIGHT = 480
+SCR_WIDTH = simulation.SCR_WIDTH
+SCR_HEIGHT = simulation.SCR_HEIGHT
 FPS = 30
-GAME_CLOCK = pygame.time.Clock()
+DIRTY_RECTS = display.DirtyRects((SCR_WIDTH, SCR_HEIGHT))
+"""Anything drawn to the screen gets added to DIRTY_RECTS, and DIRTY_RECTS.flip() then only updates those parts of the
+screen instead of all of it, like pygame.display.update() with no arguments does."""
 
 BUILDING_COLORS = ((173, 170, 173), (0, 170, 173), (173, 0, 0))
 LIGHT_WINDOW = (255, 255, 82)
@@ -56,20 +75,18 @@ BLACK_COLOR = (0, 0, 0)
 WHITE_COLOR = (255, 255, 255)
 GRAY_COLOR = (173, 170, 173)
 
-BUILD_EXPLOSION_SIZE = int(SCR_HEIGHT / 50)
-GOR_EXPLOSION_SIZE = 30
+BUILD_EXPLOSION_SIZE = simulation.BUILD_EXPLOSION_SIZE
+GOR_EXPLOSION_SIZE = simulation.GOR_EXPLOSION_SIZE
 
-SUN_X = SCR_WIDTH / 2
-SUN_Y = SCR_HEIGHT / 20
+SUN_X = simulation.SUN_X
+SUN_Y = simulation.SUN_Y
 
-pygame.init()
-GAME_FONT = pygame.font.SysFont(None, 20)
 
 # orientation of the banana:
-RIGHT = 0
-UP = 1
-LEFT = 2
-DOWN = 3
+RIGHT = simulation.RIGHT
+UP = simulation.UP
+LEFT = simulation.LEFT
+DOWN = simulation.DOWN
 
 # gorilla arms drawing types
 BOTH_ARMS_DOWN = 0
@@ -84,20 +101,92 @@ def terminate():
     sys.exit()
 
 
-GOR_DOWN_SURF = pygame_utils.makeSurfaceFromASCII(images.GOR_DOWN_ASCII, GOR_COLOR, SKY_COLOR)
-GOR_LEFT_SURF = pygame_utils.makeSurfaceFromASCII(images.GOR_LEFT_ASCII, GOR_COLOR, SKY_COLOR)
-GOR_RIGHT_SURF = pygame_utils.makeSurfaceFromASCII(images.GOR_RIGHT_ASCII, GOR_COLOR, SKY_COLOR)
-BAN_RIGHT_SURF = pygame_utils.makeSurfaceFromASCII(images.BAN_RIGHT_ASCII, BAN_COLOR, SKY_COLOR)
-BAN_LEFT_SURF = pygame_utils.makeSurfaceFromASCII(images.BAN_LEFT_ASCII, BAN_COLOR, SKY_COLOR)
-BAN_UP_SURF = pygame_utils.makeSurfaceFromASCII(images.BAN_UP_ASCII, BAN_COLOR, SKY_COLOR)
-BAN_DOWN_SURF = pygame_utils.makeSurfaceFromASCII(images.BAN_DOWN_ASCII, BAN_COLOR, SKY_COLOR)
-SUN_NORMAL_SURF = pygame_utils.makeSurfaceFromASCII(images.SUN_NORMAL_ASCII, SUN_COLOR, SKY_COLOR)
-SUN_SHOCKED_SURF = pygame_utils.makeSurfaceFromASCII(images.SUN_SHOCKED_ASCII, SUN_COLOR, SKY_COLOR)
-STAR_SURF = pygame_utils.makeSurfaceFromASCII(images.STAR_ASCII, DARK_RED_COLOR, BLACK_COLOR)
+def checkForQuit():
+    """Terminates the program if the window was closed or Esc or Ctrl+Q is being held down. Any other key presses are
+    left in the queue for whoever is waiting on them."""
+    pygame.event.pump()
+    if pygame.event.peek(pygame.locals.QUIT):
+        terminate()
+    pressed = pygame.key.get_pressed()
+    if pressed[pygame.locals.K_ESCAPE]:
+        terminate()
+    elif pressed[pygame.locals.K_q] and pygame.key.get_mods() & pygame.locals.KMOD_CTRL:
+        terminate()
+
+
+def checkEventForQuit(event):
+    """Terminates the program if the event is the window being closed or Esc or Ctrl+Q being pressed. MACHINE calls
+    this on every event before the screen that is up gets it."""
+    if event.type == pygame.locals.QUIT:
+        terminate()
+    elif event.type == pygame.locals.KEYDOWN:
+        if event.key == pygame.locals.K_ESCAPE:
+            terminate()
+        elif event.key == pygame.locals.K_q and event.mod & pygame.locals.KMOD_CTRL:
+            terminate()
+
+
+MACHINE = states.StateMachine(DIRTY_RECTS, checkEventForQuit, checkForQuit, FPS)
+"""Every screen of the game is a states.State, and MACHINE is the one loop that runs them. It sleeps until there is
+something to do, tells the screens how much time went by so animations keep the same pace on slow hardware, and
+stops altogether while the window is hidden."""
+
+
+STARTUP = resources.STARTUP
+RESOURCES = resources.LazyRegistry(STARTUP)
+"""Starting pygame, loading the font and building the sprites are only done the first time something uses them, so
+that importing this module (to get at simulation or drawing functions, say) stays cheap. How long each of them took
+ends up on STARTUP, which gets logged once the game is up."""
+
 
-assert GOR_DOWN_SURF.get_size() == GOR_LEFT_SURF.get_size() == GOR_RIGHT_SURF.get_size()
+def _initPygame():
+    pygame.init()
+    return pygame
 
-sunRect = pygame.Rect(SUN_X, SUN_Y, SUN_NORMAL_SURF.get_width(), SUN_NORMAL_SURF.get_height())
+
+def _loadFont():
+    RESOURCES.pygame
+    return pygame.font.SysFont(None, 20)
+
+
+def _loadSprites():
+    atlas = sprites.loadAtlas([
+        ('GOR_DOWN', images.GOR_DOWN_ASCII, GOR_COLOR, SKY_COLOR),
+        ('GOR_LEFT', images.GOR_LEFT_ASCII, GOR_COLOR, SKY_COLOR),
+        ('GOR_RIGHT', images.GOR_RIGHT_ASCII, GOR_COLOR, SKY_COLOR),
+        ('BAN_RIGHT', images.BAN_RIGHT_ASCII, BAN_COLOR, SKY_COLOR),
+        ('BAN_LEFT', images.BAN_LEFT_ASCII, BAN_COLOR, SKY_COLOR),
+        ('BAN_UP', images.BAN_UP_ASCII, BAN_COLOR, SKY_COLOR),
+        ('BAN_DOWN', images.BAN_DOWN_ASCII, BAN_COLOR, SKY_COLOR),
+        ('SUN_NORMAL', images.SUN_NORMAL_ASCII, SUN_COLOR, SKY_COLOR),
+        ('SUN_SHOCKED', images.SUN_SHOCKED_ASCII, SUN_COLOR, SKY_COLOR),
+        ('STAR', images.STAR_ASCII, DARK_RED_COLOR, BLACK_COLOR),
+    ])
+    """All the sprites are rasterized into the one atlas surface, which is cached on disk between runs."""
+    assert atlas['GOR_DOWN'].get_size() == atlas['GOR_LEFT'].get_size() == atlas['GOR_RIGHT'].get_size()
+    return atlas
+
+
+RESOURCES.register('pygame', _initPygame)
+RESOURCES.register('font', _loadFont)
+RESOURCES.register('textCache', lambda: display.TextCache(RESOURCES.font))
+"""drawText() gets its text from RESOURCES.textCache so that strings that are drawn every frame are only rendered
+once."""
+RESOURCES.register('sprites', _loadSprites)
+
+
+def _loadExplosions():
+    RESOURCES.pygame
+    explosionSprites = explosions.ExplosionSprites(EXPLOSION_COLOR, SKY_COLOR)
+    for outcome in (simulation.BUILDING, simulation.GORILLA1):
+        explosionSprites.preload(*[
+            radius for x, y, radius in simulation.craters(simulation.ShotResult(outcome, [], None, (0, 0)))
+        ])
+    """Every size of explosion a throw can set off is made up front, rather than in the middle of the first one."""
+    return explosionSprites
+
+
+RESOURCES.register('explosions', _loadExplosions)
 
 
 def drawText(text, surfObj, x, y, fgcol, bgcol, pos='left'):
@@ -107,7 +196,8 @@ def drawText(text, surfObj, x, y, fgcol, bgcol, pos='left'):
     If the pos parameter is "left", then the x,y parameter specifies the top left corner of the text rectangle.
     If the pos parameter is "center", then the x,y parameter specifies the middle top point of the text rectangle."""
 
-    textobj = GAME_FONT.render(text, 1, fgcol, bgcol) # creates the text in memory (it's not on a surface yet).
+    with MACHINE.profiler.section('text'):
+        textobj = RESOURCES.textCache.render(text, fgcol, bgcol) # creates the text in memory (it's not on a surface yet).
 
     textrect = textobj.get_rect()
     if pos == 'left':
@@ -125,185 +215,80 @@ def drawText(text, surfObj, x, y, fgcol, bgcol, pos='left'):
     return textrect
 
 
-def inputMode(prompt, screenSurf, x, y, fgcol, bgcol, maxlen=12, allowed=None, pos='left', cursor='_', cursorBlink=False):
-    """Takes control of the program when called. This function displays a prompt on the screen (the "prompt" string)
-    parameter) on the screenSurf surface at the x, y coordinates. The text is in the fgcol color with a bgcol color
-    background. You can optionally specify maxlen for a maximum length of the user's response. "allowed" is a string
-    of allowed characters (if the player can only type numbers, say) and ignores all other keystrokes. The "pos"
-    parameter can either be the string "left" (where the x, y coordinates refer to the top left corner of the text
-    box) or "center" (where the x, y coordinates refer to the top center of the text box).
-
-    "cursor" is an optional character that is used for a cursor to show where the next letter will go. If "cursorBlink"
-    is True, then this cursor character will blink on and off.
-
-    The returned value is a string of what the player typed in, or None if the player pressed the Esc key.
-
-    Note that the player can only press Backspace to delete characters, they cannot use the arrow keys to move the
-    cursor."""
-    inputText = ''
-    """inputText will store the text of what the player has typed in so far."""
-    done = False
-    cursorTimestamp = time.time()
-    cursorShow = cursor
-    while not done:
-        """We will keep looping until the player has pressed the Esc or Enter key."""
-
-        textrect = drawText(prompt + cursorShow, screenSurf, x, y, fgcol, bgcol, pos)
-        drawText(prompt + inputText + cursorShow, screenSurf, textrect.left, textrect.top, fgcol, bgcol, 'left')
-        pygame.display.update()
-        GAME_CLOCK.tick(FPS)
-
-        if cursor and cursorBlink and time.time() - 1.0 > cursorTimestamp:
-            if cursorShow == cursor:
-                cursorShow = '   '
-            else:
-                cursorShow = cursor
-            cursorTimestamp = time.time()
-
-        for event in pygame.event.get():
-            if event.type == pygame.locals.QUIT:
-                terminate()
-            elif event.type == pygame.locals.MOUSEBUTTONDOWN: # Use Screen Tap as Enter Key
-                done = True
-                if cursorShow:
-                    cursorShow = '   '
-            elif event.type == pygame.locals.KEYDOWN:
-                if event.key == pygame.locals.K_ESCAPE:
-                    terminate()
-                elif event.key == pygame.locals.K_q and event.mod & pygame.locals.KMOD_CTRL:
-                    terminate()
-                elif event.scancode == 36: # Enter key pressed
-                    done = True
-                    if cursorShow:
-                        cursorShow = '   '
-                elif event.key == pygame.locals.K_BACKSPACE:
-                    if len(inputText):
-                        drawText(prompt + inputText + cursorShow, screenSurf, textrect.left, textrect.top, bgcol, bgcol, 'left')
-                        inputText = inputText[:-1]
-                else:
-                    if len(inputText) >= maxlen or (allowed is not None and event.unicode not in allowed):
-                        continue
-                    if event.key >= 32 and event.key < 128 and event.unicode not in ('0123456789'):
-                        inputText += pygame_utils.toProperCase(chr(event.key), event.mod)
-                    elif event.unicode in ('0123456789'):
-                        inputText += pygame_utils.toProperCase(event.unicode, event.mod)
-    return inputText
-
-
-_NUMBER_MAPPINGS = {
-    pygame.locals.K_PERIOD: ".",
-    pygame.locals.K_KP_PERIOD: ".",
-    pygame.locals.K_q: "1",
-    pygame.locals.K_w: "2",
-    pygame.locals.K_e: "3",
-    pygame.locals.K_r: "4",
-    pygame.locals.K_t: "5",
-    pygame.locals.K_y: "6",
-    pygame.locals.K_u: "7",
-    pygame.locals.K_i: "8",
-    pygame.locals.K_o: "9",
-    pygame.locals.K_p: "0",
-}
-
-
-def inputModeNum(prompt, screenSurf, x, y, fgcol, bgcol, maxlen=12, pos='left', cursor='_', cursorBlink=False):
-    """Takes control of the program when called. This function displays a prompt on the screen (the "prompt" string)
-    parameter) on the screenSurf surface at the x, y coordinates. The text is in the fgcol color with a bgcol color
-    background. You can optionally specify maxlen for a maximum length of the user's response. "allowed" is a string
-    of allowed characters (if the player can only type numbers, say) and ignores all other keystrokes. The "pos"
-    parameter can either be the string "left" (where the x, y coordinates refer to the top left corner of the text
-    box) or "center" (where the x, y coordinates refer to the top center of the text box).
-
-    "cursor" is an optional character that is used for a cursor to show where the next letter will go. If "cursorBlink"
-    is True, then this cursor character will blink on and off.
-
-    The returned value is a string of what the player typed in, or None if the player pressed the Esc key.
-
-    Note that the player can only press Backspace to delete characters, they cannot use the arrow keys to move the
-    cursor."""
-    inputText = ''
-    """inputText will store the text of what the player has typed in so far."""
-    done = False
-    cursorTimestamp = time.time()
-    cursorShow = cursor
-    while not done:
-        """We will keep looping until the player has pressed the Esc or Enter key."""
-
-        textrect = drawText(prompt + cursorShow, screenSurf, x, y, fgcol, bgcol, pos)
-        drawText(prompt + inputText + cursorShow, screenSurf, textrect.left, textrect.top, fgcol, bgcol, 'left')
-        pygame.display.update()
-        GAME_CLOCK.tick(FPS)
-
-        if cursor and cursorBlink and time.time() - 1.0 > cursorTimestamp:
-            if cursorShow == cursor:
-                cursorShow = '   '
-            else:
-                cursorShow = cursor
-            cursorTimestamp = time.time()
-
-        for event in pygame.event.get():
-            if event.type == pygame.locals.QUIT:
-                terminate()
-            elif event.type == pygame.locals.MOUSEBUTTONDOWN: # Use Screen Tap as Enter Key
-                done = True
-                if cursorShow:
-                    cursorShow = '   '
-            elif event.type == pygame.locals.KEYDOWN:
-                if event.key == pygame.locals.K_ESCAPE:
-                    terminate()
-                elif event.key == pygame.locals.K_q and event.mod & pygame.locals.KMOD_CTRL:
-                    terminate()
-                elif event.scancode == 36 or event.key in (pygame.locals.K_RETURN, pygame.locals.K_KP_ENTER):
-                    done = True
-                    if cursorShow:
-                        cursorShow = '   '
-                elif event.key == pygame.locals.K_BACKSPACE:
-                    if len(inputText):
-                        drawText(prompt + inputText + cursorShow, screenSurf, textrect.left, textrect.top, bgcol, bgcol, 'left')
-                        inputText = inputText[:-1]
-                else:
-                    if len(inputText) >= maxlen:
-                        continue
-                    if event.unicode in ('0123456789'):
-                        inputText += pygame_utils.toProperCase(event.unicode, event.mod)
-                    else:
-                        translatedChar = _NUMBER_MAPPINGS.get(event.key, None)
-                        if translatedChar is not None:
-                            inputText += pygame_utils.toProperCase(translatedChar, event.mod)
-    if inputText.startswith("."):
-        inputText = "0" + inputText
-    return inputText
-
-
-def nextBananaOrientation(orient):
-    return {
-        RIGHT: UP,
-        UP: LEFT,
-        LEFT: DOWN,
-        DOWN: RIGHT,
-    }[orient]
+class PromptScreen(states.State):
+    """A screen that asks the player things with textinput.TextInputs, one after the other. Subclasses call ask() to
+    put up a TextInput, and once the player is done with it answered() gets called with it, returning whatever
+    update() should. Everything asked stays on the screen."""
+
+    def __init__(self, screenSurf, then=None):
+        states.State.__init__(self, then)
+        self._screenSurf = screenSurf
+        self._inputs = []
+        self._asked = None
+
+    def ask(self, prompt, x, y, fgcol, bgcol, **kwds):
+        """Puts up a prompt for the player to type into, taking the same arguments as textinput.TextInput"""
+        self._asked = (prompt, x, y, fgcol, bgcol), kwds
+        self._inputs.append(textinput.TextInput(prompt, x, y, fgcol, bgcol, RESOURCES.textCache, **kwds))
+
+    def askAgain(self):
+        """Puts the last prompt back up, as if nothing had been typed into it"""
+        self._inputs.pop()
+        args, kwds = self._asked
+        self.ask(*args, **kwds)
+
+    def answered(self, textInput):
+        raise NotImplementedError()
+
+    def handle(self, event):
+        self._inputs[-1].handle(event)
+
+    def update(self, elapsed):
+        asking = self._inputs[-1]
+        asking.update()
+        if asking.done:
+            DIRTY_RECTS.addAll(asking.draw(self._screenSurf))
+            """Drawn one last time, without its cursor, before whatever comes next."""
+            return self.answered(asking)
+        return None
+
+    def render(self):
+        for textInput in self._inputs:
+            DIRTY_RECTS.addAll(textInput.draw(self._screenSurf))
+
+    def timeout(self):
+        return self._inputs[-1].timeout()
+
+
+def numberFromText(text):
+    """What the player typed into a number prompt, as a float. Typing in just "." means 0."""
+    if text.startswith("."):
+        text = "0" + text
+    return float(text)
 
 
 def drawBanana(screenSurf, orient, x, y):
     """Draws the banana shape to the screenSurf surface with its top left corner at the x y coordinate provided.
-    "orient" is one of the RIGHT, UP, LEFT, or DOWN values (which are the integers 0 to 3 respectively)"""
+    "orient" is one of the RIGHT, UP, LEFT, or DOWN values (which are the integers 0 to 3 respectively). The area
+    drawn on is returned."""
     if orient == DOWN:
-        screenSurf.blit(BAN_DOWN_SURF, (x, y))
+        return screenSurf.blit(RESOURCES.sprites['BAN_DOWN'], (x, y))
     elif orient == UP:
-        screenSurf.blit(BAN_UP_SURF, (x, y))
+        return screenSurf.blit(RESOURCES.sprites['BAN_UP'], (x, y))
     elif orient == LEFT:
-        screenSurf.blit(BAN_LEFT_SURF, (x, y))
+        return screenSurf.blit(RESOURCES.sprites['BAN_LEFT'], (x, y))
     elif orient == RIGHT:
-        screenSurf.blit(BAN_RIGHT_SURF, (x, y))
+        return screenSurf.blit(RESOURCES.sprites['BAN_RIGHT'], (x, y))
 
 
 def drawSun(screenSurf, shocked=False):
     """Draws the sun sprite onto the screenSurf surface. If shocked is True, then use the shocked-looking face,
-    otherwise use the normal smiley face. This function does not call python.display.update()"""
+    otherwise use the normal smiley face. This function does not call python.display.update(), it returns the area
+    drawn on so the caller can."""
     if shocked:
-        screenSurf.blit(SUN_SHOCKED_SURF, (SUN_X, SUN_Y))
+        return screenSurf.blit(RESOURCES.sprites['SUN_SHOCKED'], (SUN_X, SUN_Y))
     else:
-        screenSurf.blit(SUN_NORMAL_SURF, (SUN_X, SUN_Y))
+        return screenSurf.blit(RESOURCES.sprites['SUN_NORMAL'], (SUN_X, SUN_Y))
 
 
 def drawGorilla(screenSurf, x, y, arms=BOTH_ARMS_DOWN):
@@ -311,629 +296,785 @@ def drawGorilla(screenSurf, x, y, arms=BOTH_ARMS_DOWN):
     is for the top left corner of the gorilla sprite. Note that all three gorilla surfaces are the same size."""
 
     if arms == BOTH_ARMS_DOWN:
-        gorSurf = GOR_DOWN_SURF
+        gorSurf = RESOURCES.sprites['GOR_DOWN']
     elif arms == LEFT_ARM_UP:
-        gorSurf = GOR_LEFT_SURF
+        gorSurf = RESOURCES.sprites['GOR_LEFT']
     elif arms == RIGHT_ARM_UP:
-        gorSurf = GOR_RIGHT_SURF
+        gorSurf = RESOURCES.sprites['GOR_RIGHT']
     """Above we choose which surface object we will use to draw the gorilla, depending on the "arms" parameter.
     The call to screenSurf.blit() will draw the surface onto the screen (but it won't show up on the screen until
     pygame.display.update() is called."""
 
-    screenSurf.blit(gorSurf, (x, y))
+    return screenSurf.blit(gorSurf, (x, y))
 
 
-def makeCityScape():
-    """This function creates and returns a new cityscape of various buildings on a pygame.Surface object and returns
-    this surface object."""
+def makeCityScape(world):
+    """This function draws the cityscape of a worldgen.World on a new pygame.Surface object and returns this surface
+    object. Where the buildings go was already decided by worldgen.generateWorld(), this only draws them. What bananas
+    are checked against is the mask of the worldgen.CityState for the world, not this surface."""
 
-    screenSurf = pygame.Surface((SCR_WIDTH, SCR_HEIGHT)) # first make the new surface the same size of the screen.
+    screenSurf = pygame.Surface((SCR_WIDTH, SCR_HEIGHT), 0, 32) # first make the new surface the same size of the screen.
+    """32 bits a pixel whatever the display is, as surfarray.pixels2d() below can't do 24 bit surfaces."""
     screenSurf.fill(SKY_COLOR) # fill in the surface with the background sky color
 
-    """We will choose an upward, downward, valley "v" curve, or hilly "^" curve for the slope of the buildings.
-    Half of the time we will choose the valley slope shape, while the remaining three each have a 1/6 chance of
-    being choosen. The slope also determines the height of the first building, which is stored in newHeight."""
-    slopeIndex = random.randint(1, 6)
-    if slopeIndex == 1:
-        slope = 'upward'
-        newHeight = 15
-    elif slopeIndex == 2:
-        slope = 'downward'
-        newHeight = 130
-    elif 3 <= slopeIndex and slopeIndex <= 5:
-        slope = 'v'
-        newHeight = 15
-    else:
-        slope = '^'
-        newHeight = 130
-
-    bottomLine = SCR_HEIGHT - 25 # the bottom line of the buildings. We want some space for the wind arrow to go
-    heightInc = 10 # a baseline for how much buildings grow or shrink compared to the last building
-    defBuildWidth = 37 # default building width, also judges how wide buildings can be
-    randomHeightDiff = 120 # about how much buildings grow or shrink
-    windowWidth = 4 # the width of each window in pixels
-    windowHeight = 7 # the height of each window in pixels
-    windowSpacingX = 10 # how many pixels apart each window's left edge is
-    windowSpacingY = 15 # how many pixels apart each window's top edge is
-    gHeight = 25 # (I'm not sure what this suppoes to be in the original Qbasic code, but I copied it anyway)
-    # (There also was a maxHeight variable in the original Qbasic, but I don't think it did anything so I left it out.)
-
-    buildingCoords = [] # a list of (left, top) coords of each building, left to right
-
-    x = 2 # x refers to the top left corner of the current building being drawn
-
-    while x < SCR_WIDTH - heightInc:
-        # In this loop we keep drawing new buildings until we run out of space on the screen.
-
-        # First the slope type determines if the building should grow or shrink.
-        if slope == 'upward':
-            newHeight += heightInc
-        elif slope == 'downward':
-            newHeight -= heightInc
-        elif slope == 'v':
-            if x > SCR_WIDTH / 2:
-                newHeight -= (2 * heightInc)
-                # For valley slopes, buildings shrink on the left half of the screen...
-            else:
-                newHeight += (2 * heightInc)
-                # ...and grow on the right half.
-        else:
-            if x > SCR_WIDTH / 2:
-                newHeight += (2 * heightInc)
-                # For hilley slopes, buildings grow on the left half of the screen...
-            else:
-                newHeight -= (2 * heightInc)
-                # ...and shrink on the right half.
-
-        # Get the new building's width.
-        buildWidth = defBuildWidth + random.randint(0, defBuildWidth)
-        if buildWidth + x > SCR_WIDTH:
-            buildWidth = SCR_WIDTH - x -2
-
-        # Get the new building's height
-        buildHeight = random.randint(heightInc, randomHeightDiff) + newHeight
-
-        # Check if the height is too high.
-        if bottomLine - buildHeight <= gHeight:
-            buildHeight = gHeight
-
-        # Randomly select one of the building colors.
-        buildingColor = BUILDING_COLORS[random.randint(0, len(BUILDING_COLORS)-1)]
-
+    for building in world.buildings:
         # Draw the building
-        pygame.draw.rect(screenSurf, buildingColor, (x+1, bottomLine - (buildHeight+1), buildWidth-1, buildHeight-1))
+        screenSurf.fill(BUILDING_COLORS[building.color], building.rect)
 
-        buildingCoords.append( (x, bottomLine - buildHeight) )
+    # Draw the windows
+    lefts, tops, lit = world.windows()
+    winColors = numpy.where(lit, screenSurf.map_rgb(LIGHT_WINDOW), screenSurf.map_rgb(DARK_WINDOW))
+    xs = lefts[:, numpy.newaxis, numpy.newaxis] + numpy.arange(worldgen.WINDOW_WIDTH)[:, numpy.newaxis]
+    ys = tops[:, numpy.newaxis, numpy.newaxis] + numpy.arange(worldgen.WINDOW_HEIGHT)
+    pixels = pygame.surfarray.pixels2d(screenSurf)
+    pixels[xs, ys] = winColors[:, numpy.newaxis, numpy.newaxis]
+    del pixels # the surface stays locked for as long as pixels is around
+    """There are hundreds of windows, so rather than a pygame.draw.rect() call for each, the pixels of all of them are
+    colored in at once: xs and ys hold the x and y of every pixel of every window, lined up with the window's color.
+    The buildings are filled in with Surface.fill(), which covers the same pixels as pygame.draw.rect() but faster."""
 
-        # Draw the windows
-        for winx in range(3, buildWidth - windowSpacingX + windowWidth, windowSpacingX):
-            for winy in range(3, buildHeight - windowSpacingY, windowSpacingY):
-                if random.randint(1, 4) == 1:
-                    winColor = DARK_WINDOW
-                else:
-                    winColor = LIGHT_WINDOW
-                pygame.draw.rect(screenSurf, winColor, (x + 1 + winx, (bottomLine - buildHeight) + 1 + winy, windowWidth, windowHeight))
+    if pygame.display.get_surface() is not None:
+        screenSurf = screenSurf.convert() # in the display's own format, so it is quick to blit to the screen
 
-        x += buildWidth
+    # We want to return the surface object we've drawn the buildings on.
+    return screenSurf
 
-    # We want to return both the surface object we've drawn the buildings on, and the coordinates of each building.
-    return screenSurf, buildingCoords
 
+def prepareCity(seed=None):
+    """Makes up the worldgen.CityState for a new round. This is all numbers, no pygame, so it is safe to do in
+    another thread, which is what ROUNDS does with it."""
+    return worldgen.CityState(worldgen.generateWorld(seed))
 
-def placeGorillas(buildCoords):
-    """Using the buildingCoords value returned from makeCityScape(), we want to place the gorillas on the left and right
-    side of the screen on the second or third building from the edge."""
 
-    gorPos = [] # item 0 is for (left, top) of player one, item 1 is for player two.
-    xAdj = int(GOR_DOWN_SURF.get_rect().width / 2)
-    yAdj = GOR_DOWN_SURF.get_rect().height
-
-    for i in xrange(0, 2): # place first and then second player
-
-        # place gorillas on second or third building from the edge.
-        if i == 0:
-            buildNum = random.randint(1, 2)
-        else:
-            buildNum = random.randint(len(buildCoords)-3, len(buildCoords)-2)
+def prepareRound(seed=None):
+    """Makes up a new round and draws its city, returning a worldgen.CityState for it and the surface its skyline is
+    drawn on. Replays pass in the seed of the round that was played."""
+    city = prepareCity(seed)
+    return city, makeCityScape(city.world)
 
-        buildWidth = buildCoords[buildNum + 1][0] - buildCoords[buildNum][0]
-        gorPos.append( (buildCoords[buildNum][0] + int(buildWidth / 2) - xAdj, buildCoords[buildNum][1] - yAdj - 1) )
 
-    # The format of the gorPos list is [(p1 x, p1 y), (p2 x, p2 y)]
-    return gorPos
+ROUNDS = concurrent.Prefetcher(prepareCity, maxsize=1)
+"""ROUNDS.get() hands over the CityState of the next round, which is normally ready by the time the victory dance is
+over. Only one round is ever made ahead, so there is no waste when the game ends. Its skyline is drawn once it is
+handed over, in the main thread, as pygame surfaces can't be drawn on from two threads at once."""
 
 
-def waitForPlayerToPressKey():
-    """Calling this function will pause the program until the user presses a key. The key is returned."""
-    while True:
-        key = checkForKeyPress()
-        if key:
-            return key
-
-
-def checkForKeyPress():
-    """Calling this function will check if a key has recently been pressed. If so, the key is returned.
-    If not, then False is returned. If the Esc key was pressed, then the program terminates."""
-    for event in pygame.event.get():
-        if event.type == pygame.locals.QUIT:
+def keyFromEvent(event):
+    """Returns the key that was let go of for a KEYUP event, True for a screen tap and False for anything else. If
+    the event is the window closing, Esc or Ctrl+Q, then the program terminates."""
+    if event.type == pygame.locals.QUIT:
+        terminate()
+    if event.type == pygame.locals.KEYUP:
+        if event.key == pygame.locals.K_ESCAPE: # pressing escape quits
             terminate()
-        if event.type == pygame.locals.KEYUP:
-            if event.key == pygame.locals.K_ESCAPE: # pressing escape quits
-                terminate()
-            elif event.key == pygame.locals.K_q and event.mod & pygame.locals.KMOD_CTRL:
-                terminate()
-            return event.key
-        if event.type == pygame.locals.MOUSEBUTTONDOWN:
-            return True
+        elif event.key == pygame.locals.K_q and event.mod & pygame.locals.KMOD_CTRL:
+            terminate()
+        return event.key
+    if event.type == pygame.locals.MOUSEBUTTONDOWN:
+        return True
     return False
 
 
-def showStartScreen(screenSurf):
-    """Draws the starting introductory screen to screenSurf, with red stars rotating around the border. This screen
-    remains until the user presses a key."""
-    vertAdj = 0
-    horAdj = 0
-    # Clear the event stack
-    while not checkForKeyPress():
-        screenSurf.fill(BLACK_COLOR)
-
-        drawStars(screenSurf, vertAdj, horAdj)
-        vertAdj += 1
-        if vertAdj == 4:
-            vertAdj = 0
-        horAdj += 12
-        if horAdj == 84:
-            horAdj = 0
-        """The stars on the sides of the screen move 1 pixel each iteration through this loop and reset every 4
-        pixels. The stars on the top and bottom of the screen move 12 pixels each iteration and reset every 84 pixels."""
-
-        drawText('P  y  t  h  o  n     G  O  R  I  L  L  A  S', screenSurf, SCR_WIDTH / 2, 50, WHITE_COLOR, BLACK_COLOR, pos='center')
-        drawText('Your mission is to hit your opponent with the exploding', screenSurf, SCR_WIDTH / 2, 110, GRAY_COLOR, BLACK_COLOR, pos='center')
-        drawText('banana by varying the angle and power of your throw, taking', screenSurf, SCR_WIDTH / 2, 130, GRAY_COLOR, BLACK_COLOR, pos='center')
-        drawText('into account wind speed, gravity, and the city skyline.', screenSurf, SCR_WIDTH / 2, 150, GRAY_COLOR, BLACK_COLOR, pos='center')
-        drawText('The wind speed is shown by a directional arrow at the bottom', screenSurf, SCR_WIDTH / 2, 170, GRAY_COLOR, BLACK_COLOR, pos='center')
-        drawText('of the playing field, its length relative to its strength.', screenSurf, SCR_WIDTH / 2, 190, GRAY_COLOR, BLACK_COLOR, pos='center')
-        drawText('Press any key to continue', screenSurf, SCR_WIDTH / 2, 300, GRAY_COLOR, BLACK_COLOR, pos='center')
-
-        pygame.display.update()
-        GAME_CLOCK.tick(FPS)
-
-
-def showGameOverScreen(screenSurf, p1name, p1score, p2name, p2score):
-    """Draws the game over screen to screenSurf, showing the players' names and scores. This screen has rotating
-    red stars too, and hangs around until the user presses a key."""
-    p1score = str(p1score)
-    p2score = str(p2score)
-    vertAdj = 0
-    horAdj = 0
-    while not checkForKeyPress():
-        screenSurf.fill(BLACK_COLOR)
-
-        drawStars(screenSurf, vertAdj, horAdj)
-        vertAdj += 1
-        if vertAdj == 4:
-            vertAdj = 0
-        horAdj += 12
-        if horAdj == 84:
-            horAdj = 0
-        """The stars on the sides of the screen move 1 pixel each iteration through this loop and reset every 4
-        pixels. The stars on the top and bottom of the screen move 12 pixels each iteration and reset every 84 pixels."""
-
-        drawText('GAME OVER!', screenSurf, SCR_WIDTH / 2, 120, GRAY_COLOR, BLACK_COLOR, pos='center')
-        drawText('Score:', screenSurf, SCR_WIDTH / 2, 155, GRAY_COLOR, BLACK_COLOR, pos='center')
-        drawText(p1name, screenSurf, 225, 170, GRAY_COLOR, BLACK_COLOR)
-        drawText(p1score, screenSurf, 395, 170, GRAY_COLOR, BLACK_COLOR)
-        drawText(p2name, screenSurf, 225, 185, GRAY_COLOR, BLACK_COLOR)
-        drawText(p2score, screenSurf, 395, 185, GRAY_COLOR, BLACK_COLOR)
-        drawText('Press any key to continue', screenSurf, SCR_WIDTH / 2, 298, GRAY_COLOR, BLACK_COLOR, pos='center')
-
-        pygame.display.update()
-        GAME_CLOCK.tick(FPS)
-
-
-def drawStars(screenSurf, vertAdj, horAdj):
-    """This function draws the red stars on the border of screenSurf."""
-    for i in range(20):
-        # draw top row of stars
-        screenSurf.blit(STAR_SURF, (2 + (((3 - vertAdj) + i * 4) * STAR_SURF.get_width()), 3))
-        # draw bottom row of stars
-        screenSurf.blit(STAR_SURF, (2 + ((vertAdj + i * 4) * STAR_SURF.get_width()), SCR_HEIGHT - 7 - STAR_SURF.get_height()))
-
-    for i in range(6):
-        # draw left column of stars going down
-        screenSurf.blit(STAR_SURF, (5, 6 + STAR_SURF.get_height() + (horAdj + i * 84)))
-        # draw right column of stars going up
-        screenSurf.blit(STAR_SURF, (SCR_WIDTH - 5 - STAR_SURF.get_width(), (SCR_HEIGHT - (6 + STAR_SURF.get_height() + (horAdj + i * 84)))))
-
-
-def showSettingsScreen(screenSurf):
-    """This is the screen that lets the user type in their name and settings for the game."""
-    p1name = None
-    p2name = None
-    points = None
-    gravity = None
-    choice = None
-
-    screenSurf.fill(BLACK_COLOR)
-
-    while p1name is None:
-        p1name = inputMode("Name of Player 1 (Default = 'Player 1'):  ", screenSurf, SCR_WIDTH / 2 - 146, 50, GRAY_COLOR, BLACK_COLOR, maxlen=10, pos='left', cursorBlink=True)
-    if p1name == '':
-        p1name = 'Player 1'
-
-    while p2name is None:
-        p2name = inputMode("Name of Player 2 (Default = 'Player 2'):  ", screenSurf, SCR_WIDTH / 2 - 146, 80, GRAY_COLOR, BLACK_COLOR, maxlen=10, pos='left', cursorBlink=True)
-    if p2name == '':
-        p2name = 'Player 2'
-
-    while points is None:
-        points = inputModeNum("Play to how many total points (Default = 3)?  ", screenSurf, SCR_WIDTH / 2 - 155, 110, GRAY_COLOR, BLACK_COLOR, maxlen=6, pos='left', cursorBlink=True)
-    if points == '':
-        points = 3
-    else:
-        points = int(float(points))
-
-    while gravity is None:
-        gravity = inputModeNum("Gravity in Meters/Sec (Earth = 9.8)?  ", screenSurf, SCR_WIDTH / 2 - 150, 140, GRAY_COLOR, BLACK_COLOR, maxlen=6, pos='left', cursorBlink=True)
-    if gravity == '':
-        gravity = 9.8
-    else:
-        gravity = float(gravity)
-
-    drawText('--------------', screenSurf, SCR_WIDTH / 2 -10, 170, GRAY_COLOR, BLACK_COLOR, pos='center')
-    drawText('V = View Intro', screenSurf, SCR_WIDTH / 2 -10, 200, GRAY_COLOR, BLACK_COLOR, pos='center')
-    drawText('P = Play Game', screenSurf, SCR_WIDTH / 2 -10, 230, GRAY_COLOR, BLACK_COLOR, pos='center')
-    drawText('Ctrl Q = Quit', screenSurf, SCR_WIDTH / 2 -10, 260, GRAY_COLOR, BLACK_COLOR, pos='center')
-    pygame.display.update()
-
-    while choice is None:
-        choice = inputMode("Your Choice?  ", screenSurf, SCR_WIDTH / 2 - 55, 290, GRAY_COLOR, BLACK_COLOR, maxlen=1, allowed='vp', pos='left', cursorBlink=True)
-
-    return p1name, p2name, points, gravity, choice # returns 'v' or 'p'
+def startScreen(screenSurf, then=None):
+    """The starting introductory screen, with red stars rotating around the border. This screen remains until the
+    user presses a key."""
+    return StarScreen(screenSurf, [
+        ('P  y  t  h  o  n     G  O  R  I  L  L  A  S', SCR_WIDTH / 2, 50, WHITE_COLOR, 'center'),
+        ('Your mission is to hit your opponent with the exploding', SCR_WIDTH / 2, 110, GRAY_COLOR, 'center'),
+        ('banana by varying the angle and power of your throw, taking', SCR_WIDTH / 2, 130, GRAY_COLOR, 'center'),
+        ('into account wind speed, gravity, and the city skyline.', SCR_WIDTH / 2, 150, GRAY_COLOR, 'center'),
+        ('The wind speed is shown by a directional arrow at the bottom', SCR_WIDTH / 2, 170, GRAY_COLOR, 'center'),
+        ('of the playing field, its length relative to its strength.', SCR_WIDTH / 2, 190, GRAY_COLOR, 'center'),
+        ('Press any key to continue', SCR_WIDTH / 2, 300, GRAY_COLOR, 'center'),
+    ], then)
+
+
+def gameOverScreen(screenSurf, p1name, p1score, p2name, p2score, then=None):
+    """The game over screen, showing the players' names and scores. This screen has rotating red stars too, and
+    hangs around until the user presses a key."""
+    return StarScreen(screenSurf, [
+        ('GAME OVER!', SCR_WIDTH / 2, 120, GRAY_COLOR, 'center'),
+        ('Score:', SCR_WIDTH / 2, 155, GRAY_COLOR, 'center'),
+        (p1name, 225, 170, GRAY_COLOR, 'left'),
+        (str(p1score), 395, 170, GRAY_COLOR, 'left'),
+        (p2name, 225, 185, GRAY_COLOR, 'left'),
+        (str(p2score), 395, 185, GRAY_COLOR, 'left'),
+        ('Press any key to continue', SCR_WIDTH / 2, 298, GRAY_COLOR, 'center'),
+    ], then)
+
+
+def disconnectedScreen(screenSurf, reason, then=None):
+    """Tells the user a network game had to be given up on, and why."""
+    return StarScreen(screenSurf, [
+        ('LOST THE OTHER PLAYER', SCR_WIDTH / 2, 120, GRAY_COLOR, 'center'),
+        (reason, SCR_WIDTH / 2, 155, GRAY_COLOR, 'center'),
+        ('Press any key to continue', SCR_WIDTH / 2, 298, GRAY_COLOR, 'center'),
+    ], then)
+
+
+class StarScreen(states.State):
+    """Shows lines of text, each a (text, x, y, fgcol, pos) tuple, on a black screen with the rotating red stars around
+    it until the user presses a key.
+
+    The text never changes, so it is drawn just once onto a background layer. After the first frame only the star
+    border is redrawn, on top of that background, FPS times a second."""
+
+    def __init__(self, screenSurf, lines, then=None):
+        states.State.__init__(self, then)
+        self._screenSurf = screenSurf
+        self._background = pygame.Surface((SCR_WIDTH, SCR_HEIGHT))
+        self._background.fill(BLACK_COLOR)
+        for text, x, y, fgcol, pos in lines:
+            drawText(text, self._background, x, y, fgcol, BLACK_COLOR, pos)
+        self._border = StarBorder()
+        self._frameTime = 1.0 / FPS
+        self._sinceFrame = self._frameTime
+        self._pressed = False
+
+    def enter(self):
+        self._screenSurf.blit(self._background, (0, 0))
+        DIRTY_RECTS.addScreen()
+
+    def handle(self, event):
+        if keyFromEvent(event):
+            self._pressed = True
+
+    def update(self, elapsed):
+        if self._pressed:
+            return self.finish()
+        self._sinceFrame += elapsed
+        return None
+
+    def render(self):
+        if self._sinceFrame < self._frameTime:
+            return
+        DIRTY_RECTS.addAll(self._border.draw(self._screenSurf, self._background))
+        self._sinceFrame = min(self._sinceFrame - self._frameTime, self._frameTime)
+        """The border moves on one step a frame. If it fell more than a frame behind, the frames it missed are
+        skipped rather than drawn in a hurry to catch up."""
+
+    def timeout(self):
+        return max(self._frameTime - self._sinceFrame, 0)
+
+
+class StarBorder(object):
+    """The red stars that rotate around the border of the start and game over screens.
+
+    The stars on the sides of the screen move 1 star each frame and reset every 4 frames. The stars on the top and
+    bottom of the screen move 12 pixels each frame and reset every 84 pixels. Rather than blitting all 52 stars every
+    frame, each row and column of stars is drawn once onto a strip long enough to cover all of those offsets, and a
+    frame just blits the right window of each strip."""
+
+    def __init__(self):
+        star = RESOURCES.sprites['STAR']
+        starWidth, starHeight = star.get_size()
+        self._starSize = starWidth, starHeight
+
+        self._rowStrip = pygame.Surface((SCR_WIDTH + 3 * starWidth, starHeight))
+        self._rowStrip.fill(BLACK_COLOR)
+        for i in range(20):
+            self._rowStrip.blit(star, (2 + ((3 + i * 4) * starWidth), 0))
+        """The top row is this strip shifted left by a star for every frame, the bottom row is it shifted back right."""
+
+        self._downStrip = pygame.Surface((starWidth, SCR_HEIGHT + 84))
+        self._downStrip.fill(BLACK_COLOR)
+        self._upStrip = pygame.Surface((starWidth, SCR_HEIGHT + 84))
+        self._upStrip.fill(BLACK_COLOR)
+        for i in range(6):
+            self._downStrip.blit(star, (0, 84 + 6 + starHeight + i * 84))
+            self._upStrip.blit(star, (0, SCR_HEIGHT - (6 + starHeight + i * 84)))
+
+        for strip in (self._rowStrip, self._downStrip, self._upStrip):
+            strip.set_colorkey(BLACK_COLOR)
+
+        self.bands = [
+            pygame.Rect(0, 3, SCR_WIDTH, starHeight),
+            pygame.Rect(0, SCR_HEIGHT - 7 - starHeight, SCR_WIDTH, starHeight),
+            pygame.Rect(5, 0, starWidth, SCR_HEIGHT),
+            pygame.Rect(SCR_WIDTH - 5 - starWidth, 0, starWidth, SCR_HEIGHT),
+        ]
+        """The four strips along the edges of the screen that the stars move around in."""
+        self._frame = 0
+
+    def draw(self, screenSurf, background):
+        """Draws the next frame of the border on top of the background layer and returns the areas that changed."""
+        starWidth, starHeight = self._starSize
+        vertAdj = self._frame % 4
+        horAdj = (self._frame % 7) * 12
+        self._frame += 1
+
+        top, bottom, left, right = self.bands
+        for band in self.bands:
+            screenSurf.blit(background, band, band)
+        screenSurf.blit(self._rowStrip, top, (vertAdj * starWidth, 0, SCR_WIDTH, starHeight))
+        screenSurf.blit(self._rowStrip, bottom, ((3 - vertAdj) * starWidth, 0, SCR_WIDTH, starHeight))
+        screenSurf.blit(self._downStrip, left, (0, 84 - horAdj, starWidth, SCR_HEIGHT))
+        screenSurf.blit(self._upStrip, right, (0, horAdj, starWidth, SCR_HEIGHT))
+        return self.bands
+
+
+class SettingsScreen(PromptScreen):
+    """This is the screen that lets the user type in their name and settings for the game. Once it is done, p1name,
+    p2name, points, gravity and choice hold what they picked, choice being 'v' to view the intro or 'p' to play."""
+
+    def __init__(self, screenSurf, then=None):
+        PromptScreen.__init__(self, screenSurf, then)
+        self.p1name = None
+        self.p2name = None
+        self.points = None
+        self.gravity = None
+        self.choice = None
+
+    def enter(self):
+        self._screenSurf.fill(BLACK_COLOR)
+        DIRTY_RECTS.addScreen()
+        self.ask("Name of Player 1 (Default = 'Player 1'):  ", SCR_WIDTH / 2 - 146, 50, GRAY_COLOR, BLACK_COLOR, maxlen=10, pos='left', cursorBlink=True)
+
+    def answered(self, textInput):
+        if self.p1name is None:
+            self.p1name = textInput.value or 'Player 1'
+            self.ask("Name of Player 2 (Default = 'Player 2'):  ", SCR_WIDTH / 2 - 146, 80, GRAY_COLOR, BLACK_COLOR, maxlen=10, pos='left', cursorBlink=True)
+        elif self.p2name is None:
+            self.p2name = textInput.value or 'Player 2'
+            self.ask("Play to how many total points (Default = 3)?  ", SCR_WIDTH / 2 - 155, 110, GRAY_COLOR, BLACK_COLOR, maxlen=6, validator=textinput.numberKey, pos='left', cursorBlink=True)
+        elif self.points is None:
+            if textInput.value == '':
+                self.points = 3
+            else:
+                self.points = int(numberFromText(textInput.value))
+            self.ask("Gravity in Meters/Sec (Earth = 9.8)?  ", SCR_WIDTH / 2 - 150, 140, GRAY_COLOR, BLACK_COLOR, maxlen=6, validator=textinput.numberKey, pos='left', cursorBlink=True)
+        elif self.gravity is None:
+            if textInput.value == '':
+                self.gravity = 9.8
+            else:
+                self.gravity = numberFromText(textInput.value)
+            DIRTY_RECTS.add(drawText('--------------', self._screenSurf, SCR_WIDTH / 2 -10, 170, GRAY_COLOR, BLACK_COLOR, pos='center'))
+            DIRTY_RECTS.add(drawText('V = View Intro', self._screenSurf, SCR_WIDTH / 2 -10, 200, GRAY_COLOR, BLACK_COLOR, pos='center'))
+            DIRTY_RECTS.add(drawText('P = Play Game', self._screenSurf, SCR_WIDTH / 2 -10, 230, GRAY_COLOR, BLACK_COLOR, pos='center'))
+            DIRTY_RECTS.add(drawText('Ctrl Q = Quit', self._screenSurf, SCR_WIDTH / 2 -10, 260, GRAY_COLOR, BLACK_COLOR, pos='center'))
+            self.ask("Your Choice?  ", SCR_WIDTH / 2 - 55, 290, GRAY_COLOR, BLACK_COLOR, maxlen=1, validator=textinput.allowedKeys('vp'), pos='left', cursorBlink=True)
+        else:
+            self.choice = textInput.value
+            return self.finish()
+        return None
 
 
-def showIntroScreen(screenSurf, p1name, p2name):
+class IntroScreen(states.Animation):
     """This is the screen that plays if the user selected "view intro" from the starting screen."""
-    screenSurf.fill(SKY_COLOR)
-    drawText('P  y  t  h  o  n     G  O  R  I  L  L  A  S', screenSurf, SCR_WIDTH / 2, 15, WHITE_COLOR, SKY_COLOR, pos='center')
-    drawText('STARRING:', screenSurf, SCR_WIDTH / 2, 55, WHITE_COLOR, SKY_COLOR, pos='center')
-    drawText('%s AND %s' % (p1name, p2name), screenSurf, SCR_WIDTH / 2, 115, WHITE_COLOR, SKY_COLOR, pos='center')
 
-    x = SCR_WIDTH / 2
-    y = 175
+    def __init__(self, screenSurf, p1name, p2name, then=None):
+        x = SCR_WIDTH / 2
+        y = 175
+
+        def drawGorillas(leftArms, rightArms):
+            DIRTY_RECTS.add(drawGorilla(screenSurf, x-47, y, leftArms))
+            DIRTY_RECTS.add(drawGorilla(screenSurf, x+47, y, rightArms))
+
+        frames = []
+        for i in range(2):
+            frames.append((2, functools.partial(drawGorillas, RIGHT_ARM_UP, LEFT_ARM_UP)))
+            frames.append((1, functools.partial(drawGorillas, LEFT_ARM_UP, RIGHT_ARM_UP)))
+        for i in range(4):
+            frames.append((0.3, functools.partial(drawGorillas, LEFT_ARM_UP, RIGHT_ARM_UP)))
+            frames.append((0.3, functools.partial(drawGorillas, RIGHT_ARM_UP, LEFT_ARM_UP)))
+        states.Animation.__init__(self, frames, then=then)
+        self._screenSurf = screenSurf
+        self._names = p1name, p2name
+
+    def enter(self):
+        self._screenSurf.fill(SKY_COLOR)
+        DIRTY_RECTS.addScreen()
+        drawText('P  y  t  h  o  n     G  O  R  I  L  L  A  S', self._screenSurf, SCR_WIDTH / 2, 15, WHITE_COLOR, SKY_COLOR, pos='center')
+        drawText('STARRING:', self._screenSurf, SCR_WIDTH / 2, 55, WHITE_COLOR, SKY_COLOR, pos='center')
+        drawText('%s AND %s' % self._names, self._screenSurf, SCR_WIDTH / 2, 115, WHITE_COLOR, SKY_COLOR, pos='center')
+
+    def exit(self):
+        pygame.event.clear() # Clear the queue since the user might have been confused
+
+
+def drawNames(screenSurf, p1name, p2name):
+    DIRTY_RECTS.add(pygame.draw.rect(screenSurf, SKY_COLOR, (0, 0, 200, 50)))
+    DIRTY_RECTS.add(pygame.draw.rect(screenSurf, SKY_COLOR, (550, 0, 00, 50)))
+
+    DIRTY_RECTS.add(drawText(p1name, screenSurf, 2, 2, WHITE_COLOR, SKY_COLOR))
+    DIRTY_RECTS.add(drawText(p2name, screenSurf, SCR_WIDTH-100, 2, WHITE_COLOR, SKY_COLOR))
+
+
+class ShotScreen(PromptScreen):
+    """ShotScreen is up when we want to get the angle and velocity from the player. Once it is done, "shot" holds
+    the (angle, velocity) thrown."""
+
+    def __init__(self, screenSurf, p1name, p2name, playerNum, then=None):
+        PromptScreen.__init__(self, screenSurf, then)
+        self._names = p1name, p2name
+        self._playerNum = playerNum
+        if playerNum == 1:
+            self._x = 2
+        else:
+            self._x = SCR_WIDTH-100
+        self._angleInput = None
+        self.shot = None
 
-    for i in range(2):
-        drawGorilla(screenSurf, x-47, y, RIGHT_ARM_UP)
-        drawGorilla(screenSurf, x+47, y, LEFT_ARM_UP)
-        pygame.display.update()
+    def enter(self):
+        drawNames(self._screenSurf, *self._names)
+        self.ask('Angle:  ', self._x, 18, WHITE_COLOR, SKY_COLOR, maxlen=3, validator=textinput.numberKey)
 
-        time.sleep(2)
+    def answered(self, textInput):
+        if textInput.value == '':
+            self.askAgain()
+            return None
+        if self._angleInput is None:
+            self._angleInput = textInput.value
+            self.ask('Velocity:  ', self._x, 34, WHITE_COLOR, SKY_COLOR, maxlen=3, validator=textinput.numberKey)
+            return None
+        velocityInput = textInput.value
 
-        drawGorilla(screenSurf, x-47, y, LEFT_ARM_UP)
-        drawGorilla(screenSurf, x+47, y, RIGHT_ARM_UP)
-        pygame.display.update()
+        angle = int(numberFromText(self._angleInput))
+        velocity = int(numberFromText(velocityInput))
 
-        time.sleep(1)
+        # Erase the user's input
+        DIRTY_RECTS.add(drawText('Angle:   %s ' % self._angleInput, self._screenSurf, self._x, 18, SKY_COLOR, SKY_COLOR))
+        DIRTY_RECTS.add(drawText('Velocity:   %s ' % velocityInput, self._screenSurf, self._x, 34, SKY_COLOR, SKY_COLOR))
+        self._inputs = []
 
-    for i in range(4):
-        drawGorilla(screenSurf, x-47, y, LEFT_ARM_UP)
-        drawGorilla(screenSurf, x+47, y, RIGHT_ARM_UP)
-        pygame.display.update()
+        if self._playerNum == 2:
+            angle = 180 - angle
 
-        time.sleep(0.3)
+        self.shot = (angle, velocity)
+        return self.finish()
 
-        drawGorilla(screenSurf, x-47, y, RIGHT_ARM_UP)
-        drawGorilla(screenSurf, x+47, y, LEFT_ARM_UP)
-        pygame.display.update()
 
-        time.sleep(0.3)
-    pygame.event.clear() # Clear the queue since the user might have been confused
+def drawScore(screenSurf, oneScore, twoScore):
+    """Draws the score on the screenSurf surface and returns the area drawn on."""
+    scoreMessage = str(oneScore) + '>Score<' + str(twoScore)
+    return drawText(scoreMessage, screenSurf, SCR_WIDTH / 2, SCR_HEIGHT - 20, WHITE_COLOR, SKY_COLOR, pos='center')
 
 
-def getShot(screenSurf, p1name, p2name, playerNum):
-    """getShot() is called when we want to get the angle and velocity from the player."""
-    pygame.draw.rect(screenSurf, SKY_COLOR, (0, 0, 200, 50))
-    pygame.draw.rect(screenSurf, SKY_COLOR, (550, 0, 00, 50))
+class ThrowScreen(states.Animation):
+    """Shows a throw by playerNum, shot being the simulation.ShotResult of it. "outcome" is what it hit: 'gorilla1',
+    'gorilla2', 'building' or 'miss'. The whole flight was already worked out by simulation.simulateShot() and the
+    craters are already in the city, this screen just replays it."""
 
-    drawText(p1name, screenSurf, 2, 2, WHITE_COLOR, SKY_COLOR)
-    drawText(p2name, screenSurf, SCR_WIDTH-100, 2, WHITE_COLOR, SKY_COLOR)
+    def __init__(self, screenSurf, skylineSurf, shot, playerNum, gor1, gor2, then=None):
+        self.outcome = shot.outcome
 
-    if playerNum == 1:
-        x = 2
-    else:
-        x = SCR_WIDTH-100
+        # startx and starty is the upper left corner of the gorilla.
+        if playerNum == 1:
+            gorImg = LEFT_ARM_UP
+            startx, starty = gor1
+        else:
+            gorImg = RIGHT_ARM_UP
+            startx, starty = gor2
+        """The player 1 gorilla on the left uses his left arm to throw, the player 2 gorilla on the right uses his
+        right arm to throw."""
+
+        throwFrames = [
+            (0.3, lambda: DIRTY_RECTS.add(drawGorilla(screenSurf, startx, starty, gorImg))),
+            (0, lambda: DIRTY_RECTS.add(drawGorilla(screenSurf, startx, starty, BOTH_ARMS_DOWN))),
+        ]
+        """Draw the gorilla throwing the banana."""
+
+        bananaRects = []
+        def drawBananaFrame(i, left, top, orient):
+            if bananaRects:
+                DIRTY_RECTS.add(screenSurf.fill(SKY_COLOR, bananaRects.pop())) # erase banana
+            DIRTY_RECTS.add(drawSun(screenSurf, shocked=shot.sunHitAt is not None and shot.sunHitAt <= i))
+            bananaRects.append(DIRTY_RECTS.add(drawBanana(screenSurf, orient, left, top)))
+        """Each frame erases the banana wherever it was last drawn, so it doesn't matter if frames get skipped."""
+
+        def drawLanded():
+            if bananaRects:
+                DIRTY_RECTS.add(screenSurf.fill(SKY_COLOR, bananaRects.pop())) # erase banana
+            if shot.impact is not None:
+                DIRTY_RECTS.add(drawSun(screenSurf, shocked=shot.sunHitAt is not None))
+
+        flightFrames = [
+            (0.02, functools.partial(drawBananaFrame, i, left, top, orient))
+            for i, (left, top, orient) in enumerate(shot.path)
+        ]
+        flightFrames.append((0, drawLanded))
+
+        framesLists = [throwFrames, flightFrames]
+        if shot.outcome == simulation.BUILDING:
+            speed = 0.05
+        else:
+            speed = 0.005
+        for x, y, radius in simulation.craters(shot):
+            framesLists.append(explosionFrames(screenSurf, skylineSurf, x, y, explosionSize=radius, speed=speed))
+        """Note that we draw the explosion on the screen (on screenSurf) and leave the crater on the separate skyline surface
+        (on skylineSurf). This is done so that the skylineSurf surface object keeps track of what chunks of the buildings are
+        left, for redrawing the scene."""
+        framesLists.append([(0, lambda: DIRTY_RECTS.add(drawSun(screenSurf)))])
+        states.Animation.__init__(self, *framesLists, **{'then': then})
+
+
+def victoryDanceFrames(screenSurf, x, y):
+    """Given the x,y coordinates of the topleft corner of the gorilla sprite, these are the frames of the victory
+    dance routine of the gorilla where they start waving their arms in the air."""
+    frames = []
+    for i in range(4):
+        frames.append((0.3, lambda: DIRTY_RECTS.add(screenSurf.blit(RESOURCES.sprites['GOR_LEFT'], (x, y)))))
+        frames.append((0.3, lambda: DIRTY_RECTS.add(screenSurf.blit(RESOURCES.sprites['GOR_RIGHT'], (x, y)))))
+    return frames
 
-    angleInput = ''
-    while angleInput == '':
-        angleInput = inputModeNum('Angle:  ', screenSurf, x, 18, WHITE_COLOR, SKY_COLOR, maxlen=3)
-    if angleInput is None:
-        terminate()
-    angle = int(float(angleInput))
 
-    velocityInput = ''
-    while velocityInput == '':
-        velocityInput = inputModeNum('Velocity:  ', screenSurf, x, 34, WHITE_COLOR, SKY_COLOR, maxlen=3)
-    if velocityInput is None:
-        terminate()
-    velocity = int(float(velocityInput))
+def drawWind(screenSurf, wind):
+    """Draws the wind arrow on the screenSurf object at the bottom of the screen. The "wind" parameter comes from
+    the round's worldgen.World. The area drawn on is returned."""
+    windRect = pygame.Rect(int(SCR_WIDTH / 2), SCR_HEIGHT - 5, 0, 0)
+    if wind != 0:
+        wind *= 3
+        windRect = pygame.draw.line(screenSurf, EXPLOSION_COLOR, (int(SCR_WIDTH / 2), SCR_HEIGHT - 5), (int(SCR_WIDTH / 2) + wind, SCR_HEIGHT - 5))
+        # draw the arrow end
+        if wind > 0:
+            arrowDir = -2
+        else:
+            arrowDir = 2
+        windRect.union_ip(pygame.draw.line(screenSurf, EXPLOSION_COLOR, (int(SCR_WIDTH / 2) + wind, SCR_HEIGHT - 5), (int(SCR_WIDTH / 2) + wind + arrowDir, SCR_HEIGHT - 5 - 2)))
+        windRect.union_ip(pygame.draw.line(screenSurf, EXPLOSION_COLOR, (int(SCR_WIDTH / 2) + wind, SCR_HEIGHT - 5), (int(SCR_WIDTH / 2) + wind + arrowDir, SCR_HEIGHT - 5 + 2)))
+    return windRect
 
-    # Erase the user's input
-    drawText('Angle:   %s ' % angleInput, screenSurf, x, 18, SKY_COLOR, SKY_COLOR)
-    drawText('Velocity:   %s ' % velocityInput, screenSurf, x, 34, SKY_COLOR, SKY_COLOR)
-    pygame.display.update()
 
-    if playerNum == 2:
-        angle = 180 - angle
+def explosionFrames(screenSurf, skylineSurf, x, y, explosionSize=simulation.BUILD_EXPLOSION_SIZE, speed=0.05):
+    """The frames of an explosion growing and shrinking back down, leaving a crater. The explosion itself is only
+    blitted onto the screen from RESOURCES.explosions, the crater is blown out of the screen and the skyline in one go
+    once it is over. It is the same shape as the one match.Match already carved out of the city's collision mask."""
+    def drawFrame(sprite):
+        DIRTY_RECTS.add(screenSurf.blit(sprite, (x - explosionSize, y - explosionSize)))
 
-    return (angle, velocity)
+    def drawCrater():
+        screenRect, skylineRect = RESOURCES.explosions.stampCrater([screenSurf, skylineSurf], x, y, explosionSize)
+        DIRTY_RECTS.add(screenRect)
+    """The crater clears the whole explosion, not just what the last shrinking frame left, in case that frame was
+    skipped."""
 
+    frames = [(speed, functools.partial(drawFrame, sprite)) for sprite in RESOURCES.explosions.frames(explosionSize)]
+    frames.append((0, drawCrater))
+    return frames
 
-def drawScore(screenSurf, oneScore, twoScore):
-    """Draws the score on the screenSurf surface."""
-    scoreMessage = str(oneScore) + '>Score<' + str(twoScore)
-    drawText(scoreMessage, screenSurf, SCR_WIDTH / 2, SCR_HEIGHT - 20, WHITE_COLOR, SKY_COLOR, pos='center')
 
+class Game(object):
+    """Decides which screen comes after which. Each screen is handed one of these methods as what to do once it is
+    done, and they return the next screen, so a whole game is just MACHINE.run(Game(screenSurf).start()). The rules
+    themselves are up to a match.Match.
 
-def plotShot(screenSurf, skylineSurf, angle, velocity, playerNum, wind, gravity, gor1, gor2):
-    # startx and starty is the upper left corner of the gorilla.
-    angle = angle / 180.0 * math.pi
-    initXVel = math.cos(angle) * velocity
-    initYVel = math.sin(angle) * velocity
-    gorWidth, gorHeight = GOR_DOWN_SURF.get_size()
-    gor1rect = pygame.Rect(gor1[0], gor1[1], gorWidth, gorHeight)
-    gor2rect = pygame.Rect(gor2[0], gor2[1], gorWidth, gorHeight)
+    If there is a recordPath, every game played is recorded to it, see replay.py."""
 
-    if playerNum == 1:
-        gorImg = LEFT_ARM_UP
-    else:
-        gorImg = RIGHT_ARM_UP
-    """The player 1 gorilla on the left uses his left arm to throw, the player 2 gorilla on the right uses his
-    right arm to throw."""
-
-    if playerNum == 1:
-        startx = gor1[0]
-        starty = gor1[1]
-    elif playerNum == 2:
-        startx = gor2[0]
-        starty = gor2[1]
-
-    drawGorilla(screenSurf, startx, starty, gorImg)
-    pygame.display.update()
-    time.sleep(0.3)
-    drawGorilla(screenSurf, startx, starty, BOTH_ARMS_DOWN)
-    pygame.display.update()
-    """Draw the gorilla throwing the banana."""
-
-    bananaOrient = UP
-
-    if playerNum == 2:
-        startx += GOR_DOWN_SURF.get_size()[0]
-
-    starty -= getBananaRect(0, 0, bananaOrient).height + BAN_UP_SURF.get_size()[1]
-
-    impact = False
-    bananaInPlay = True
-
-    t = 1.0
-    sunHit = False
-
-    while not impact and bananaInPlay:
-        x = startx + (initXVel * t) + (0.5 * (wind / 5) * t**2)
-        y = starty + ((-1 * (initYVel * t)) + (0.5 * gravity * t**2))
-        """This is basically the equation that describes the banana's arc."""
-
-        if x >= SCR_WIDTH - 10 or x <= 3 or y >= SCR_HEIGHT:
-            bananaInPlay = False
-
-        bananaRect = getBananaRect(x, y, bananaOrient)
-        if bananaOrient == UP:
-            bananaSurf = BAN_UP_SURF
-            bananaRect.left -= 2
-            bananaRect.top += 2
-        elif bananaOrient == DOWN:
-            bananaSurf = BAN_DOWN_SURF
-            bananaRect.left -= 2
-            bananaRect.top += 2
-        elif bananaOrient == LEFT:
-            bananaSurf = BAN_LEFT_SURF
-        elif bananaOrient == RIGHT:
-            bananaSurf = BAN_RIGHT_SURF
-
-        bananaOrient = nextBananaOrientation(bananaOrient)
-
-        srcPixArray = pygame.PixelArray(skylineSurf)
-        if bananaInPlay and y > 0:
-
-            if sunRect.collidepoint(x, y):
-                # banana has hit the sun, so draw the "shocked" face.
-                sunHit = True
-
-            # draw the appropriate sun face
-            drawSun(screenSurf, shocked=sunHit)
-
-            if bananaRect.colliderect(gor1rect):
-                # banana has hit player 1
-
-                """Note that we draw the explosion on the screen (on screenSurf) and on the separate skyline surface (on skylineSurf).
-                This is done so that bananas won't hit the sun or any text and accidentally think they've hit something. We also want
-                the skylineSurf surface object to keep track of what chunks of the buildings are left."""
-                doExplosion(screenSurf, skylineSurf, bananaRect.centerx, bananaRect.centery, explosionSize=int(GOR_EXPLOSION_SIZE*2/3), speed=0.005)
-                doExplosion(screenSurf, skylineSurf, bananaRect.centerx, bananaRect.centery, explosionSize=GOR_EXPLOSION_SIZE, speed=0.005)
-                drawSun(screenSurf)
-                return 'gorilla1'
-            elif bananaRect.colliderect(gor2rect):
-                # banana has hit player 2
-                doExplosion(screenSurf, skylineSurf, bananaRect.centerx, bananaRect.centery, explosionSize=int(GOR_EXPLOSION_SIZE*2/3), speed=0.005)
-                doExplosion(screenSurf, skylineSurf, bananaRect.centerx, bananaRect.centery, explosionSize=GOR_EXPLOSION_SIZE, speed=0.005)
-                screenSurf.fill(SKY_COLOR, bananaRect) # erase banana
-                drawSun(screenSurf)
-                return 'gorilla2'
-            elif collideWithNonColor(srcPixArray, screenSurf, bananaRect, SKY_COLOR):
-                # banana has hit a building
-                doExplosion(screenSurf, skylineSurf, bananaRect.centerx, bananaRect.centery)
-                screenSurf.fill(SKY_COLOR, bananaRect) # erase banana
-                drawSun(screenSurf)
-                return 'building'
-
-        del srcPixArray
-        """Pygame doesn't let us blit a surface while there is a pixel array of it existing, so we delete it."""
-
-        screenSurf.blit(bananaSurf, (bananaRect.topleft))
-        pygame.display.update()
-        time.sleep(0.02)
-
-        screenSurf.fill(SKY_COLOR, bananaRect) # erase banana
-
-        t += 0.1 # go forward in the plot.
-    drawSun(screenSurf)
-    return 'miss'
-
-
-def victoryDance(screenSurf, x, y):
-    """Given the x,y coordinates of the topleft corner of the gorilla sprite, this goes through
-    the victory dance routine of the gorilla where they start waving their arms in the air."""
-    for i in range(4):
-        screenSurf.blit(GOR_LEFT_SURF, (x, y))
-        pygame.display.update()
-        time.sleep(0.3)
-        screenSurf.blit(GOR_RIGHT_SURF, (x, y))
-        pygame.display.update()
-        time.sleep(0.3)
-
-
-def collideWithNonColor(pixArr, surfObj, rect, color):
-    """This checks the area (described by "rect") on pixArr (a pixel array derived from the surfObj surface object)
-    if it has any pixels that are not the color specified by the "color" parameter. This function is used to detect
-    if the banana has hit any non-sky colored parts (which means a gorilla or a building)."""
-    rightSide = min(rect.right, SCR_WIDTH)
-    bottomSide = min(rect.bottom, SCR_HEIGHT)
-
-    for x in range(rect.left, rightSide):
-        for y in range(rect.top, bottomSide):
-            if surfObj.unmap_rgb(pixArr[x][y]) != color:
-                return True
-    return False
+    def __init__(self, screenSurf, recordPath=None):
+        self._screenSurf = screenSurf
+        self._recordPath = recordPath
+        self._recorder = None
+        self.match = None
+        self.skylineSurf = None
 
+    def start(self):
+        return startScreen(self._screenSurf, then=self.settings)
 
-def getBananaRect(x, y, orient):
-    if orient == UP:
-        return pygame.Rect((x, y), BAN_UP_SURF.get_size())
-    if orient == DOWN:
-        return pygame.Rect((x, y), BAN_DOWN_SURF.get_size())
-    if orient == LEFT:
-        return pygame.Rect((x, y), BAN_LEFT_SURF.get_size())
-    if orient == RIGHT:
-        return pygame.Rect((x, y), BAN_RIGHT_SURF.get_size())
+    def settings(self, finished=None):
+        # start a new game
+        return SettingsScreen(self._screenSurf, then=self._newGame)
+
+    def _newGame(self, settings):
+        self.newMatch(settings.p1name, settings.p2name, settings.points, settings.gravity)
+        if settings.choice == 'v':
+            return IntroScreen(self._screenSurf, settings.p1name, settings.p2name, then=self.nextTurn)
+        return self.nextTurn()
+
+    def newMatch(self, p1name, p2name, winPoints, gravity):
+        self.match = match.Match(p1name, p2name, winPoints, gravity, self.recorder())
+
+    def recorder(self):
+        """What the match tells about everything that happens, see match.Match"""
+        if self._recordPath is not None and self._recorder is None:
+            try:
+                self._recorder = replay.Recorder.open(self._recordPath)
+            except (IOError, OSError), e:
+                _moduleLogger.exception("Not recording, could not open %r" % self._recordPath)
+                self._recordPath = None
+        return self._recorder
+
+    def newRound(self):
+        """Starts the match on a new round, returning the worldgen.CityState for it and the surface it is drawn on"""
+        # At the start of a new round, make up a new city scape, place the gorillas, and get the wind speed.
+        city = ROUNDS.get()
+        return city, makeCityScape(city.world) # Note that the city skyline goes on skylineSurf, not screenSurf.
+
+    def nextTurn(self, finished=None):
+        if self.match.isOver:
+            pygame.event.clear() # clears event queue, otherwise Game Over Screen does not come up
+            p1score, p2score = self.match.scores
+            return gameOverScreen(self._screenSurf, self.match.names[0], p1score, self.match.names[1], p2score, then=self.settings)
+
+        if self.match.needsRound:
+            city, self.skylineSurf = self.newRound()
+            self.match.newRound(city)
+            _moduleLogger.info("Round from seed %d" % city.world.seed)
+
+        # Do all the drawing.
+        world = self.match.city.world
+        gorPos = world.gorillas
+        self._screenSurf.blit(self.skylineSurf, (0, 0))
+        drawGorilla(self._screenSurf, gorPos[0][0], gorPos[0][1], 0)
+        drawGorilla(self._screenSurf, gorPos[1][0], gorPos[1][1], 0)
+        drawWind(self._screenSurf, world.wind)
+        drawSun(self._screenSurf)
+        drawScore(self._screenSurf, *self.match.scores)
+        DIRTY_RECTS.addScreen()
+
+        return self.shotScreen()
+
+    def shotScreen(self):
+        """The screen the player whose turn it is throws from"""
+        return ShotScreen(
+            self._screenSurf, self.match.names[0], self.match.names[1], self.match.turn,
+            then=lambda shotScreen: self.throw(*shotScreen.shot),
+        )
+
+    def throw(self, angle, velocity):
+        playerNum = self.match.turn
+        with MACHINE.profiler.section('shot'):
+            shot = self.match.throw(angle, velocity)
+        """The whole flight, and what it hits in the city's collision mask, is worked out here at once, so this is
+        where the time the collision checks take shows up."""
+        gor1, gor2 = self.match.city.world.gorillas
+        return ThrowScreen(self._screenSurf, self.skylineSurf, shot, playerNum, gor1, gor2, then=self._thrown)
+
+    def _thrown(self, throwScreen):
+        gorPos = self.match.city.world.gorillas
+        if throwScreen.outcome == 'gorilla1':
+            return states.Animation(victoryDanceFrames(self._screenSurf, gorPos[1][0], gorPos[1][1]), then=self.nextTurn)
+        elif throwScreen.outcome == 'gorilla2':
+            return states.Animation(victoryDanceFrames(self._screenSurf, gorPos[0][0], gorPos[0][1]), then=self.nextTurn)
+        return self.nextTurn()
+
+
+class ReplayGame(Game):
+    """Shows recorded games, records being what replay.Reader.records() gives. Instead of asking the players, every
+    game, round and throw comes from the records, and it is all over when they run out."""
+
+    def __init__(self, screenSurf, records):
+        Game.__init__(self, screenSurf)
+        self._records = iter(records)
+
+    def start(self):
+        return self.settings()
+
+    def settings(self, finished=None):
+        record = self._nextRecord(replay.GAME)
+        if record is None:
+            return states.FINISHED
+        self.newMatch(*record)
+        return self.nextTurn()
+
+    def newRound(self):
+        record = self._nextRecord(replay.ROUND)
+        if record is None:
+            raise replay.ReplayError("Replay ended before the round started")
+        return prepareRound(record[0])
+
+    def shotScreen(self):
+        record = self._nextRecord(replay.SHOT)
+        if record is None:
+            return states.FINISHED
+        playerNum, angle, velocity = record
+        if playerNum != self.match.turn:
+            raise replay.ReplayError("Player %d threw on player %d's turn" % (playerNum, self.match.turn))
+        return self.throw(angle, velocity)
+
+    def _nextRecord(self, kind):
+        """The fields of the next record, which has to be of kind, or None if there are no more"""
+        for recordKind, values in self._records:
+            if recordKind != kind:
+                raise replay.ReplayError("Expected a %r record, got %r" % (kind, recordKind))
+            return values
+        return None
+
+
+def waitingText(peer):
+    """How the connection to the other side of a network game is doing, peer being a network.Host or network.Client"""
+    if not peer.connected:
+        return 'Connecting...'
+    if peer.latency is None:
+        return 'Waiting...'
+    return 'Waiting... (%d ms)' % (peer.latency * 1000 + 0.5)
+
+
+class WaitScreen(states.State):
+    """Waits for the other side of a network game to send a record of kind, peer being the network.Host or
+    network.Client. Meanwhile, waitingText() is shown at x, y. Once the record is in, "values" holds its fields. If
+    the peer gives up on the other side instead, this goes to disconnectedScreen(), which ends the game."""
+
+    def __init__(self, screenSurf, peer, kind, x, y, bgcol, pos='left', then=None):
+        states.State.__init__(self, then)
+        self._screenSurf = screenSurf
+        self._peer = peer
+        self._kind = kind
+        self._x = x
+        self._y = y
+        self._bgcol = bgcol
+        self._pos = pos
+        self._shown = None
+        self._rect = None
+        self.values = None
+
+    def exit(self):
+        self._erase()
+
+    def update(self, elapsed):
+        self.values = self._peer.nextRecord(self._kind)
+        if self.values is not None:
+            return self.finish()
+        if self._peer.error is not None:
+            return disconnectedScreen(self._screenSurf, self._peer.error)
+        return None
+
+    def render(self):
+        text = waitingText(self._peer)
+        if text == self._shown:
+            return
+        self._erase()
+        self._rect = DIRTY_RECTS.add(drawText(text, self._screenSurf, self._x, self._y, WHITE_COLOR, self._bgcol, pos=self._pos))
+        self._shown = text
+
+    def timeout(self):
+        return network.PING_INTERVAL
+    """The latency shown changes with every ping."""
+
+    def _erase(self):
+        if self._rect is not None:
+            DIRTY_RECTS.add(self._screenSurf.fill(self._bgcol, self._rect))
+            self._rect = None
+        self._shown = None
+
+
+class NetworkGame(Game):
+    """A game against another device, peer being a network.Host or network.Client and localPlayer the player on
+    this one, 1 for the host and 2 for the client. The host picks the settings and makes up the rounds like any other
+    game, the client waits for them, and each side waits for the other player's throws. See network.py."""
+
+    def __init__(self, screenSurf, peer, localPlayer, recordPath=None):
+        Game.__init__(self, screenSurf, recordPath)
+        self._peer = peer
+        self._localPlayer = localPlayer
+        self._seed = None
+
+    def settings(self, finished=None):
+        if self._localPlayer == 1:
+            return Game.settings(self, finished)
+        return WaitScreen(
+            self._screenSurf, self._peer, replay.GAME, SCR_WIDTH / 2, SCR_HEIGHT - 40, BLACK_COLOR, pos='center',
+            then=self._joined,
+        )
+
+    def _joined(self, waitScreen):
+        self.newMatch(*waitScreen.values)
+        return self.nextTurn()
+
+    def recorder(self):
+        return network.LockstepRecorder(self._peer, self._localPlayer, Game.recorder(self))
+
+    def nextTurn(self, finished=None):
+        if self._localPlayer == 2 and self.match.needsRound and not self.match.isOver and self._seed is None:
+            return self._waitFor(replay.ROUND, 1, then=self._roundMade)
+        return Game.nextTurn(self, finished)
+
+    def _roundMade(self, waitScreen):
+        self._seed, = waitScreen.values
+        return self.nextTurn()
+
+    def newRound(self):
+        if self._localPlayer == 1:
+            return Game.newRound(self)
+        seed, self._seed = self._seed, None
+        return prepareRound(seed)
+
+    def shotScreen(self):
+        if self.match.turn == self._localPlayer:
+            return Game.shotScreen(self)
+        drawNames(self._screenSurf, *self.match.names)
+        return self._waitFor(replay.SHOT, self.match.turn, then=self._thrownThere)
+
+    def _thrownThere(self, waitScreen):
+        playerNum, angle, velocity = waitScreen.values
+        if playerNum != self.match.turn:
+            self._peer.fail("Player %d threw on player %d's turn" % (playerNum, self.match.turn))
+            return disconnectedScreen(self._screenSurf, self._peer.error)
+        return self.throw(angle, velocity)
+
+    def _waitFor(self, kind, playerNum, then):
+        """Waits for a record of kind from the other side, showing how it is going where playerNum's prompts go"""
+        if playerNum == 1:
+            x, pos = 2, 'left'
+        else:
+            x, pos = SCR_WIDTH - 2, 'right'
+        return WaitScreen(self._screenSurf, self._peer, kind, x, 18, SKY_COLOR, pos=pos, then=then)
 
 
-def getWind():
-    """Randomly determine what the wind speed and direction should be for this game."""
-    wind = random.randint(5, 15)
-    if random.randint(0, 1):
-        wind *= -1
-    return wind
+def game_loop(replayPath=None, speed=1.0, peer=None, overlay=False, frameLogPath=None):
+    """screenSurf, being the surface object returned by pygame.display.set_mode(), will be drawn to the screen
+    every time pygame.display.update() is called.
 
+    With a replayPath, the games recorded there are shown speed times as fast as they were played instead. With a
+    peer, a network.Host or network.Client, the game is played against another device.
 
-def drawWind(screenSurf, wind):
-    """Draws the wind arrow on the screenSurf object at the bottom of the screen. The "wind" parameter comes from
-    a call to getWind()."""
-    if wind != 0:
-        wind *= 3
-        pygame.draw.line(screenSurf, EXPLOSION_COLOR, (int(SCR_WIDTH / 2), SCR_HEIGHT - 5), (int(SCR_WIDTH / 2) + wind, SCR_HEIGHT - 5))
-        # draw the arrow end
-        if wind > 0:
-            arrowDir = -2
-        else:
-            arrowDir = 2
-        pygame.draw.line(screenSurf, EXPLOSION_COLOR, (int(SCR_WIDTH / 2) + wind, SCR_HEIGHT - 5), (int(SCR_WIDTH / 2) + wind + arrowDir, SCR_HEIGHT - 5 - 2))
-        pygame.draw.line(screenSurf, EXPLOSION_COLOR, (int(SCR_WIDTH / 2) + wind, SCR_HEIGHT - 5), (int(SCR_WIDTH / 2) + wind + arrowDir, SCR_HEIGHT - 5 + 2))
-
-
-def doExplosion(screenSurf, skylineSurf, x, y, explosionSize=BUILD_EXPLOSION_SIZE, speed=0.05):
-    for r in range(1, explosionSize):
-        pygame.draw.circle(screenSurf, EXPLOSION_COLOR, (x, y), r)
-        pygame.draw.circle(skylineSurf, EXPLOSION_COLOR, (x, y), r)
-        pygame.display.update()
-        time.sleep(speed)
-    for r in range(explosionSize, 1, -1):
-        pygame.draw.circle(screenSurf, SKY_COLOR, (x, y), explosionSize)
-        pygame.draw.circle(skylineSurf, SKY_COLOR, (x, y), explosionSize)
-        pygame.draw.circle(screenSurf, EXPLOSION_COLOR, (x, y), r)
-        pygame.draw.circle(skylineSurf, EXPLOSION_COLOR, (x, y), r)
-        pygame.display.update()
-        time.sleep(speed)
-    pygame.draw.circle(screenSurf, SKY_COLOR, (x, y), 2)
-    pygame.draw.circle(skylineSurf, SKY_COLOR, (x, y), 2)
-    pygame.display.update()
-
-
-def game_loop():
-    """screenSurf, being the surface object returned by pygame.display.set_mode(), will be drawn to the screen
-    every time pygame.display.update() is called."""
+    With overlay, the frame rate and how long each part of a frame takes are shown in the top right corner, and with a
+    frameLogPath, how long every frame and every part of it took is written there, see instrument.Profiler."""
+    RESOURCES.preload('pygame')
     # Uncomment either of the following lines to put the game into full screen mode.
-    screenSurf = pygame.display.set_mode((SCR_WIDTH, SCR_HEIGHT), pygame.FULLSCREEN|pygame.HWSURFACE)
+    with STARTUP.phase('display'):
+        screenSurf = pygame.display.set_mode((SCR_WIDTH, SCR_HEIGHT), pygame.FULLSCREEN|pygame.HWSURFACE)
 
     ##pygame.display.toggle_fullscreen()
     pygame.display.set_caption('Gorillas.py')
     pygame.mouse.set_visible(False)
+    RESOURCES.preload()
+    _moduleLogger.info(STARTUP.report())
+    """Everything is loaded up front here anyway, the start screen needs most of it, so the report covers all of the
+    startup."""
+
+    if overlay or frameLogPath is not None:
+        if frameLogPath is not None:
+            MACHINE.profiler = instrument.Profiler.export(frameLogPath)
+        else:
+            MACHINE.profiler = instrument.Profiler()
+        if overlay:
+            MACHINE.overlay = instrument.Overlay(
+                screenSurf, MACHINE.profiler, RESOURCES.font, DIRTY_RECTS, (SCR_WIDTH - instrument.Overlay.WIDTH, 0),
+            )
+
+    if replayPath is not None:
+        MACHINE.speed = speed
+        MACHINE.run(ReplayGame(screenSurf, replay.Reader.open(replayPath).records()).start())
+        return
+
+    if peer is not None:
+        MACHINE.addTask(peer.poll, network.POLL_INTERVAL)
+        """The connection is kept up whatever screen is showing, so it doesn't go quiet while a player thinks."""
+        if isinstance(peer, network.Host):
+            ROUNDS.start()
+            game = NetworkGame(screenSurf, peer, 1, replay.replayPath())
+        else:
+            game = NetworkGame(screenSurf, peer, 2, replay.replayPath())
+            """The client gets its rounds from the host, so doesn't make any up."""
+        MACHINE.run(game.start())
+        return
 
-    showStartScreen(screenSurf)
+    ROUNDS.start()
+    MACHINE.run(Game(screenSurf, replay.replayPath()).start())
+    """The game over screen goes back to the settings screen, so this only ever ends by quitting."""
 
-    while True:
-        # start a new game
-        p1name, p2name, winPoints, gravity, nextScreen = showSettingsScreen(screenSurf)
-        if nextScreen == 'v':
-            showIntroScreen(screenSurf, p1name, p2name)
-
-        # Reset the score and make it the first player's turn.
-        p1score = 0
-        p2score = 0
-        turn = 1
-
-        newRound = True
-        while p1score < winPoints and p2score < winPoints:
-            if newRound:
-                # At the start of a new round, make a new city scape, place the gorillas, and get the wind speed.
-                skylineSurf, buildCoords = makeCityScape() # Note that the city skyline goes on skylineSurf, not screenSurf.
-                gorPos = placeGorillas(buildCoords)
-                wind = getWind()
-                newRound = False
-
-            # Do all the drawing.
-            screenSurf.blit(skylineSurf, (0, 0))
-            drawGorilla(screenSurf, gorPos[0][0], gorPos[0][1], 0)
-            drawGorilla(screenSurf, gorPos[1][0], gorPos[1][1], 0)
-            drawWind(screenSurf, wind)
-            drawSun(screenSurf)
-            drawScore(screenSurf, p1score, p2score)
-
-            pygame.display.update()
-
-            angle, velocity = getShot(screenSurf, p1name, p2name, turn)
-            if turn == 1:
-                gorx, gory = gorPos[0][0], gorPos[0][1]
-            elif turn == 2:
-                gorx, gory = gorPos[1][0], gorPos[1][1]
-            result = plotShot(screenSurf, skylineSurf, angle, velocity, turn, wind, gravity, gorPos[0], gorPos[1])
-
-            if result == 'gorilla1':
-                victoryDance(screenSurf, gorPos[1][0], gorPos[1][1])
-                p2score += 1
-                newRound = True
-            elif result == 'gorilla2':
-                victoryDance(screenSurf, gorPos[0][0], gorPos[0][1])
-                p1score += 1
-                newRound = True
-
-            turn = {
-                1: 2,
-                2: 1,
-            }[turn]
-
-        pygame.event.clear() # clears event queue, otherwise Game Over Screen does not come up
-        showGameOverScreen(screenSurf, p1name, p1score, p2name, p2score)
 
 def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--replay", dest="replay", help="Show the games recorded in REPLAY instead of playing")
+    parser.add_option("--speed", dest="speed", type="float", default=1.0, help="How many times as fast to show a replay")
+    parser.add_option("--host", dest="host", action="store_true", default=False, help="Wait for another device to play against, as player 1")
+    parser.add_option("--connect", dest="connect", metavar="HOST", help="Play against the device hosting a game at HOST, as player 2")
+    parser.add_option("--port", dest="port", type="int", default=network.PORT, help="Port network games are played on [%default]")
+    parser.add_option("--overlay", dest="overlay", action="store_true", default=False, help="Show the frame rate and what frames spend their time on")
+    parser.add_option("--frame-log", dest="frameLog", metavar="FILE", help="Write how long every frame took to FILE, as CSV")
+    options, args = parser.parse_args()
+
     try:
         os.makedirs(constants._data_path_)
     except OSError, e:
@@ -951,11 +1092,21 @@ def main():
     _moduleLogger.info("Kernel: %s (%s) for %s" % os.uname()[2:])
     _moduleLogger.info("Hostname: %s" % os.uname()[1])
 
+    peer = None
+    if options.host:
+        peer = network.Host(options.port)
+    elif options.connect is not None:
+        peer = network.Client(options.connect, options.port)
+
     try:
-        game_loop()
+        game_loop(options.replay, options.speed, peer, options.overlay, options.frameLog)
     except:
         _moduleLogger.exception("Bailing out")
+    MACHINE.profiler.close()
+
+
 
+STARTUP.record('import', time.time() - _importStart)
 
 
 if __name__ == '__main__':
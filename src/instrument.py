@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""Seeing where the time goes, frame by frame.
+
+A cProfile run of the whole game says which functions add up to the most time, but not which frames were slow or
+what they were busy with. A Profiler times named sections of every frame instead (handling events, updating the
+state, simulating a throw, rendering, rendering text and pushing it to the display) and keeps the last few seconds of
+frames to work out the frame rate and a histogram of how long frames took. An Overlay shows those in a corner of the
+screen while playing, and the Profiler can write every frame to a CSV file to go through afterwards.
+
+None of it costs anything unless asked for: the game times its sections on NULL_PROFILER otherwise, whose sections do
+nothing.
+"""
+
+from __future__ import with_statement
+
+import time
+import logging
+
+import pygame
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+SECTIONS = ('events', 'update', 'shot', 'render', 'text', 'flip')
+"""What the game times. Sections can be inside other sections, like text inside render, and their times are
+included in those of the sections they are in."""
+
+
+class _NullSection(object):
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		return False
+
+
+class NullProfiler(object):
+	"""A Profiler that doesn't time anything"""
+
+	enabled = False
+	_section = _NullSection()
+
+	def section(self, name):
+		return self._section
+
+	def endFrame(self, frameTime):
+		pass
+
+	def close(self):
+		pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Section(object):
+
+	def __init__(self, profiler, name):
+		self._profiler = profiler
+		self._name = name
+		self._start = None
+
+	def __enter__(self):
+		self._start = self._profiler.clock()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self._profiler.add(self._name, self._profiler.clock() - self._start)
+		return False
+
+
+class Profiler(object):
+	"""Times the sections of each frame, keeping the last sampleCount frames as (end, frameTime, sectionTimes)
+	samples, sectionTimes being in the same order as sections. Whatever is timed between one endFrame() and the next
+	counts towards the frame ended by the next.
+
+	If there is an exportFile, every frame is also written to it, as CSV with a header row.
+
+	>>> now = [0.0]
+	>>> profiler = Profiler(('update', 'render'), clock=lambda: now[0])
+	>>> for frameTime in (0.004, 0.012, 0.030):
+	... 	with profiler.section('update'):
+	... 		now[0] += frameTime / 4
+	... 	with profiler.section('render'):
+	... 		now[0] += frameTime * 3 / 4
+	... 	profiler.endFrame(frameTime)
+	>>> round(profiler.fps(), 1)
+	47.6
+	>>> [(name, round(seconds * 1000, 2)) for name, seconds in profiler.averages()]
+	[('update', 3.83), ('render', 11.5)]
+	>>> profiler.histogram(bucketSize=0.01, bucketCount=3)
+	[1, 1, 1]
+	"""
+
+	enabled = True
+
+	def __init__(self, sections=SECTIONS, sampleCount=120, clock=time.time, exportFile=None):
+		self.sections = tuple(sections)
+		self.sampleCount = sampleCount
+		self.clock = clock
+		self.samples = []
+		self.frames = 0
+		self._indices = dict((name, i) for i, name in enumerate(self.sections))
+		self._current = [0.0] * len(self.sections)
+		self._exportFile = exportFile
+		if exportFile is not None:
+			exportFile.write(",".join(("frame", "end", "frame_ms") + tuple("%s_ms" % name for name in self.sections)) + "\n")
+
+	@classmethod
+	def export(cls, path, **kwds):
+		"""A Profiler writing every frame to the file at path"""
+		return cls(exportFile=open(path, "w"), **kwds)
+
+	def section(self, name):
+		"""A context manager timing what is done inside it as name, which has to be one of sections"""
+		return _Section(self, name)
+
+	def add(self, name, seconds):
+		self._current[self._indices[name]] += seconds
+
+	def endFrame(self, frameTime):
+		"""Ends the frame, which took frameTime seconds all told, and starts the next"""
+		sample = (self.clock(), frameTime, self._current)
+		self._current = [0.0] * len(self.sections)
+		self.samples.append(sample)
+		del self.samples[:-self.sampleCount]
+		self.frames += 1
+		if self._exportFile is not None:
+			self._exportFile.write("%d,%.6f,%.3f,%s\n" % (
+				self.frames, sample[0], frameTime * 1000, ",".join(["%.3f" % (seconds * 1000) for seconds in sample[2]]),
+			))
+
+	def fps(self):
+		"""Frames a second over the samples, going by when they ended"""
+		if len(self.samples) < 2:
+			return 0.0
+		seconds = self.samples[-1][0] - self.samples[0][0]
+		if seconds <= 0:
+			return 0.0
+		return (len(self.samples) - 1) / seconds
+
+	def averages(self):
+		"""(name, average seconds a frame) for each section, over the samples"""
+		if not self.samples:
+			return [(name, 0.0) for name in self.sections]
+		totals = [0.0] * len(self.sections)
+		for end, frameTime, sectionTimes in self.samples:
+			for i, seconds in enumerate(sectionTimes):
+				totals[i] += seconds
+		return [(name, total / len(self.samples)) for name, total in zip(self.sections, totals)]
+
+	def histogram(self, bucketSize=0.005, bucketCount=8):
+		"""How many of the samples' frames took how long, in buckets bucketSize seconds wide, the last bucket taking
+		everything that didn't fit in the others"""
+		counts = [0] * bucketCount
+		for end, frameTime, sectionTimes in self.samples:
+			counts[min(int(frameTime / bucketSize), bucketCount - 1)] += 1
+		return counts
+
+	def close(self):
+		if self._exportFile is not None:
+			self._exportFile.close()
+			self._exportFile = None
+
+
+class Overlay(object):
+	"""Shows what profiler has, the frame rate, the average time of each section and a histogram of frame times, in a
+	box at topleft of surface, redrawing it every frame but only working out what is in it every refresh seconds.
+
+	The StateMachine calls draw() just before flipping and erase() just after, so the overlay is only ever on the
+	surface while it is flipped. Whatever the states draw, in render() or anywhere else, goes onto what they left,
+	and the only dirty rects the overlay adds are its own, put back again by the next flip."""
+
+	WIDTH = 170
+	BAR_HEIGHT = 30
+
+	def __init__(self, surface, profiler, font, dirtyRects, topleft=(0, 0), refresh=0.25, fgcol=(255, 255, 255), bgcol=(0, 0, 0)):
+		self._surface = surface
+		self._profiler = profiler
+		self._font = font
+		self._dirtyRects = dirtyRects
+		self._topleft = topleft
+		self._refresh = refresh
+		self._fgcol = fgcol
+		self._bgcol = bgcol
+		self._box = None
+		self._lastRefresh = None
+		self._under = None
+		self._rect = None
+
+	def erase(self):
+		"""Puts back what was under the overlay"""
+		if self._under is not None:
+			self._dirtyRects.add(self._surface.blit(self._under, self._rect))
+			self._under = None
+
+	def draw(self):
+		now = self._profiler.clock()
+		if self._box is None or self._refresh <= now - self._lastRefresh:
+			self._box = self._makeBox()
+			self._lastRefresh = now
+		self._rect = self._box.get_rect(topleft=self._topleft).clip(self._surface.get_rect())
+		self._under = self._surface.subsurface(self._rect).copy()
+		self._dirtyRects.add(self._surface.blit(self._box, self._rect))
+
+	def _makeBox(self):
+		profiler = self._profiler
+		lines = ["%.1f fps" % profiler.fps()]
+		if profiler.samples:
+			frameTimes = [frameTime for end, frameTime, sectionTimes in profiler.samples]
+			lines[0] += ", %.1f ms, max %.1f ms" % (sum(frameTimes) / len(frameTimes) * 1000, max(frameTimes) * 1000)
+		for name, seconds in profiler.averages():
+			lines.append("%-7s %6.2f ms" % (name, seconds * 1000))
+		# Straight from the font rather than through a display.TextCache, which would fill up with numbers that are
+		# never drawn again
+		rendered = [self._font.render(line, False, self._fgcol, self._bgcol) for line in lines]
+		lineHeight = max([text.get_height() for text in rendered])
+
+		box = pygame.Surface((self.WIDTH, lineHeight * len(rendered) + self.BAR_HEIGHT + 4))
+		box.fill(self._bgcol)
+		for i, text in enumerate(rendered):
+			box.blit(text, (2, i * lineHeight))
+
+		counts = profiler.histogram()
+		barWidth = (self.WIDTH - 4) // len(counts)
+		tallest = max(max(counts), 1)
+		bottom = box.get_height() - 2
+		for i, count in enumerate(counts):
+			height = int(round(float(count) / tallest * self.BAR_HEIGHT))
+			if height:
+				box.fill(self._fgcol, (2 + i * barWidth, bottom - height, barWidth - 1, height))
+		return box
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""Seeing how many games a server.py can take.
+
+Bots join the server two by two and throw at random whenever it is their turn, all from one select() loop, and as
+soon as a game is over they join another one. How long each throw takes to come back as a result is the turn's
+latency, so what comes out is how many turns a second the server got through and how long players were kept
+waiting, as the 99th percentile as much as the median, since what players notice is the slow turns.
+
+	python loadtest.py --games 200 --duration 30 --local
+"""
+
+from __future__ import with_statement
+
+import sys
+import time
+import random
+import select
+import logging
+import optparse
+
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+import replay
+import server
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class LoadStats(object):
+
+	def __init__(self):
+		self.turns = 0
+		self.games = 0
+		self.dropped = 0
+		self.latencies = []
+		self.seconds = 0.0
+
+	def percentile(self, percent):
+		"""The latency percent of the turns came back within, in seconds
+
+		>>> stats = LoadStats()
+		>>> stats.latencies = [0.001 * i for i in range(1, 101)]
+		>>> stats.percentile(50), stats.percentile(99)
+		(0.05, 0.099)
+		"""
+		if not self.latencies:
+			return 0.0
+		latencies = sorted(self.latencies)
+		index = min(int(len(latencies) * percent / 100.0 + 0.5), len(latencies)) - 1
+		return latencies[max(index, 0)]
+
+	def lines(self):
+		return [
+			"%d turns in %.1f seconds, %.1f turns a second" % (
+				self.turns, self.seconds, self.turns / max(self.seconds, 1e-6),
+			),
+			"%d games finished, %d dropped" % (self.games, self.dropped),
+			"Turn latency: median %.2f ms, p99 %.2f ms, max %.2f ms" % (
+				self.percentile(50) * 1000, self.percentile(99) * 1000, self.percentile(100) * 1000,
+			),
+		]
+
+
+class Bot(object):
+	"""A player that joins games on the server at address one after the other, throwing at random"""
+
+	def __init__(self, address, name, stats, rng):
+		self.connection = None
+		self._address = address
+		self._name = name
+		self._stats = stats
+		self._rng = rng
+		self._playerNum = None
+		self._turn = None
+		self._sentAt = None
+
+	def join(self):
+		self.connection = server.Connection(server.connect(self._address))
+		self.connection.send(server.JOIN, self._name)
+		self._playerNum = None
+		self._sentAt = None
+
+	def handle(self, kind, values, now):
+		if kind == server.SEATED:
+			self._playerNum, = values
+			self._turn = 1
+		elif kind == server.RESULT:
+			if self._sentAt is not None:
+				self._stats.latencies.append(now - self._sentAt)
+				self._stats.turns += 1
+				self._sentAt = None
+			self._turn = 3 - self._turn
+		elif kind == server.OVER:
+			winner, = values
+			if winner == 0:
+				self._stats.dropped += 1
+			elif self._playerNum == 1:
+				self._stats.games += 1
+			self._playerNum = None
+			return
+		if self._playerNum == self._turn and self._sentAt is None:
+			self.connection.send(replay.SHOT, self._playerNum, self._throwAngle(), float(self._rng.randint(30, 90)))
+			self._sentAt = now
+
+	def _throwAngle(self):
+		angle = float(self._rng.randint(20, 80))
+		if self._playerNum == 2:
+			return 180 - angle
+		return angle
+
+
+def run(address, games, duration, rng=random):
+	"""Plays games games at once on the server at address for duration seconds, returning the LoadStats"""
+	stats = LoadStats()
+	bots = [Bot(address, u"bot%d" % i, stats, rng) for i in xrange(2 * games)]
+	for bot in bots:
+		bot.join()
+	start = time.time()
+	end = start + duration
+	while time.time() < end:
+		connections = [bot.connection for bot in bots]
+		writers = [connection for connection in connections if connection.wantsToWrite]
+		readable, writable, exceptional = select.select(connections, writers, [], max(end - time.time(), 0))
+		for connection in writable:
+			connection.flush()
+		now = time.time()
+		for bot in bots:
+			if bot.connection in readable:
+				for kind, values in bot.connection.receive():
+					bot.handle(kind, values, now)
+			if bot.connection.closed and time.time() < end:
+				bot.join()
+	stats.seconds = time.time() - start
+	for bot in bots:
+		bot.connection.close()
+	return stats
+
+
+def main(args):
+	parser = optparse.OptionParser(usage="%prog [options]", description="Puts a game server under load and reports how it held up")
+	parser.add_option("--host", default="127.0.0.1", help="[%default]")
+	parser.add_option("--port", type="int", default=server.PORT, help="[%default]")
+	parser.add_option("-n", "--games", type="int", default=100, help="Games to keep going at once [%default]")
+	parser.add_option("--duration", type="float", default=10.0, help="Seconds to keep it up for [%default]")
+	parser.add_option("--local", action="store_true", default=False, help="Start a server here to test, on a free port")
+	parser.add_option("-j", "--processes", type="int", default=None, help="Worker processes of the local server [as many as there are CPUs]")
+	options, args = parser.parse_args(args)
+
+	address = (options.host, options.port)
+	process = None
+	if options.local:
+		if multiprocessing is None:
+			parser.error("--local needs the multiprocessing module")
+		listener = server.listen(0, options.host)
+		address = listener.getsockname()
+		process = multiprocessing.Process(target=server.serve, args=(listener, options.processes))
+		process.start()
+		listener.close()
+		"""Not a daemon, as those can't start worker processes of their own. Once the lobby is gone, the workers
+		finish up once their games are over."""
+
+	try:
+		stats = run(address, options.games, options.duration)
+	finally:
+		if process is not None:
+			process.terminate()
+	for line in stats.lines():
+		print line
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""The rules of a game, with nothing drawn.
+
+Whose turn it is, what a throw does to the city and who scores used to be worked out along the way in game_loop(),
+in between drawing. A Match keeps track of all of that on its own, so the game, replays and anything else that wants
+to play a game through (without pygame, even) go by the same rules.
+"""
+
+from __future__ import with_statement
+
+import logging
+
+import simulation
+import worldgen
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class Match(object):
+	"""A game between two players, played to winPoints.
+
+	"recorder", if there is one, is told about everything that happens that can't be worked out again from what
+	came before it: the game's settings with game(), each round's seed with round() and every throw with shot(). See
+	replay.Recorder.
+
+	>>> match = Match('Player 1', 'Player 2', 1, 9.8)
+	>>> match.needsRound, match.isOver
+	(True, False)
+	>>> city = match.newRound(seed=7)
+	>>> match.turn, match.needsRound
+	(1, False)
+	>>> shot = match.throw(45, 10)
+	>>> shot.outcome, match.turn, match.scores, match.needsRound
+	('gorilla1', 2, [0, 1], True)
+	>>> match.isOver, match.winner
+	(True, 2)
+	"""
+
+	def __init__(self, p1name, p2name, winPoints, gravity, recorder=None):
+		self.names = [p1name, p2name]
+		self.winPoints = winPoints
+		self.gravity = gravity
+		self.scores = [0, 0]
+		self.turn = 1
+		self.city = None
+		self.needsRound = True
+		self._recorder = recorder
+		if recorder is not None:
+			recorder.game(p1name, p2name, winPoints, gravity)
+
+	@property
+	def isOver(self):
+		return self.winPoints <= max(self.scores)
+
+	@property
+	def winner(self):
+		"""1 or 2 for whoever won, None if nobody has yet"""
+		if not self.isOver:
+			return None
+		if self.scores[0] > self.scores[1]:
+			return 1
+		return 2
+
+	def newRound(self, city=None, seed=None):
+		"""Starts a new round in city, a worldgen.CityState, or in a new one made from seed if there is no city"""
+		if city is None:
+			city = worldgen.CityState(worldgen.generateWorld(seed))
+		self.city = city
+		self.needsRound = False
+		if self._recorder is not None:
+			self._recorder.round(city.world.seed)
+		return city
+
+	def throw(self, angle, velocity):
+		"""Throws for whoever's turn it is and returns the simulation.ShotResult. The explosions are blown out of the
+		city straight away, the score is updated and the turn goes to the other player.
+
+		"angle" is the angle on the screen, so 180 - what player 2 typed in."""
+		playerNum = self.turn
+		gor1, gor2 = self.city.world.gorillas
+		shot = simulation.simulateShot(
+			angle, velocity, playerNum, self.city.world.wind, self.gravity, gor1, gor2, self.city.mask
+		)
+		if self._recorder is not None:
+			self._recorder.shot(playerNum, angle, velocity)
+
+		for x, y, radius in simulation.craters(shot):
+			self.city.addCrater(x, y, radius)
+
+		if shot.outcome == simulation.GORILLA1:
+			self.scores[1] += 1
+			self.needsRound = True
+		elif shot.outcome == simulation.GORILLA2:
+			self.scores[0] += 1
+			self.needsRound = True
+
+		self.turn = {
+			1: 2,
+			2: 1,
+		}[self.turn]
+		return shot
@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+
+"""Playing a game between two devices.
+
+A throw is all in its (angle, velocity) and a round is all in its seed (see replay), so the two sides of a network
+game don't need to share anything else: each plays the game through its own match.Match and they send each other
+the same records a replay is made of, a few bytes a turn. The host (player 1) decides on the settings and the
+seeds, and each side sends its own player's throws.
+
+Sockets are non-blocking and driven by poll(), which the game calls every time around its loop, so nothing ever
+waits on the network. A connection that drops, or goes quiet for longer than DEAD_AFTER, is made again by the
+client, and each side then resends whatever records the other says it is missing, so a game carries on where it
+was. Pings going back and forth the whole time keep track of the latency. Anything from the other side that makes no
+sense hangs up for good instead, with the reason in "error", as there is no telling what state the other side is in.
+
+Every message is framed by its length (uint16), then is either one of the control messages below or a replay
+record, each being its kind's character followed by little-endian fields:
+
+	"h" hello	session (uint64), records received so far (uint32)
+	"p" ping	the sender's clock (double)
+	"o" pong	the clock from the ping being answered (double)
+"""
+
+from __future__ import with_statement
+
+import time
+import errno
+import random
+import select
+import socket
+import struct
+import logging
+
+import replay
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+PORT = 4231
+POLL_INTERVAL = 0.05
+PING_INTERVAL = 1.0
+DEAD_AFTER = 10.0
+RECONNECT_DELAY = 1.0
+LATENCY_SAMPLES = 10
+
+HELLO = 'h'
+PING = 'p'
+PONG = 'o'
+
+_CONTROL = {
+	HELLO: struct.Struct('<QI'),
+	PING: struct.Struct('<d'),
+	PONG: struct.Struct('<d'),
+}
+_LENGTH = struct.Struct('<H')
+
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS, errno.EINTR)
+
+
+class NetworkError(Exception):
+	pass
+
+
+def frame(data):
+	"""A message as it goes over the network, with its length in front"""
+	return _LENGTH.pack(len(data)) + data
+
+
+def unframe(data):
+	"""Splits what has come in so far into the whole messages in it and what is left of one that is still coming in
+
+	>>> unframe(frame('ab') + frame('') + frame('cde')[:3])
+	(['ab', ''], '\\x03\\x00c')
+	"""
+	messages = []
+	while _LENGTH.size <= len(data):
+		length, = _LENGTH.unpack(data[:_LENGTH.size])
+		end = _LENGTH.size + length
+		if len(data) < end:
+			break
+		messages.append(data[_LENGTH.size:end])
+		data = data[end:]
+	return messages, data
+
+
+class Peer(object):
+	"""One end of a network game, see Host and Client.
+
+	Records are sent with send() and the other side's come out of nextRecord(), in order, with nothing lost or
+	repeated however many times the connection had to be made again in between. Neither they nor poll() raise
+	anything over what the other side sent, they fail() instead.
+
+	>>> host = Host(port=0, address='127.0.0.1')
+	>>> client = Client('127.0.0.1', host.port)
+	>>> pollUntil([host, client], lambda: host.connected and client.connected)
+	True
+	>>> client.nextRecord(replay.SHOT) is None
+	True
+	>>> host.send(replay.ROUND, (42, ))
+	>>> client._drop("Pulling the plug")
+	>>> host.send(replay.SHOT, (1, 45.0, 50.0))
+	>>> pollUntil([host, client], lambda: client.connections == 2 and client.connected)
+	True
+	>>> pollUntil([host, client], lambda: len(client._records) == 2)
+	True
+	>>> client.nextRecord(replay.ROUND), client.nextRecord(replay.SHOT)
+	((42,), (1, 45.0, 50.0))
+	>>> pollUntil([host, client], lambda: client.latency is not None)
+	True
+	>>> host._queue(replay.ROUND + 'x')
+	>>> pollUntil([host, client], lambda: client.error)
+	True
+	>>> client.error, client.nextRecord(replay.ROUND), client._socket
+	("'r' record of 2 bytes", None, None)
+	>>> host.close(); client.close()
+	"""
+
+	def __init__(self, clock=time.time):
+		self.sessionId = 0
+		self.connections = 0
+		self.latencies = []
+		"""The round trip times of the last LATENCY_SAMPLES pings, in seconds."""
+		self._clock = clock
+		self._socket = None
+		self._connecting = False
+		self._synced = False
+		self._in = ''
+		self._out = ''
+		self._log = []
+		self._received = 0
+		self._records = []
+		self._lastHeard = 0.0
+		self._lastPing = 0.0
+		self._retryAt = 0.0
+		self._closed = False
+		self.error = None
+		"""Why the other side was hung up on, if it sent something it shouldn't have."""
+
+	@property
+	def connected(self):
+		"""Whether there is a connection and both sides have said hello on it"""
+		return self._synced
+
+	@property
+	def latency(self):
+		"""The average round trip time of the last few pings, in seconds, or None before the first one"""
+		if not self.latencies:
+			return None
+		return sum(self.latencies) / len(self.latencies)
+
+	def send(self, kind, values):
+		"""Sends the replay record of kind, values being its fields as replay.Reader gives them"""
+		data = replay.encodeRecord(kind, values)
+		self._log.append(data)
+		if self._synced:
+			self._queue(data)
+
+	def nextRecord(self, kind):
+		"""The fields of the next record from the other side, which has to be of kind, or None if it hasn't come in
+		yet"""
+		if not self._records:
+			return None
+		recordKind, values = self._records[0]
+		if recordKind != kind:
+			self.fail("Expected a %r record, got %r" % (kind, recordKind))
+			return None
+		del self._records[0]
+		return values
+
+	def poll(self, timeout=0):
+		"""Does whatever sending, receiving and (re)connecting can be done, waiting up to timeout seconds for the
+		network if there is nothing to do yet"""
+		self._keepUp(self._clock())
+		sock = self._socket
+		readers = self._listeners()
+		writers = []
+		if sock is not None:
+			if self._connecting or self._out:
+				writers.append(sock)
+			if not self._connecting:
+				readers.append(sock)
+		if not readers and not writers:
+			return
+		try:
+			readable, writable, exceptional = select.select(readers, writers, [], timeout)
+		except select.error, e:
+			if e.args[0] == errno.EINTR:
+				return
+			raise
+
+		for listener in self._listeners():
+			if listener in readable:
+				self._accept(listener)
+		if sock is None or sock is not self._socket:
+			return
+		if sock in writable:
+			if self._connecting:
+				self._connected()
+			else:
+				self._flush()
+		if sock in readable and sock is self._socket:
+			self._receive()
+
+	def close(self):
+		"""Hangs up for good"""
+		self._closed = True
+		if self._socket is not None:
+			self._drop("Closing")
+
+	def fail(self, reason):
+		"""Hangs up for good because the other side broke the rules, reason saying how"""
+		_moduleLogger.error("Giving up on the other side: %s" % reason)
+		if self.error is None:
+			self.error = reason
+		self._records = []
+		self.close()
+
+	def _listeners(self):
+		return []
+
+	def _accept(self, listener):
+		pass
+
+	def _reconnect(self, now):
+		pass
+
+	def _keepUp(self, now):
+		if self._socket is None:
+			if not self._closed and self._retryAt <= now:
+				self._reconnect(now)
+		elif DEAD_AFTER < now - self._lastHeard:
+			self._drop("Nothing heard for %.1f seconds" % (now - self._lastHeard))
+		elif self._synced and PING_INTERVAL <= now - self._lastPing:
+			self._lastPing = now
+			self._queueControl(PING, (now, ))
+
+	def _attach(self, sock):
+		"""Starts talking over sock, a newly made connection"""
+		sock.setblocking(0)
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		"""The messages are tiny and each one is waited on, so they go out straight away instead of being held back
+		to be sent with more."""
+		self._socket = sock
+		self._connecting = False
+		self._synced = False
+		self._in = ''
+		self._out = ''
+		self._lastHeard = self._clock()
+		self.connections += 1
+		self._queueControl(HELLO, (self.sessionId, self._received))
+
+	def _drop(self, reason):
+		_moduleLogger.info("Dropping connection: %s" % reason)
+		try:
+			self._socket.close()
+		except socket.error:
+			pass
+		self._socket = None
+		self._connecting = False
+		self._synced = False
+		self._retryAt = self._clock() + RECONNECT_DELAY
+
+	def _queue(self, data):
+		self._out += frame(data)
+
+	def _queueControl(self, kind, values):
+		self._queue(kind + _CONTROL[kind].pack(*values))
+
+	def _connected(self):
+		error = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+		if error:
+			self._drop("Could not connect: %s" % errno.errorcode.get(error, error))
+		else:
+			self._attach(self._socket)
+
+	def _flush(self):
+		try:
+			sent = self._socket.send(self._out)
+		except socket.error, e:
+			if e.args[0] not in _WOULD_BLOCK:
+				self._drop("Could not send: %s" % (e, ))
+			return
+		self._out = self._out[sent:]
+
+	def _receive(self):
+		try:
+			data = self._socket.recv(4096)
+		except socket.error, e:
+			if e.args[0] not in _WOULD_BLOCK:
+				self._drop("Could not receive: %s" % (e, ))
+			return
+		if not data:
+			self._drop("Closed by the other side")
+			return
+		self._lastHeard = self._clock()
+		messages, self._in = unframe(self._in + data)
+		for message in messages:
+			try:
+				self._handle(message)
+			except NetworkError, e:
+				self.fail(str(e))
+			if self._socket is None:
+				break
+
+	def _handle(self, message):
+		kind = message[:1]
+		if kind in _CONTROL:
+			fields = _CONTROL[kind]
+			if len(message) != 1 + fields.size:
+				raise NetworkError("%r message of %d bytes" % (kind, len(message)))
+			values = fields.unpack(message[1:])
+			if kind == HELLO:
+				self._hello(*values)
+			elif kind == PING:
+				self._queueControl(PONG, values)
+			elif kind == PONG:
+				self.latencies.append(self._clock() - values[0])
+				del self.latencies[:-LATENCY_SAMPLES]
+			return
+
+		if not self._synced:
+			raise NetworkError("%r record before hello" % kind)
+		try:
+			record = replay.decodeRecord(message)
+		except replay.ReplayError, e:
+			raise NetworkError(str(e))
+		self._received += 1
+		self._records.append(record)
+
+	def _hello(self, sessionId, received):
+		"""Resends whatever the other side hasn't got, the connection having been made again if it has got any"""
+		if len(self._log) < received:
+			raise NetworkError("Other side has %d records, only %d were sent" % (received, len(self._log)))
+		for data in self._log[received:]:
+			self._queue(data)
+		self._synced = True
+		self._lastPing = 0.0
+		_moduleLogger.info("Connected, resending %d records" % (len(self._log) - received))
+
+
+class Host(Peer):
+	"""The side that waits for the other to connect, on port. It makes up the session, so a client from another
+	game can't join this one. A new connection replaces the old one, as that is how the client reconnects."""
+
+	def __init__(self, port=PORT, address='', clock=time.time):
+		Peer.__init__(self, clock)
+		self.sessionId = random.randint(1, 2 ** 64 - 1)
+		self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._listener.bind((address, port))
+		self._listener.listen(1)
+		self._listener.setblocking(0)
+
+	@property
+	def port(self):
+		return self._listener.getsockname()[1]
+
+	def close(self):
+		Peer.close(self)
+		self._listener.close()
+
+	def _listeners(self):
+		return [self._listener]
+
+	def _accept(self, listener):
+		try:
+			sock, address = listener.accept()
+		except socket.error, e:
+			return
+		_moduleLogger.info("Connection from %s:%d" % address)
+		if self._socket is not None:
+			self._drop("Replaced by a new connection")
+		self._attach(sock)
+
+	def _hello(self, sessionId, received):
+		if sessionId not in (0, self.sessionId):
+			self._drop("Client is from another game")
+			return
+		Peer._hello(self, sessionId, received)
+
+
+class Client(Peer):
+	"""The side that connects to the host at address, port, again and again until the game is over"""
+
+	def __init__(self, address, port=PORT, clock=time.time):
+		Peer.__init__(self, clock)
+		self._address = (socket.gethostbyname(address), port)
+
+	def _reconnect(self, now):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.setblocking(0)
+		error = sock.connect_ex(self._address)
+		if error and error not in _WOULD_BLOCK:
+			sock.close()
+			self._retryAt = now + RECONNECT_DELAY
+			return
+		self._socket = sock
+		self._connecting = True
+		self._lastHeard = now
+		"""Connecting gets as long as a quiet connection before it is given up on."""
+
+	def _hello(self, sessionId, received):
+		if self.sessionId == 0:
+			self.sessionId = sessionId
+		elif sessionId != self.sessionId:
+			raise NetworkError("The host has started another game")
+		Peer._hello(self, sessionId, received)
+
+
+class LockstepRecorder(object):
+	"""The recorder for the match.Match of a game played over peer, localPlayer being 1 on the host and 2 on the
+	client. It sends the settings and seeds if this is the host, and the local player's throws, which is everything
+	the other side needs to play the same game. What the other side sent is played through the match like anything
+	else, and everything is passed on to recorder as well, if there is one, so network games get recorded too.
+
+	>>> import match
+	>>> host = Host(port=0, address='127.0.0.1')
+	>>> client = Client('127.0.0.1', host.port)
+	>>> hostMatch = match.Match(u'Al', u'Bo', 1, 9.8, LockstepRecorder(host, 1))
+	>>> city = hostMatch.newRound(seed=7)
+	>>> pollUntil([host, client], lambda: len(client._records) == 2)
+	True
+	>>> clientMatch = match.Match(*client.nextRecord(replay.GAME), **{'recorder': LockstepRecorder(client, 2)})
+	>>> city = clientMatch.newRound(seed=client.nextRecord(replay.ROUND)[0])
+	>>> hostMatch.throw(45, 85).outcome
+	'miss'
+	>>> pollUntil([host, client], lambda: client._records)
+	True
+	>>> clientMatch.throw(*client.nextRecord(replay.SHOT)[1:]).outcome
+	'miss'
+	>>> clientMatch.throw(135, 10).outcome
+	'gorilla2'
+	>>> pollUntil([host, client], lambda: host._records)
+	True
+	>>> hostMatch.throw(*host.nextRecord(replay.SHOT)[1:]).outcome
+	'gorilla2'
+	>>> hostMatch.scores == clientMatch.scores == [1, 0]
+	True
+	>>> host.close(); client.close()
+	"""
+
+	def __init__(self, peer, localPlayer, recorder=None):
+		self._peer = peer
+		self._localPlayer = localPlayer
+		self._recorder = recorder
+
+	def game(self, p1name, p2name, winPoints, gravity):
+		if self._localPlayer == 1:
+			self._peer.send(replay.GAME, (p1name, p2name, winPoints, gravity))
+		if self._recorder is not None:
+			self._recorder.game(p1name, p2name, winPoints, gravity)
+
+	def round(self, seed):
+		if self._localPlayer == 1:
+			self._peer.send(replay.ROUND, (seed, ))
+		if self._recorder is not None:
+			self._recorder.round(seed)
+
+	def shot(self, playerNum, angle, velocity):
+		if playerNum == self._localPlayer:
+			self._peer.send(replay.SHOT, (playerNum, angle, velocity))
+		if self._recorder is not None:
+			self._recorder.shot(playerNum, angle, velocity)
+
+
+def pollUntil(peers, condition, timeout=5.0):
+	"""Polls peers until condition() is true or timeout seconds are up, returning whether it came true"""
+	end = time.time() + timeout
+	while not condition() and time.time() < end:
+		for peer in peers:
+			peer.poll(0.01)
+	return bool(condition())
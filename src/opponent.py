@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+"""A computer player, which works out where to throw instead of asking.
+
+Candidate throws are evaluated a few hundred at a time with trajectory.sampleArcs(): a coarse grid over all of
+(angle, velocity) first, then finer and finer grids around the throws that came closest, for as long as the time
+budget allows. What is left of the budget goes to checking the best of them with simulation.simulateShot(), which
+is exact, so a throw reported as a hit really is one. A difficulty level then decides how much the throw actually
+made misses what was aimed for.
+"""
+
+from __future__ import with_statement
+
+import time
+import random
+import logging
+
+import numpy
+
+import simulation
+import trajectory
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+EASY = 'easy'
+MEDIUM = 'medium'
+HARD = 'hard'
+PERFECT = 'perfect'
+
+NOISE = {
+	EASY: (8.0, 12.0),
+	MEDIUM: (3.0, 5.0),
+	HARD: (1.0, 1.5),
+	PERFECT: (0.0, 0.0),
+}
+"""Standard deviations of the (angle, velocity) noise added to a throw for each difficulty."""
+
+MIN_ANGLE, MAX_ANGLE = 0.0, 90.0
+MIN_VELOCITY, MAX_VELOCITY = 10.0, 200.0
+COARSE_ANGLES = 19
+COARSE_VELOCITIES = 20
+COARSE_CHUNKS = 4
+"""The coarse grid is evaluated a quarter at a time, every fourth throw of it, so running out of time part way still
+leaves throws from all over the grid."""
+REFINE_CANDIDATES = 6
+REFINE_POINTS = 5
+
+BUDGET = 0.005
+SEARCH_TIME_STEP = 0.2
+"""The search only has to rank throws, so it samples arcs half as often as the game does. The simulateShot() check
+at the end uses the game's own step."""
+
+
+class Candidate(object):
+	"""A throw that was looked at.
+
+	"angle" is what the player would type in and "velocity" how hard they throw. "hit" is whether it hits the other
+	gorilla and "distance" how far from the middle of the other gorilla it ended up, which makes for a safer hit the
+	smaller it is. "verified" is whether the hit or miss came from simulation.simulateShot() rather than the search's
+	estimate.
+	"""
+
+	def __init__(self, angle, velocity, hit, distance, verified=False):
+		self.angle = angle
+		self.velocity = velocity
+		self.hit = hit
+		self.distance = distance
+		self.verified = verified
+
+	def __repr__(self):
+		return "<Candidate %.1f degrees at %.1f, %s %.1f away%s>" % (
+			self.angle,
+			self.velocity,
+			self.hit and "hit" or "miss",
+			self.distance,
+			self.verified and ", verified" or "",
+		)
+
+
+def worldAngle(playerNum, angle):
+	"""Player 2 throws to the left, so the angle they type in is mirrored, like gorilla_pygame.ShotScreen does"""
+	if playerNum == 2:
+		return 180 - angle
+	return angle
+
+
+def evaluate(angles, velocities, playerNum, wind, gravity, gor1, gor2, skyline, timeStep=SEARCH_TIME_STEP):
+	"""Estimates where each of the throws by playerNum ends up, with angles being what the player would type in.
+	Returns (hits, distances), arrays saying whether each one hits the other gorilla and how far from its middle the
+	banana ended up (infinitely far if it hit the thrower). skyline is a collision.SkylineMask.
+
+	The banana is only checked at the sampled positions, and only its corners against the buildings, which is close
+	enough to rank throws by."""
+	angles = numpy.asarray(angles, dtype=float)
+	velocities = numpy.asarray(velocities, dtype=float)
+	startx, starty = simulation.throwOrigin(playerNum, gor1, gor2)
+	arcs = trajectory.sampleArcs(
+		startx, starty, worldAngle(playerNum, angles), velocities, wind, gravity, timeStep=timeStep
+	)
+	lengths = arcs.lengths
+	starts = numpy.concatenate(([0], lengths.cumsum()[:-1]))
+	rows = numpy.repeat(numpy.arange(len(lengths)), lengths)
+	steps = numpy.arange(lengths.sum()) - numpy.repeat(starts, lengths)
+	x = arcs.x[rows, steps]
+	y = arcs.y[rows, steps]
+	"""Only the samples in flight are looked at, all of the throws' samples one after another in a flat array, as
+	most throws come down long before the slowest one does."""
+
+	banWidth, banHeight = simulation.BAN_SIZES[simulation.UP]
+	lefts = x.astype(int)
+	tops = y.astype(int)
+	solid = numpy.zeros(len(x), dtype=bool)
+	for cornerX, cornerY in ((lefts, tops), (lefts + banWidth - 1, tops), (lefts, tops + banHeight - 1), (lefts + banWidth - 1, tops + banHeight - 1)):
+		onGrid = (0 <= cornerX) & (cornerX < skyline.width) & (0 <= cornerY) & (cornerY < skyline.height)
+		solid[onGrid] |= skyline.solid[cornerY[onGrid], cornerX[onGrid]]
+
+	if playerNum == 1:
+		target, own = gor2, gor1
+	else:
+		target, own = gor1, gor2
+	gorWidth, gorHeight = simulation.GOR_SIZE
+	hitTarget = (lefts < target[0] + gorWidth) & (target[0] < lefts + banWidth) & (tops < target[1] + gorHeight) & (target[1] < tops + banHeight)
+	hitOwn = (lefts < own[0] + gorWidth) & (own[0] < lefts + banWidth) & (tops < own[1] + gorHeight) & (own[1] < tops + banHeight)
+
+	ends = starts + lengths - 1
+	stopped = (solid | hitTarget | hitOwn).nonzero()[0]
+	stoppedRows, firstStops = numpy.unique(rows[stopped], return_index=True)
+	ends[stoppedRows] = stopped[firstStops]
+	"""Samples are in order, so the first of each throw's samples that hit something is where it stops."""
+
+	hits = hitTarget[ends]
+	distances = numpy.hypot(
+		x[ends] + (banWidth - gorWidth) / 2.0 - target[0], y[ends] + (banHeight - gorHeight) / 2.0 - target[1]
+	)
+	distances[hitOwn[ends] & ~hits] = numpy.inf
+	"""Hitting yourself is the worst throw there is."""
+	return hits, distances
+
+
+def _grid(angleRange, velocityRange, angleCount, velocityCount):
+	angles, velocities = numpy.meshgrid(
+		numpy.linspace(angleRange[0], angleRange[1], angleCount),
+		numpy.linspace(velocityRange[0], velocityRange[1], velocityCount),
+	)
+	return angles.ravel(), velocities.ravel()
+
+
+def _rank(hits, distances):
+	"""Indexes of the throws from best to worst: hits first, then by how close to the middle of the other gorilla"""
+	return numpy.lexsort((distances, ~hits))
+
+
+def findShots(playerNum, wind, gravity, gor1, gor2, skyline, budget=BUDGET, count=5):
+	"""Searches for throws by playerNum that hit the other gorilla and returns the best count of them as Candidates,
+	best first, stopping once budget seconds are up. If nothing hits, the list has the closest misses.
+
+	gor1 and gor2 are the (left, top) of each gorilla, as returned by placeGorillas(), and skyline is a
+	collision.SkylineMask. The first chunk of the coarse grid is always evaluated, so there is something to return,
+	and neither that nor checking a throw can be interrupted, so this can run over budget by that much.
+
+	>>> import collision
+	>>> skyline = collision.SkylineMask(simulation.SCR_WIDTH, simulation.SCR_HEIGHT)
+	>>> skyline.fillRect(0, 400, simulation.SCR_WIDTH, 80)
+	>>> gor1, gor2 = (100, 400 - simulation.GOR_SIZE[1]), (600, 400 - simulation.GOR_SIZE[1])
+	>>> best = findShots(2, -5, 9.8, gor1, gor2, skyline, budget=1.0)[0]
+	>>> best.hit, best.verified
+	(True, True)
+	>>> angle, velocity = Opponent(PERFECT, budget=1.0).getShot(2, -5, 9.8, gor1, gor2, skyline)
+	>>> simulation.simulateShot(angle, velocity, 2, -5, 9.8, gor1, gor2, skyline).outcome
+	'gorilla1'
+	"""
+	deadline = time.time() + budget
+	target = {1: simulation.GORILLA2, 2: simulation.GORILLA1}[playerNum]
+	angleStep = (MAX_ANGLE - MIN_ANGLE) / (COARSE_ANGLES - 1)
+	velocityStep = (MAX_VELOCITY - MIN_VELOCITY) / (COARSE_VELOCITIES - 1)
+	gridAngles, gridVelocities = _grid(
+		(MIN_ANGLE, MAX_ANGLE), (MIN_VELOCITY, MAX_VELOCITY), COARSE_ANGLES, COARSE_VELOCITIES
+	)
+	chunks = []
+	passTime = 0.0
+	for chunk in xrange(COARSE_CHUNKS):
+		if chunks and deadline <= time.time() + passTime:
+			break
+		passStart = time.time()
+		chunkAngles, chunkVelocities = gridAngles[chunk::COARSE_CHUNKS], gridVelocities[chunk::COARSE_CHUNKS]
+		chunks.append((chunkAngles, chunkVelocities) + evaluate(chunkAngles, chunkVelocities, playerNum, wind, gravity, gor1, gor2, skyline))
+		passTime = time.time() - passStart
+	"""Nothing is started that the time left won't cover, going by how long the last one took."""
+	angles, velocities, hits, distances = [numpy.concatenate(parts) for parts in zip(*chunks)]
+	verified = numpy.zeros(len(angles), dtype=bool)
+
+	while True:
+		best = _rank(hits, distances)[:max(count, REFINE_CANDIDATES)]
+		for i in best[:count]:
+			if not hits[i] or deadline <= time.time():
+				break
+			if not verified[i]:
+				shot = simulation.simulateShot(
+					worldAngle(playerNum, angles[i]), velocities[i], playerNum, wind, gravity, gor1, gor2, skyline
+				)
+				hits[i] = shot.outcome == target
+				verified[i] = True
+		"""Estimated hits are settled with the exact simulation as soon as they turn up. Any that turn out to miss
+		drop down the ranking, and the search carries on around whatever is best now."""
+		if verified[best[:count]].all() and hits[best[:count]].all():
+			break
+		if deadline <= time.time() + passTime or angleStep < 0.05:
+			break
+
+		best = _rank(hits, distances)[:REFINE_CANDIDATES]
+		angleStep /= REFINE_POINTS - 1
+		velocityStep /= REFINE_POINTS - 1
+		newAngles = []
+		newVelocities = []
+		for i in best:
+			gridAngles, gridVelocities = _grid(
+				(angles[i] - 2 * angleStep, angles[i] + 2 * angleStep),
+				(velocities[i] - 2 * velocityStep, velocities[i] + 2 * velocityStep),
+				REFINE_POINTS,
+				REFINE_POINTS,
+			)
+			newAngles.append(gridAngles)
+			newVelocities.append(gridVelocities)
+		newAngles = numpy.clip(numpy.concatenate(newAngles), MIN_ANGLE, MAX_ANGLE)
+		newVelocities = numpy.clip(numpy.concatenate(newVelocities), MIN_VELOCITY, MAX_VELOCITY)
+		passStart = time.time()
+		newHits, newDistances = evaluate(newAngles, newVelocities, playerNum, wind, gravity, gor1, gor2, skyline)
+		passTime = time.time() - passStart
+		angles = numpy.concatenate((angles[best], newAngles))
+		velocities = numpy.concatenate((velocities[best], newVelocities))
+		hits = numpy.concatenate((hits[best], newHits))
+		distances = numpy.concatenate((distances[best], newDistances))
+		verified = numpy.concatenate((verified[best], numpy.zeros(len(newAngles), dtype=bool)))
+
+	candidates = []
+	for i in _rank(hits, distances):
+		candidate = Candidate(float(angles[i]), float(velocities[i]), bool(hits[i]), float(distances[i]), bool(verified[i]))
+		if candidates and _isSameThrow(candidates[-1], candidate):
+			continue
+		candidates.append(candidate)
+		if len(candidates) == count:
+			break
+	return candidates
+
+
+def _isSameThrow(a, b):
+	return abs(a.angle - b.angle) < 1e-6 and abs(a.velocity - b.velocity) < 1e-6
+
+
+class Opponent(object):
+	"""A computer player of some difficulty, one of EASY, MEDIUM, HARD or PERFECT.
+
+	>>> Opponent('impossible')
+	Traceback (most recent call last):
+	...
+	KeyError: 'impossible'
+	"""
+
+	def __init__(self, difficulty=MEDIUM, budget=BUDGET, rng=None):
+		self._angleNoise, self._velocityNoise = NOISE[difficulty]
+		self.difficulty = difficulty
+		self._budget = budget
+		if rng is None:
+			rng = random.Random()
+		self._rng = rng
+
+	def getShot(self, playerNum, wind, gravity, gor1, gor2, skyline):
+		"""Returns the (angle, velocity) to throw, the same as gorilla_pygame.ShotScreen would for a person"""
+		candidates = findShots(playerNum, wind, gravity, gor1, gor2, skyline, self._budget, count=1)
+		best = candidates[0]
+		angle = best.angle + self._rng.gauss(0, self._angleNoise)
+		velocity = max(best.velocity + self._rng.gauss(0, self._velocityNoise), 1.0)
+		return worldAngle(playerNum, angle), velocity
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+
+"""Recording games and playing them back.
+
+A round is all in its seed (see worldgen) and a throw is all in its (angle, velocity) (see simulation), so a whole
+game comes down to its settings, a seed per round and a pair of numbers per throw. A Recorder writes just that, as
+small binary records appended to a file one after the other and flushed as they happen, so a log can be read back
+while it is still being written and a game that crashed is only missing the throw it crashed on. playBack() runs the
+records back through match.Match as fast as the CPU allows, which is what running this module does. The game
+itself can show them too, at any speed.
+
+The log starts with MAGIC and VERSION, then has a record per event, each being its kind's character followed by
+little-endian fields:
+
+	"g" game		winPoints (uint32), gravity (double), then each player's name as a length (uint8) and UTF-8
+	"r" round		seed (uint32)
+	"s" shot		playerNum (uint8), angle (double), velocity (double)
+
+Version 1 logs had winPoints as a uint16, which the settings screen lets players go past, and are still read.
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import time
+import struct
+import logging
+import optparse
+
+import constants
+import match
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+MAGIC = 'GRPL'
+VERSION = 2
+_HEADER = struct.Struct('<4sB')
+
+GAME = 'g'
+ROUND = 'r'
+SHOT = 's'
+
+_FIELDS = {
+	GAME: struct.Struct('<IdBB'),
+	ROUND: struct.Struct('<I'),
+	SHOT: struct.Struct('<Bdd'),
+}
+_VERSION_FIELDS = {
+	1: dict(_FIELDS, **{GAME: struct.Struct('<HdBB')}),
+	VERSION: _FIELDS,
+}
+
+
+class ReplayError(Exception):
+	pass
+
+
+def encodeRecord(kind, values):
+	"""The bytes of a record, values being its fields as Reader gives them"""
+	if kind == GAME:
+		p1name, p2name, winPoints, gravity = values
+		p1name = p1name.encode("utf-8")
+		p2name = p2name.encode("utf-8")
+		return GAME + _FIELDS[GAME].pack(winPoints, gravity, len(p1name), len(p2name)) + p1name + p2name
+	return kind + _FIELDS[kind].pack(*values)
+
+
+def decodeRecord(data):
+	"""The (kind, values) of the record data is all of, see encodeRecord()
+
+	>>> decodeRecord(encodeRecord(GAME, (u'Al', u'Bo', 3, 9.8)))
+	('g', (u'Al', u'Bo', 3, 9.8))
+	>>> decodeRecord(encodeRecord(SHOT, (2, 135.0, 50.0))[:-1])
+	Traceback (most recent call last):
+	...
+	ReplayError: 's' record of 17 bytes
+	"""
+	kind = data[:1]
+	try:
+		fields = _FIELDS[kind]
+	except KeyError:
+		raise ReplayError("Unknown record %r" % kind)
+	if len(data) < 1 + fields.size:
+		raise ReplayError("%r record of %d bytes" % (kind, len(data)))
+	values = fields.unpack(data[1:1 + fields.size])
+	names = data[1 + fields.size:]
+	if kind == GAME:
+		winPoints, gravity, p1length, p2length = values
+		if len(names) != p1length + p2length:
+			raise ReplayError("%r record of %d bytes" % (kind, len(data)))
+		values = (names[:p1length].decode("utf-8"), names[p1length:].decode("utf-8"), winPoints, gravity)
+	elif names:
+		raise ReplayError("%r record of %d bytes" % (kind, len(data)))
+	return kind, values
+
+
+def replayPath(now=None, directory=None):
+	"""Where the game records to, a new file for every time the game is started"""
+	if directory is None:
+		directory = os.path.join(constants._data_path_, "replays")
+	if now is None:
+		now = time.time()
+	return os.path.join(directory, time.strftime("%Y%m%d_%H%M%S.replay", time.localtime(now)))
+
+
+class Recorder(object):
+	"""Writes records to fileobj, which it starts with the header if it is empty, as what it records happens. This
+	is the recorder a match.Match takes. A fileobj that already holds a log of another version isn't added to, as
+	the records would be read back with the wrong fields.
+
+	Recording is never worth losing a game over, so if something can't be recorded (the disk is full, say), the
+	Recorder logs it and stops recording."""
+
+	def __init__(self, fileobj):
+		self._file = fileobj
+		self._file.seek(0, os.SEEK_END)
+		if self._file.tell() == 0:
+			self._write(_HEADER.pack(MAGIC, VERSION))
+			return
+		self._file.seek(0)
+		header = self._file.read(_HEADER.size)
+		self._file.seek(0, os.SEEK_END)
+		if len(header) < _HEADER.size or _HEADER.unpack(header) != (MAGIC, VERSION):
+			_moduleLogger.error("Not recording, %r isn't a version %d replay" % (getattr(fileobj, "name", fileobj), VERSION))
+			self.close()
+
+	@classmethod
+	def open(cls, path):
+		"""A Recorder appending to the file at path, creating it (and its directory) if need be"""
+		directory = os.path.dirname(path)
+		if directory and not os.path.isdir(directory):
+			os.makedirs(directory)
+		return cls(open(path, "a+b"))
+
+	def game(self, p1name, p2name, winPoints, gravity):
+		self._record(GAME, (p1name, p2name, winPoints, gravity))
+
+	def round(self, seed):
+		self._record(ROUND, (seed, ))
+
+	def shot(self, playerNum, angle, velocity):
+		self._record(SHOT, (playerNum, angle, velocity))
+
+	@property
+	def recording(self):
+		return self._file is not None
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+	def _record(self, kind, values):
+		if self._file is None:
+			return
+		try:
+			self._write(encodeRecord(kind, values))
+		except (IOError, OSError, struct.error), e:
+			_moduleLogger.exception("Stopped recording, could not record %r %r" % (kind, values))
+			self.close()
+
+	def _write(self, data):
+		self._file.write(data)
+		self._file.flush()
+
+
+class Reader(object):
+	"""Reads the records in fileobj as (kind, fields) tuples, fields being:
+
+		GAME	(p1name, p2name, winPoints, gravity)
+		ROUND	(seed, )
+		SHOT	(playerNum, angle, velocity)
+
+	records() stops at the end of what has been written so far, which may be halfway through a record if the log
+	is still being written to. Calling it again later carries on from the last whole record.
+
+	>>> import StringIO
+	>>> log = StringIO.StringIO()
+	>>> recorder = Recorder(log)
+	>>> recorder.game(u'Al', u'Bo', 3, 9.8); recorder.round(42); recorder.shot(1, 45.0, 50.0)
+	>>> len(log.getvalue())
+	47
+	>>> written = log.getvalue()
+	>>> log.truncate(len(written) - 3)
+	>>> reader = Reader(log)
+	>>> list(reader.records())
+	[('g', (u'Al', u'Bo', 3, 9.8)), ('r', (42,))]
+	>>> log.write(written[-3:])
+	>>> list(reader.records())
+	[('s', (1, 45.0, 50.0))]
+	>>> recorder.game(u'Al', u'Bo', 2 ** 32, 9.8)
+	>>> recorder.recording
+	False
+	>>> Recorder(StringIO.StringIO(_HEADER.pack(MAGIC, 1))).recording
+	False
+	"""
+
+	def __init__(self, fileobj):
+		self._file = fileobj
+		self._offset = None
+		self._fields = _FIELDS
+
+	@classmethod
+	def open(cls, path):
+		return cls(open(path, "rb"))
+
+	def records(self):
+		if self._offset is None:
+			self._file.seek(0)
+			header = self._file.read(_HEADER.size)
+			if len(header) < _HEADER.size:
+				return
+			magic, version = _HEADER.unpack(header)
+			if magic != MAGIC:
+				raise ReplayError("Not a replay")
+			if version not in _VERSION_FIELDS:
+				raise ReplayError("Unsupported replay version %d" % version)
+			self._fields = _VERSION_FIELDS[version]
+			self._offset = _HEADER.size
+
+		while True:
+			self._file.seek(self._offset)
+			record = self._readRecord()
+			if record is None:
+				return
+			self._offset = self._file.tell()
+			yield record
+
+	def _readRecord(self):
+		kind = self._file.read(1)
+		if not kind:
+			return None
+		try:
+			fields = self._fields[kind]
+		except KeyError:
+			raise ReplayError("Unknown record %r at byte %d" % (kind, self._offset))
+		data = self._file.read(fields.size)
+		if len(data) < fields.size:
+			return None
+		values = fields.unpack(data)
+		if kind == GAME:
+			winPoints, gravity, p1length, p2length = values
+			names = self._file.read(p1length + p2length)
+			if len(names) < p1length + p2length:
+				return None
+			values = (
+				names[:p1length].decode("utf-8"), names[p1length:].decode("utf-8"), winPoints, gravity,
+			)
+		return kind, values
+
+
+def playBack(records):
+	"""Plays records back through match.Match, at full speed and without drawing anything. Yields (match, shot) for
+	every throw, shot being the simulation.ShotResult, and (match, None) as every game starts.
+
+	>>> import StringIO
+	>>> log = StringIO.StringIO()
+	>>> recorder = Recorder(log)
+	>>> played = match.Match(u'Al', u'Bo', 1, 9.8, recorder)
+	>>> city = played.newRound(seed=7)
+	>>> shots = [played.throw(45, 10)]
+	>>> [(shot and shot.outcome, list(replayed.scores)) for replayed, shot in playBack(Reader(log).records())]
+	[(None, [0, 0]), ('gorilla1', [0, 1])]
+	"""
+	replayed = None
+	for kind, values in records:
+		if kind == GAME:
+			replayed = match.Match(*values)
+			yield replayed, None
+		elif replayed is None:
+			raise ReplayError("%r record before any game" % kind)
+		elif kind == ROUND:
+			replayed.newRound(seed=values[0])
+		elif kind == SHOT:
+			playerNum, angle, velocity = values
+			if playerNum != replayed.turn:
+				raise ReplayError("Player %d threw on player %d's turn" % (playerNum, replayed.turn))
+			yield replayed, replayed.throw(angle, velocity)
+
+
+def _describe(played, throws):
+	return "%s %d - %d %s after %d throws" % (
+		played.names[0], played.scores[0], played.scores[1], played.names[1], throws,
+	)
+
+
+def main(args):
+	parser = optparse.OptionParser(usage="%prog REPLAY...", description="Plays recorded games back without drawing them and prints how they went")
+	options, paths = parser.parse_args(args)
+	if not paths:
+		parser.error("No replays given")
+
+	totalThrows = 0
+	start = time.time()
+	for path in paths:
+		played = None
+		throws = 0
+		for played, shot in playBack(Reader.open(path).records()):
+			if shot is None:
+				throws = 0
+				continue
+			throws += 1
+			totalThrows += 1
+			if played.isOver:
+				print "%s: %s" % (path, _describe(played, throws))
+		if played is not None and not played.isOver:
+			print "%s: %s, unfinished" % (path, _describe(played, throws))
+	seconds = time.time() - start
+	print "%d throws in %.2f seconds, %.0f throws a second" % (totalThrows, seconds, totalThrows / max(seconds, 1e-6))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""Putting off expensive setup until something actually needs it, and keeping track of how long it took.
+
+gorilla_pygame used to initialize pygame, load a font and build its sprites as soon as it was imported, so every tool
+or test that just wanted a function out of it paid for all of that. A LazyRegistry holds on to how to create each of
+those instead and only does it on first use. Everything it creates is timed on a StartupTimer, along with any other
+phases wrapped in StartupTimer.phase(), so the cold start on the device can be broken down in the log.
+"""
+
+from __future__ import with_statement
+
+import time
+import logging
+import contextlib
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class StartupTimer(object):
+	"""Records how long each named phase of starting up took, in the order they finished.
+
+	>>> timer = StartupTimer()
+	>>> with timer.phase('a'):
+	... 	pass
+	>>> timer.record('b', 0.25)
+	>>> [name for name, seconds in timer.phases]
+	['a', 'b']
+	>>> print timer.report().splitlines()[-2]
+	  b                     250.0 ms
+	"""
+
+	def __init__(self):
+		self.phases = []
+
+	def record(self, name, seconds):
+		self.phases.append((name, seconds))
+
+	@contextlib.contextmanager
+	def phase(self, name):
+		start = time.time()
+		try:
+			yield
+		finally:
+			self.record(name, time.time() - start)
+
+	def report(self):
+		"""A table of every phase, followed by their total"""
+		lines = ["Startup phases:"]
+		for name, seconds in self.phases:
+			lines.append("  %-20s %6.1f ms" % (name, seconds * 1000))
+		lines.append("  %-20s %6.1f ms" % ("total", sum([seconds for name, seconds in self.phases]) * 1000))
+		return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+"""The timer for the game itself."""
+
+
+class LazyRegistry(object):
+	"""Resources that are created by their factory the first time they are looked up, as attributes.
+
+	Factories can use other resources from the registry, which get created first if need be.
+
+	>>> timer = StartupTimer()
+	>>> registry = LazyRegistry(timer)
+	>>> registry.register('answer', lambda: 42)
+	>>> registry.register('question', lambda: 'six times %d' % (registry.answer / 6))
+	>>> registry.isLoaded('answer')
+	False
+	>>> registry.question
+	'six times 7'
+	>>> registry.isLoaded('answer'), [name for name, seconds in timer.phases]
+	(True, ['answer', 'question'])
+	"""
+
+	def __init__(self, timer=STARTUP):
+		self._timer = timer
+		self._factories = {}
+		self._order = []
+		self._loaded = {}
+		self._nested = []
+
+	def register(self, name, factory):
+		if name in self._factories:
+			raise KeyError("%s is already registered" % name)
+		self._factories[name] = factory
+		self._order.append(name)
+
+	def __getattr__(self, name):
+		if name.startswith('_'):
+			raise AttributeError(name)
+		try:
+			return self._loaded[name]
+		except KeyError:
+			pass
+		try:
+			factory = self._factories[name]
+		except KeyError:
+			raise AttributeError(name)
+
+		start = time.time()
+		self._nested.append(0.0)
+		try:
+			resource = factory()
+		finally:
+			elapsed = time.time() - start
+			nested = self._nested.pop()
+			if self._nested:
+				self._nested[-1] += elapsed
+		"""Any resources this one needed were timed on their own, so their time is taken back out of its time."""
+		self._loaded[name] = resource
+		self._timer.record(name, elapsed - nested)
+		return resource
+
+	def isLoaded(self, name):
+		return name in self._loaded
+
+	def preload(self, *names):
+		"""Creates the named resources now, or all of them if no names are given"""
+		for name in names or self._order:
+			getattr(self, name)
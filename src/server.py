@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+
+"""Hosting lots of games at once, for a lobby.
+
+Nothing about playing a game needs a window: match.Match has the rules and simulation.simulateShot() the flight of
+the banana, checked against the city's collision.SkylineMask, so a server can be the one that plays the games and
+the players just send it their throws. One process runs many games at once off a single select() loop, and there is
+a worker process like that per CPU. The first process is the lobby: it takes the connections, pairs players up as
+they join and hands each pair over to the next worker, sockets and all, which plays their game to the end and then
+hangs up.
+
+Messages are framed like those of network.py. A player sends "j" to join and then a replay SHOT record on each of
+their turns, and gets told how it is going with the rest, each being its kind's character followed by little-endian
+fields:
+
+	"j" join	the player's name in UTF-8
+	"a" seated	which player they are (uint8), followed by the replay GAME and ROUND records
+	"x" result	after every throw, which is sent first as its SHOT record: the outcome (uint8, an index into
+				OUTCOMES) and the scores (uint16 each), followed by a ROUND record if a new round starts
+	"e" over	the winner (uint8, 0 if the other player left), after which the server hangs up
+
+	python server.py --processes 4 --port 4232
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import time
+import errno
+import random
+import select
+import socket
+import struct
+import logging
+import optparse
+
+try:
+	import multiprocessing
+	from multiprocessing import reduction
+except ImportError:
+	multiprocessing = None
+
+import match
+import network
+import replay
+import simulation
+import worldgen
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+PORT = network.PORT + 1
+WIN_POINTS = 3
+GRAVITY = 9.8
+STATS_INTERVAL = 10.0
+
+JOIN = 'j'
+SEATED = 'a'
+RESULT = 'x'
+OVER = 'e'
+
+_FIELDS = {
+	SEATED: struct.Struct('<B'),
+	RESULT: struct.Struct('<BHH'),
+	OVER: struct.Struct('<B'),
+}
+
+OUTCOMES = (simulation.MISS, simulation.BUILDING, simulation.GORILLA1, simulation.GORILLA2)
+
+MAX_SPEED = 1000
+"""Throws faster than this (or at an angle further round than this) are nothing a player could have typed in, so
+the connection is dropped."""
+
+
+def encode(kind, values):
+	"""The bytes of a message of kind, which may also be a replay record"""
+	if kind == JOIN:
+		return JOIN + values[0].encode("utf-8")
+	if kind in _FIELDS:
+		return kind + _FIELDS[kind].pack(*values)
+	return replay.encodeRecord(kind, values)
+
+
+def decode(message):
+	"""The (kind, values) of a message, see encode()
+
+	>>> decode(encode(RESULT, (2, 1, 0)))
+	('x', (2, 1, 0))
+	>>> decode(encode(replay.ROUND, (7, )))
+	('r', (7,))
+	"""
+	kind = message[:1]
+	if kind == JOIN:
+		try:
+			return kind, (message[1:].decode("utf-8"), )
+		except UnicodeDecodeError:
+			raise network.NetworkError("Name isn't UTF-8")
+	if kind in _FIELDS:
+		fields = _FIELDS[kind]
+		if len(message) != 1 + fields.size:
+			raise network.NetworkError("%r message of %d bytes" % (kind, len(message)))
+		return kind, fields.unpack(message[1:])
+	try:
+		return replay.decodeRecord(message)
+	except replay.ReplayError, e:
+		raise network.NetworkError(str(e))
+
+
+class Connection(object):
+	"""A socket with its messages framed, what has come in and is not a whole message yet and what is waiting to be
+	sent. It works with select() like the socket would."""
+
+	def __init__(self, sock, received=''):
+		sock.setblocking(0)
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.socket = sock
+		self.name = None
+		self.game = None
+		self.closed = False
+		self._closing = False
+		self._in = received
+		self._out = ''
+
+	def fileno(self):
+		return self.socket.fileno()
+
+	def send(self, kind, *values):
+		self._out += network.frame(encode(kind, values))
+
+	def hangUp(self):
+		"""Closes the connection once everything waiting to be sent is out"""
+		self._closing = True
+		if not self._out:
+			self.close()
+
+	@property
+	def wantsToWrite(self):
+		return bool(self._out) and not self.closed
+
+	def flush(self):
+		try:
+			sent = self.socket.send(self._out)
+		except socket.error, e:
+			if e.args[0] not in network._WOULD_BLOCK:
+				self.close()
+			return
+		self._out = self._out[sent:]
+		if self._closing and not self._out:
+			self.close()
+
+	def receive(self):
+		"""The (kind, values) of every whole message that has come in"""
+		try:
+			data = self.socket.recv(4096)
+		except socket.error, e:
+			if e.args[0] not in network._WOULD_BLOCK:
+				self.close()
+			return []
+		if not data:
+			self.close()
+			return []
+		messages, self._in = network.unframe(self._in + data)
+		return [decode(message) for message in messages]
+
+	def pending(self):
+		"""What has come in and not been made into messages yet, for whoever takes the socket over"""
+		return self._in
+
+	def close(self):
+		if not self.closed:
+			self.closed = True
+			self.socket.close()
+
+
+class ServerGame(object):
+	"""A match between the connections p1 and p2, played here. Their throws come in through shot() and everything
+	that happens is sent to both."""
+
+	def __init__(self, p1, p2, winPoints, gravity, rng):
+		self.players = (p1, p2)
+		self.match = match.Match(p1.name, p2.name, winPoints, gravity)
+		self.over = False
+		self._rng = rng
+		for playerNum, player in enumerate(self.players):
+			player.game = self
+			player.send(SEATED, playerNum + 1)
+			player.send(replay.GAME, p1.name, p2.name, winPoints, gravity)
+		self._newRound()
+
+	def shot(self, player, playerNum, angle, velocity):
+		"""Plays the throw of player, if it is their turn, which is what every SHOT they send goes to. Returns the
+		simulation.ShotResult, or None if the throw was against the rules and player was thrown out, or came in after
+		the game was over."""
+		if self.over:
+			return None
+		if player is not self.players[self.match.turn - 1] or playerNum != self.match.turn:
+			_moduleLogger.info("%r threw out of turn" % player.name)
+			self.leave(player)
+			return None
+		if not (abs(angle) <= MAX_SPEED and abs(velocity) <= MAX_SPEED):
+			_moduleLogger.info("%r threw at %r, %r" % (player.name, angle, velocity))
+			self.leave(player)
+			return None
+
+		shot = self.match.throw(angle, velocity)
+		p1score, p2score = self.match.scores
+		for other in self.players:
+			other.send(replay.SHOT, playerNum, angle, velocity)
+			other.send(RESULT, OUTCOMES.index(shot.outcome), p1score, p2score)
+		if self.match.isOver:
+			self._end(self.match.winner)
+		elif self.match.needsRound:
+			self._newRound()
+		return shot
+
+	def leave(self, player):
+		"""Ends the game for the other player, player having gone"""
+		player.close()
+		player.game = None
+		if not self.over:
+			self._end(0)
+
+	def _newRound(self):
+		city = self.match.newRound(seed=self._rng.randint(0, worldgen.MAX_SEED))
+		for player in self.players:
+			player.send(replay.ROUND, city.world.seed)
+
+	def _end(self, winner):
+		self.over = True
+		for player in self.players:
+			player.game = None
+			"""Anything the players send from now on isn't part of a game, so gets them dropped."""
+			if not player.closed:
+				player.send(OVER, winner)
+				player.hangUp()
+
+
+class Server(object):
+	"""Plays the games of the players who connect to listener, as many at once as there are pairs of them.
+
+	Without workers, the games are played in this process. With workers, being one end of a multiprocessing.Pipe
+	to each worker process, they are handed round them instead, and the workers run a Server with the other end of
+	the pipe as its pipe.
+
+	>>> server = Server(listen(0, '127.0.0.1'), rng=random.Random(1))
+	>>> players = [Connection(connect(server.address)) for i in range(2)]
+	>>> for player, name in zip(players, (u'Al', u'Bo')):
+	... 	player.send(JOIN, name)
+	>>> received = pollUntil(server, players, lambda received: len(received[1]) == 3)
+	>>> received[1]
+	[('a', (2,)), ('g', (u'Al', u'Bo', 3, 9.8)), ('r', (288545017,))]
+	>>> players[0].send(replay.SHOT, 1, 45.0, 10.0)
+	>>> received = pollUntil(server, players, lambda received: len(received[1]) == 3)
+	>>> received[1]
+	[('s', (1, 45.0, 10.0)), ('x', (2, 0, 1)), ('r', (1819850092,))]
+	>>> players[0].send(replay.SHOT, 1, 45.0, 10.0)
+	>>> received = pollUntil(server, players, lambda received: players[1].closed)
+	>>> received[1][-1], server.turns, server.gamesPlayed, players[0].game, players[1].game
+	(('e', (0,)), 1, 1, None, None)
+	"""
+
+	def __init__(self, listener=None, pipe=None, workers=(), winPoints=WIN_POINTS, gravity=GRAVITY, rng=random):
+		self._listener = listener
+		self._pipe = pipe
+		self._workers = list(workers)
+		self._nextWorker = 0
+		self._winPoints = winPoints
+		self._gravity = gravity
+		self._rng = rng
+		self._connections = []
+		self._waiting = None
+		self.games = []
+		self.gamesPlayed = 0
+		self.turns = 0
+		self.turnSeconds = 0.0
+
+	@property
+	def address(self):
+		return self._listener.getsockname()
+
+	def run(self):
+		lastStats = time.time()
+		lastTurns = self.turns
+		while self._listener is not None or self._pipe is not None or self._connections:
+			self.poll(STATS_INTERVAL)
+			now = time.time()
+			if STATS_INTERVAL <= now - lastStats:
+				_moduleLogger.info("%d games going, %d played, %.1f turns a second, %.2f ms a turn" % (
+					len(self.games), self.gamesPlayed, (self.turns - lastTurns) / (now - lastStats),
+					self.turnSeconds / max(self.turns, 1) * 1000,
+				))
+				lastStats = now
+				lastTurns = self.turns
+
+	def poll(self, timeout=0):
+		"""Does whatever can be done, waiting up to timeout seconds if there is nothing to do yet"""
+		readers = self._connections + [source for source in (self._listener, self._pipe) if source is not None]
+		writers = [connection for connection in self._connections if connection.wantsToWrite]
+		try:
+			readable, writable, exceptional = select.select(readers, writers, [], timeout)
+		except select.error, e:
+			if e.args[0] == errno.EINTR:
+				return
+			raise
+
+		for connection in writable:
+			connection.flush()
+		for source in readable:
+			if source is self._listener:
+				self._accept()
+			elif source is self._pipe:
+				self._adopt()
+			elif not source.closed:
+				try:
+					messages = source.receive()
+					for kind, values in messages:
+						self._handle(source, kind, values)
+						# Handed over to a worker by _seat(), or thrown out: the rest of what it sent isn't ours to handle
+						if source.closed:
+							break
+				except network.NetworkError, e:
+					_moduleLogger.info("Dropping %r: %s" % (source.name, e))
+					self._leave(source)
+				if source.closed:
+					self._leave(source)
+
+		self._connections = [connection for connection in self._connections if not connection.closed]
+		self.games = [game for game in self.games if not game.over]
+
+	def _accept(self):
+		while True:
+			try:
+				sock, address = self._listener.accept()
+			except socket.error, e:
+				return
+			self._connections.append(Connection(sock))
+
+	def _adopt(self):
+		"""Takes over the pair of players the lobby handed over, see _seat()"""
+		try:
+			names, pending = self._pipe.recv()
+			fds = [reduction.recv_handle(self._pipe) for name in names]
+		except (EOFError, IOError, OSError), e:
+			self._pipe = None
+			return
+		players = []
+		for name, fd, received in zip(names, fds, pending):
+			sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+			os.close(fd)
+			player = Connection(sock, received)
+			player.name = name
+			players.append(player)
+		self._connections.extend(players)
+		self._seat(*players)
+
+	def _handle(self, connection, kind, values):
+		if connection.game is not None and kind == replay.SHOT:
+			start = time.time()
+			if connection.game.shot(connection, *values) is not None:
+				self.turns += 1
+				self.turnSeconds += time.time() - start
+		elif connection.game is None and kind == JOIN and connection.name is None:
+			connection.name, = values
+			if self._waiting is None or self._waiting.closed:
+				self._waiting = connection
+			else:
+				opponent, self._waiting = self._waiting, None
+				self._seat(opponent, connection)
+		else:
+			raise network.NetworkError("Unexpected %r message" % kind)
+
+	def _leave(self, connection):
+		if connection.game is not None:
+			connection.game.leave(connection)
+		else:
+			connection.close()
+		if connection is self._waiting:
+			self._waiting = None
+
+	def _seat(self, p1, p2):
+		if not self._workers:
+			self.games.append(ServerGame(p1, p2, self._winPoints, self._gravity, self._rng))
+			self.gamesPlayed += 1
+			return
+		worker = self._workers[self._nextWorker]
+		self._nextWorker = (self._nextWorker + 1) % len(self._workers)
+		worker.send(((p1.name, p2.name), (p1.pending(), p2.pending())))
+		for player in (p1, p2):
+			reduction.send_handle(worker, player.fileno(), None)
+			player.close()
+		"""The sockets go over the pipe itself, straight after the message, and the worker takes them in the same
+		order."""
+		self.gamesPlayed += 1
+
+
+def connect(address):
+	"""A socket connected to the server at address, a (host, port) pair"""
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.connect(address)
+	"""Rather than socket.create_connection(), which only came in with Python 2.6."""
+	return sock
+
+
+def listen(port=PORT, address=''):
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	listener.bind((address, port))
+	listener.listen(128)
+	listener.setblocking(0)
+	return listener
+
+
+def _work(pipe, inherited, winPoints, gravity):
+	for other in inherited:
+		other.close()
+	"""The lobby's ends of the pipes and its listener were forked along with everything else. Holding on to them
+	would keep the pipe from ever closing when the lobby goes, and the worker would never finish."""
+	Server(pipe=pipe, winPoints=winPoints, gravity=gravity).run()
+
+
+def serve(listener, processes=None, winPoints=WIN_POINTS, gravity=GRAVITY):
+	"""Runs the lobby on listener and its games in processes worker processes, as many as there are CPUs by default.
+	With the one process, or no multiprocessing module to make more with, the games are played in the lobby."""
+	if multiprocessing is None:
+		processes = 1
+	elif processes is None:
+		processes = multiprocessing.cpu_count()
+
+	workers = []
+	if 1 < processes:
+		for i in xrange(processes):
+			lobbyEnd, workerEnd = multiprocessing.Pipe()
+			worker = multiprocessing.Process(target=_work, args=(workerEnd, workers + [lobbyEnd, listener], winPoints, gravity))
+			worker.daemon = True
+			worker.start()
+			workerEnd.close()
+			workers.append(lobbyEnd)
+	_moduleLogger.info("Serving on %s:%d with %d processes" % (listener.getsockname() + (processes, )))
+	Server(listener, workers=workers, winPoints=winPoints, gravity=gravity).run()
+
+
+def pollUntil(server, players, condition, timeout=5.0):
+	"""Polls server and players until condition(received) is true, received being a list of the (kind, values) each
+	player got so far, and returns received"""
+	received = [[] for player in players]
+	end = time.time() + timeout
+	while not condition(received) and time.time() < end:
+		server.poll(0.01)
+		for player, messages in zip(players, received):
+			if player.closed:
+				continue
+			readable, writable, exceptional = select.select([player], player.wantsToWrite and [player] or [], [], 0)
+			if writable:
+				player.flush()
+			if readable:
+				messages.extend(player.receive())
+	return received
+
+
+def main(args):
+	parser = optparse.OptionParser(usage="%prog [options]", description="Hosts games for players to join")
+	parser.add_option("--port", type="int", default=PORT, help="[%default]")
+	parser.add_option("--address", default='', help="Address to listen on [all of them]")
+	parser.add_option("-j", "--processes", type="int", default=None, help="Worker processes [as many as there are CPUs]")
+	parser.add_option("--points", type="int", default=WIN_POINTS, help="Points a match is played to [%default]")
+	parser.add_option("--gravity", type="float", default=GRAVITY, help="[%default]")
+	options, args = parser.parse_args(args)
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(levelname)s %(message)s')
+	serve(listen(options.port, options.address), options.processes, options.points, options.gravity)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+"""Display-free simulation of a banana throw.
+
+This is the ballistics and collision half of what gorilla_pygame.plotShot() used to do while it was drawing.
+Nothing in here touches pygame, so a shot can be resolved in a fraction of a millisecond (for the AI, replays
+or validation) and the renderer just replays the path that comes back.
+"""
+
+from __future__ import with_statement
+
+import logging
+
+import images
+import collision
+import trajectory
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+SCR_WIDTH = trajectory.SCR_WIDTH
+SCR_HEIGHT = trajectory.SCR_HEIGHT
+
+SUN_X = SCR_WIDTH / 2
+SUN_Y = SCR_HEIGHT / 20
+
+# orientation of the banana:
+RIGHT = 0
+UP = 1
+LEFT = 2
+DOWN = 3
+
+# possible outcomes of a shot
+MISS = 'miss'
+BUILDING = 'building'
+GORILLA1 = 'gorilla1'
+GORILLA2 = 'gorilla2'
+
+BUILD_EXPLOSION_SIZE = int(SCR_HEIGHT / 50)
+GOR_EXPLOSION_SIZE = 30
+
+
+def asciiSize(ascii):
+	"""Returns the (width, height) of the surface pygame_utils.makeSurfaceFromASCII() would build from ascii.
+
+	>>> asciiSize('\\nXX\\nX\\n')
+	(2, 2)
+	"""
+	lines = ascii.split('\n')[1:-1]
+	return max([len(line) for line in lines]), len(lines)
+
+
+GOR_SIZE = asciiSize(images.GOR_DOWN_ASCII)
+BAN_SIZES = {
+	RIGHT: asciiSize(images.BAN_RIGHT_ASCII),
+	UP: asciiSize(images.BAN_UP_ASCII),
+	LEFT: asciiSize(images.BAN_LEFT_ASCII),
+	DOWN: asciiSize(images.BAN_DOWN_ASCII),
+}
+SUN_RECT = (SUN_X, SUN_Y) + asciiSize(images.SUN_NORMAL_ASCII)
+
+
+def nextBananaOrientation(orient):
+	return {
+		RIGHT: UP,
+		UP: LEFT,
+		LEFT: DOWN,
+		DOWN: RIGHT,
+	}[orient]
+
+
+def bananaRect(x, y, orient):
+	"""Returns the (left, top, width, height) the banana occupies when thrown to x, y. The UP and DOWN sprites
+	are nudged so the banana appears to spin around its middle."""
+	width, height = BAN_SIZES[orient]
+	left, top = int(x), int(y)
+	if orient in (UP, DOWN):
+		left -= 2
+		top += 2
+	return (left, top, width, height)
+
+
+def collideRect(a, b):
+	"""Same rules as pygame.Rect.colliderect() for (left, top, width, height) tuples
+
+	>>> collideRect((0, 0, 10, 10), (9, 9, 5, 5))
+	True
+	>>> collideRect((0, 0, 10, 10), (10, 0, 5, 5))
+	False
+	"""
+	return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def unionRect(a, b):
+	left = min(a[0], b[0])
+	top = min(a[1], b[1])
+	return (left, top, max(a[0] + a[2], b[0] + b[2]) - left, max(a[1] + a[3], b[1] + b[3]) - top)
+
+
+def collidePoint(rect, x, y):
+	x, y = int(x), int(y)
+	return rect[0] <= x < rect[0] + rect[2] and rect[1] <= y < rect[1] + rect[3]
+
+
+def rectCenter(rect):
+	return rect[0] + rect[2] // 2, rect[1] + rect[3] // 2
+
+
+def throwOrigin(playerNum, gor1, gor2):
+	"""Returns the x, y the banana's arc is measured from for the throwing player"""
+	if playerNum == 1:
+		startx, starty = gor1
+	elif playerNum == 2:
+		startx, starty = gor2
+		startx += GOR_SIZE[0]
+	starty -= 2 * BAN_SIZES[UP][1]
+	return startx, starty
+
+
+class ShotResult(object):
+	"""What happened to a banana.
+
+	"outcome" is one of MISS, BUILDING, GORILLA1 or GORILLA2. "path" is a list of (left, top, orient) for every
+	frame the banana was drawn in flight. "sunHitAt" is the index into path from which the sun looks shocked (or
+	None) and "impact" is the x, y where the explosion goes (None for a miss).
+	"""
+
+	def __init__(self, outcome, path, sunHitAt, impact):
+		self.outcome = outcome
+		self.path = path
+		self.sunHitAt = sunHitAt
+		self.impact = impact
+
+	def __repr__(self):
+		return "<ShotResult %s after %d frames at %r>" % (self.outcome, len(self.path), self.impact)
+
+
+def craters(shot):
+	"""The (x, y, radius) of every explosion a ShotResult sets off, in the order they go off. A gorilla goes up in
+	two, a smaller one and then a bigger one, a building in just the one and a miss in none.
+
+	>>> craters(ShotResult(BUILDING, [], None, (10, 20)))
+	[(10, 20, 9)]
+	>>> craters(ShotResult(GORILLA1, [], None, (10, 20)))
+	[(10, 20, 20), (10, 20, 30)]
+	"""
+	if shot.impact is None:
+		return []
+	x, y = shot.impact
+	if shot.outcome == BUILDING:
+		return [(x, y, BUILD_EXPLOSION_SIZE)]
+	return [(x, y, int(GOR_EXPLOSION_SIZE*2/3)), (x, y, GOR_EXPLOSION_SIZE)]
+
+
+def _firstHit(prevRect, rect, checkRect, gor1Rect, gor2Rect, skyline):
+	"""Slides the banana from prevRect (None for the first frame) over to rect and returns (outcome, rect) for the
+	first thing it touches on the way, or None. rect itself is only checked if checkRect is True."""
+	area = rect
+	if prevRect is not None:
+		area = unionRect(prevRect, rect)
+	targets = []
+	for outcome, gorRect in ((GORILLA1, gor1Rect), (GORILLA2, gor2Rect)):
+		if collideRect(area, gorRect):
+			targets.append((
+				outcome,
+				lambda xs, ys, width, height, gorRect=gorRect: collision.sweepRect(xs, ys, width, height, gorRect),
+				lambda rect, gorRect=gorRect: collideRect(rect, gorRect),
+			))
+	if skyline.collideRect(*area):
+		targets.append((BUILDING, skyline.sweepRect, lambda rect: skyline.collideRect(*rect)))
+	if not targets:
+		return None
+	"""Most of a throw is through open sky, so the segment is only walked when there is something near it."""
+
+	endIndex = 0
+	halves = []
+	if prevRect is not None:
+		fractions, xs, ys = collision.sweepPositions(prevRect[0], prevRect[1], rect[0], rect[1])
+		endIndex = len(fractions)
+		turn = int((fractions <= 0.5).sum())
+		halves = [(0, xs[:turn], ys[:turn], prevRect[2:]), (turn, xs[turn:], ys[turn:], rect[2:])]
+		"""The banana turns between prevRect and rect, so it is swept at prevRect's size for the first half of the way
+		and at rect's for the rest. Each end of the sweep is then the very rect that was checked there."""
+	hits = []
+	for order, (outcome, sweep, collide) in enumerate(targets):
+		index = None
+		for start, halfXs, halfYs, (width, height) in halves:
+			if len(halfXs):
+				index = sweep(halfXs, halfYs, width, height)
+			if index is not None:
+				index += start
+				break
+		if index is not None:
+			hits.append((index, order, outcome, (int(xs[index]), int(ys[index]), width, height)))
+		elif checkRect and collide(rect):
+			hits.append((endIndex, order, outcome, rect))
+	if not hits:
+		return None
+	index, order, outcome, hitRect = min(hits)
+	return outcome, hitRect
+
+
+def simulateShot(angle, velocity, playerNum, wind, gravity, gor1, gor2, skyline, timeStep=trajectory.TIME_STEP):
+	"""Follows the banana thrown by playerNum until it hits something or leaves the screen. gor1 and gor2 are the
+	(left, top) of each gorilla, as returned by placeGorillas(). skyline is a collision.SkylineMask (or anything
+	with the same collideRect() and sweepRect() methods).
+
+	The positions come from trajectory.sampleArc() and between each of them the banana is swept so it can't pass
+	through the corner of a building or a gorilla just because it moved more than its size in a frame. That means
+	timeStep can be raised to resolve shots faster without bananas tunneling through things; the sweep follows
+	straight lines between samples though, so a much bigger step cuts the corners of the arc a little.
+	"""
+	gor1Rect = (gor1[0], gor1[1]) + GOR_SIZE
+	gor2Rect = (gor2[0], gor2[1]) + GOR_SIZE
+
+	startx, starty = throwOrigin(playerNum, gor1, gor2)
+	xs, ys = trajectory.sampleArc(startx, starty, angle, velocity, wind, gravity, timeStep=timeStep)
+
+	orient = UP
+	path = []
+	sunHitAt = None
+	prevRect = None
+	for x, y in zip(xs.tolist(), ys.tolist()):
+		inPlay = not trajectory.isOutOfBounds(x, y)
+		rect = bananaRect(x, y, orient)
+		if inPlay and 0 < y and sunHitAt is None and collidePoint(SUN_RECT, x, y):
+			sunHitAt = len(path)
+
+		hit = _firstHit(prevRect, rect, inPlay and 0 < y, gor1Rect, gor2Rect, skyline)
+		if hit is not None:
+			outcome, hitRect = hit
+			return ShotResult(outcome, path, sunHitAt, rectCenter(hitRect))
+
+		path.append((rect[0], rect[1], orient))
+		prevRect = rect
+		orient = nextBananaOrientation(orient)
+	return ShotResult(MISS, path, sunHitAt, None)
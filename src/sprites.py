@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""All of the game's ASCII art, rasterized into a single surface.
+
+pygame_utils.makeSurfaceFromASCII() writes one pixel at a time through a PixelArray, which adds up to a noticeable
+part of startup on the handheld. An atlas instead turns every piece of art into a numpy mask, colors them all in one
+go and packs them side by side on one surface, with a rect per sprite to find them by. The packed surface is saved
+under constants._data_path_, named after a hash of the art and its colors, so later runs just load it back.
+"""
+
+from __future__ import with_statement
+
+import os
+import logging
+try:
+	import hashlib
+	_sha1 = hashlib.sha1
+except ImportError:
+	import sha
+	_sha1 = sha.new
+
+import numpy
+import pygame
+
+import constants
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+ATLAS_WIDTH = 256
+_LAYOUT_VERSION = 1
+
+
+def asciiMask(ascii):
+	"""Returns a boolean (height, width) array that is True wherever makeSurfaceFromASCII() would use the
+	foreground color
+
+	>>> asciiMask('\\nX.\\n.XX\\n').astype(int).tolist()
+	[[1, 0, 0], [0, 1, 1]]
+	"""
+	lines = ascii.split('\n')[1:-1]
+	width = max([len(line) for line in lines])
+	padded = ''.join([line.ljust(width) for line in lines])
+	return (numpy.fromstring(padded, dtype=numpy.uint8) == ord('X')).reshape(len(lines), width)
+
+
+def packRects(sizes, atlasWidth=ATLAS_WIDTH):
+	"""Lays out (width, height) sizes in rows across an atlasWidth wide surface, tallest first, and returns the
+	(left, top, width, height) of each, in the same order as sizes, along with the size of the whole atlas
+
+	>>> packRects([(4, 2), (3, 5), (4, 4)], atlasWidth=8)
+	([(0, 5, 4, 2), (0, 0, 3, 5), (3, 0, 4, 4)], (8, 7))
+	"""
+	order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], i))
+	rects = [None] * len(sizes)
+	left = top = rowHeight = 0
+	for i in order:
+		width, height = sizes[i]
+		if atlasWidth < left + width and left:
+			top += rowHeight
+			left = rowHeight = 0
+		rects[i] = (left, top, width, height)
+		left += width
+		rowHeight = max(rowHeight, height)
+	return rects, (atlasWidth, top + rowHeight)
+
+
+class SpriteAtlas(object):
+	"""One surface holding many sprites, with "rects" giving where each one is by name.
+
+	atlas[name] is a subsurface for that sprite, which shares its pixels with the atlas, so blit it but don't draw on
+	it.
+	"""
+
+	def __init__(self, surface, rects):
+		self.surface = surface
+		self.rects = rects
+		self._sprites = {}
+
+	def __getitem__(self, name):
+		try:
+			sprite = self._sprites[name]
+		except KeyError:
+			sprite = self.surface.subsurface(self.rects[name])
+			self._sprites[name] = sprite
+		return sprite
+
+	def __contains__(self, name):
+		return name in self.rects
+
+	def __iter__(self):
+		return iter(self.rects)
+
+
+def cacheKey(sprites):
+	"""A name for the atlas of sprites that changes whenever any of the art, the colors or the layout does"""
+	digest = _sha1()
+	digest.update(repr((_LAYOUT_VERSION, ATLAS_WIDTH)))
+	for name, ascii, fgColor, bgColor in sprites:
+		digest.update(repr((name, ascii, tuple(fgColor), tuple(bgColor))))
+	return digest.hexdigest()
+
+
+def _layout(sprites):
+	masks = [asciiMask(ascii) for name, ascii, fgColor, bgColor in sprites]
+	sizes = [(mask.shape[1], mask.shape[0]) for mask in masks]
+	rects, atlasSize = packRects(sizes)
+	return masks, rects, atlasSize
+
+
+def rasterize(sprites):
+	"""Builds the atlas surface for sprites without touching the disk"""
+	masks, rects, atlasSize = _layout(sprites)
+	pixels = numpy.zeros(atlasSize + (3, ), dtype=numpy.uint8)
+	for (name, ascii, fgColor, bgColor), mask, (left, top, width, height) in zip(sprites, masks, rects):
+		pixels[left:left + width, top:top + height] = numpy.where(
+			mask.T[:, :, numpy.newaxis], numpy.array(fgColor[:3]), numpy.array(bgColor[:3])
+		)
+	"""surfarray is indexed [x, y] so the masks get transposed on the way in."""
+	surface = pygame.Surface(atlasSize, 0, 24)
+	pygame.surfarray.blit_array(surface, pixels)
+	return _makeAtlas(sprites, surface, rects)
+
+
+def _makeAtlas(sprites, surface, rects):
+	if pygame.display.get_surface() is not None:
+		surface = surface.convert()
+	"""In the display's pixel format, or every blit of a sprite would convert it again. Without a display (tests,
+	tools) there is nothing to convert to."""
+	names = [name for name, ascii, fgColor, bgColor in sprites]
+	return SpriteAtlas(surface, dict(zip(names, [pygame.Rect(rect) for rect in rects])))
+
+
+def _cachePath(sprites, cacheDir):
+	return os.path.join(cacheDir, "sprites-%s.bmp" % cacheKey(sprites))
+
+
+def loadAtlas(sprites, cacheDir=None):
+	"""Returns the SpriteAtlas for sprites, loading it from cacheDir (constants._data_path_ by default) if it was
+	built before and saving it there if it wasn't. Failing to read or write the cache is not fatal, the atlas just
+	gets rasterized again."""
+	if cacheDir is None:
+		cacheDir = constants._data_path_
+	path = _cachePath(sprites, cacheDir)
+	masks, rects, atlasSize = _layout(sprites)
+
+	if os.path.exists(path):
+		try:
+			surface = pygame.image.load(path)
+		except pygame.error:
+			_moduleLogger.exception("Could not load the sprite cache %s" % path)
+		else:
+			if surface.get_size() == atlasSize:
+				return _makeAtlas(sprites, surface, rects)
+			_moduleLogger.info("Ignoring the sprite cache %s, it is the wrong size" % path)
+
+	atlas = rasterize(sprites)
+	try:
+		try:
+			os.makedirs(cacheDir)
+		except OSError, e:
+			if e.errno != 17:
+				raise
+		pygame.image.save(atlas.surface, path)
+	except (OSError, IOError, pygame.error):
+		_moduleLogger.exception("Could not save the sprite cache %s" % path)
+	return atlas
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""The screens of the game as states, all run by the one loop.
+
+Each screen used to have a blocking loop of its own, with its own clock tick, and game_loop() called them one after
+the other. Now a screen is a State, with hooks to take in events, move on by however much time went by and draw,
+and a StateMachine runs whichever state is current and switches to whatever it says comes next. That leaves one
+place that keeps track of how long frames take, which hands states the real time between frames so they can skip
+what they fell behind on, and which stops running them at all while the window is hidden.
+"""
+
+from __future__ import with_statement
+
+import time
+import logging
+
+import pygame
+
+import animation
+import events
+import instrument
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+FINISHED = object()
+"""Returned from State.update() to stop the StateMachine."""
+
+
+class State(object):
+	"""A screen of the game. Subclasses override the hooks they need.
+
+	"then" is called with the state once it is done and returns the state to switch to, or FINISHED, which is also
+	what happens when it is left as None.
+	"""
+
+	wantsEvents = True
+	"""States that don't want events leave them in the queue for whichever state comes next, like keys typed in
+	during an animation, and only get checked for quitting."""
+
+	def __init__(self, then=None):
+		self.then = then
+
+	def enter(self):
+		"""Called when the state becomes the current one"""
+		pass
+
+	def exit(self):
+		"""Called when the state stops being the current one"""
+		pass
+
+	def handle(self, event):
+		pass
+
+	def update(self, elapsed):
+		"""Moves the state on by elapsed seconds and returns the state to switch to, FINISHED or None to stay"""
+		return None
+
+	def render(self):
+		"""Draws what changed since the last render and adds it to the dirty rects"""
+		pass
+
+	def timeout(self):
+		"""How long the state can go without an update if no events come in, None being forever"""
+		return None
+
+	def finish(self):
+		"""What update() returns when the state is done"""
+		if self.then is None:
+			return FINISHED
+		return self.then(self)
+
+
+class Animation(State):
+	"""Plays one or more lists of (duration, draw) frames, one after the other, as animation.Timelines. The last
+	frame of each list is always drawn, however far behind things are."""
+
+	wantsEvents = False
+
+	def __init__(self, *framesLists, **kwds):
+		State.__init__(self, **kwds)
+		self._timelines = [animation.Timeline(frames) for frames in framesLists]
+
+	def update(self, elapsed):
+		while self._timelines and self._timelines[0].done:
+			self._timelines.pop(0)
+			elapsed = 0
+		if not self._timelines:
+			return self.finish()
+		self._timelines[0].advance(elapsed)
+		return None
+
+	def render(self):
+		if self._timelines:
+			self._timelines[0].render()
+
+	def timeout(self):
+		if not self._timelines:
+			return 0
+		return self._timelines[0].timeout()
+
+
+class StateMachine(object):
+	"""Runs states until one of them finishes without saying what comes next.
+
+	Every time around, the current state is updated with the time since the last time, rendered and the dirtyRects
+	flipped. Then the loop sleeps until an event comes in or the state's timeout is up. Events go to onEvent first,
+	which is where quitting is dealt with, then to the state. For states that don't want events, onTick is called
+	instead, and the sleeps are cut to 1 / fps seconds so that quitting still gets noticed. Nothing runs at all while
+	isActive() says the window is hidden, except for the tasks added with addTask(). Events that come in meanwhile
+	still go to onEvent straight away, but are held back from the state until the window is shown again.
+
+	Handling events, updating, rendering and flipping are timed as sections of profiler, which times nothing unless
+	it is set to an instrument.Profiler. An overlay, if there is one, is drawn just before flipping and erased again
+	just after, so the states never draw over it or find it on the screen.
+
+	>>> class Screen(object):
+	... 	def flip(self):
+	... 		pass
+	>>> class Count(State):
+	... 	wantsEvents = False
+	... 	def __init__(self, n, **kwds):
+	... 		State.__init__(self, **kwds)
+	... 		self.n = n
+	... 	def update(self, elapsed):
+	... 		self.n -= 1
+	... 		if self.n <= 0:
+	... 			return self.finish()
+	... 	def timeout(self):
+	... 		return 0
+	>>> machine = StateMachine(Screen(), lambda event: None, lambda: None, 1000, isActive=lambda: True)
+	>>> last = machine.run(Count(3, then=lambda state: Count(2)))
+	>>> last.n, machine.framesRendered
+	(0, 3)
+	"""
+
+	SAMPLE_COUNT = 120
+
+	def __init__(self, dirtyRects, onEvent, onTick, fps, clock=time.time, isActive=pygame.display.get_active):
+		self._dirtyRects = dirtyRects
+		self._onEvent = onEvent
+		self._onTick = onTick
+		self._tickTime = 1.0 / fps
+		self._clock = clock
+		self._isActive = isActive
+		self.speed = 1.0
+		"""How many times as fast as real time the states are run, for fast-forwarding through replays."""
+		self.framesRendered = 0
+		self.frameTimes = []
+		"""How long each of the last SAMPLE_COUNT frames took to update and render, in seconds."""
+		self.timeSuspended = 0.0
+		self.profiler = instrument.NULL_PROFILER
+		self.overlay = None
+		self._tasks = []
+
+	def addTask(self, task, interval):
+		"""Calls task every time around the loop, even while the window is hidden, and never waits longer than
+		interval seconds between calls. This is for keeping things like network connections going whichever state is
+		current."""
+		self._tasks.append((task, interval))
+
+	def removeTask(self, task):
+		self._tasks = [(other, interval) for other, interval in self._tasks if other != task]
+
+	def run(self, state):
+		"""Runs state and whatever comes after it, returning the state that finished"""
+		state.enter()
+		last = self._clock()
+		while True:
+			if not self._isActive():
+				self._suspend(state)
+				last = self._clock()
+				"""The time spent hidden doesn't count, or animations would jump ahead to catch up with it."""
+
+			self._runTasks()
+			frameStart = self._clock()
+			with self.profiler.section('update'):
+				nextState = state.update((frameStart - last) * self.speed)
+			last = frameStart
+			if nextState is FINISHED:
+				state.exit()
+				self._dirtyRects.flip()
+				return state
+			elif nextState is not None:
+				state.exit()
+				state = nextState
+				state.enter()
+				continue
+
+			with self.profiler.section('render'):
+				state.render()
+			if self.overlay is not None:
+				self.overlay.draw()
+			with self.profiler.section('flip'):
+				self._dirtyRects.flip()
+			if self.overlay is not None:
+				self.overlay.erase()
+			self._record(self._clock() - frameStart)
+
+			timeout = state.timeout()
+			if timeout is not None:
+				timeout /= self.speed
+			timeout = self._capTimeout(timeout)
+			if state.wantsEvents:
+				for event in events.waitForEvents(timeout):
+					with self.profiler.section('events'):
+						self._onEvent(event)
+						state.handle(event)
+			else:
+				self._onTick()
+				if timeout is None or self._tickTime < timeout:
+					timeout = self._tickTime
+				if 0 < timeout:
+					time.sleep(timeout)
+
+	def _runTasks(self):
+		for task, interval in self._tasks:
+			task()
+
+	def _capTimeout(self, timeout):
+		"""timeout, cut down so that the tasks get run often enough"""
+		for task, interval in self._tasks:
+			if timeout is None or interval < timeout:
+				timeout = interval
+		return timeout
+
+	def averageFrameTime(self):
+		if not self.frameTimes:
+			return 0.0
+		return sum(self.frameTimes) / len(self.frameTimes)
+
+	def _record(self, frameTime):
+		self.framesRendered += 1
+		self.frameTimes.append(frameTime)
+		if self.SAMPLE_COUNT < len(self.frameTimes):
+			del self.frameTimes[0]
+		self.profiler.endFrame(frameTime)
+
+	def _suspend(self, state):
+		"""Sleeps while the window is hidden (minimized, or another application on top on the handheld), only
+		waking up for events, so a game in the background takes no CPU time. The events are passed on to state once
+		the window is back, or put back in the queue for it if it doesn't take events."""
+		_moduleLogger.info("Suspending while hidden")
+		start = self._clock()
+		held = []
+		while not self._isActive():
+			for event in events.waitForEvents(self._capTimeout(None)):
+				self._onEvent(event)
+				held.append(event)
+			self._runTasks()
+		self.timeSuspended += self._clock() - start
+		_moduleLogger.info("Resuming after %.1f seconds, with %d events held back" % (self._clock() - start, len(held)))
+
+		if state.wantsEvents:
+			for event in held:
+				with self.profiler.section('events'):
+					state.handle(event)
+		else:
+			for event in held:
+				pygame.event.post(event)
+			"""States that don't take events check the queue themselves, see onTick."""
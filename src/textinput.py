@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""Text boxes that get typed into without taking over the program.
+
+inputMode() and inputModeNum() used to be two copies of the same blocking loop, differing only in which keys they
+let through, and each of them drew its prompt twice whenever it drew it. A TextInput instead is handed events and
+asked to draw by whichever loop is running, so several of them (or anything else following the same draw(),
+handle(), timeout(), update() pattern) can be going at once. Which keys it takes is up to a validator, and drawing
+only touches the part of the text from the first character that changed.
+"""
+
+from __future__ import with_statement
+
+import logging
+
+import pygame
+import pygame.locals
+
+import events
+from util import pygame_utils
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+DIGITS = '0123456789'
+
+NUMBER_MAPPINGS = {
+	pygame.locals.K_PERIOD: ".",
+	pygame.locals.K_KP_PERIOD: ".",
+	pygame.locals.K_q: "1",
+	pygame.locals.K_w: "2",
+	pygame.locals.K_e: "3",
+	pygame.locals.K_r: "4",
+	pygame.locals.K_t: "5",
+	pygame.locals.K_y: "6",
+	pygame.locals.K_u: "7",
+	pygame.locals.K_i: "8",
+	pygame.locals.K_o: "9",
+	pygame.locals.K_p: "0",
+}
+"""The top row of letters stands in for the number keys, as the handheld's keyboard has no number row."""
+
+BLANK_CURSOR = '   '
+"""What is shown in place of the cursor while it is blinked off and once the input is done."""
+
+
+def textKey(event):
+	"""A validator taking any printable key, which returns the character to add for a KEYDOWN event, or None to
+	ignore it.
+
+	>>> class Event(object):
+	... 	def __init__(self, key, unicode, mod=0):
+	... 		self.key, self.unicode, self.mod = key, unicode, mod
+	>>> textKey(Event(ord('a'), u'a')), textKey(Event(ord('a'), u'A', pygame.locals.KMOD_LSHIFT)), textKey(Event(ord('5'), u'5'))
+	('a', 'A', u'5')
+	>>> textKey(Event(pygame.locals.K_UP, u''))
+	"""
+	if 32 <= event.key < 128 and event.unicode not in DIGITS:
+		return pygame_utils.toProperCase(chr(event.key), event.mod)
+	elif event.unicode and event.unicode in DIGITS:
+		return event.unicode
+	return None
+
+
+def numberKey(event):
+	"""A validator for numbers, taking digits and anything in NUMBER_MAPPINGS
+
+	>>> class Event(object):
+	... 	def __init__(self, key, unicode, mod=0):
+	... 		self.key, self.unicode, self.mod = key, unicode, mod
+	>>> numberKey(Event(ord('7'), u'7')), numberKey(Event(pygame.locals.K_w, u'w')), numberKey(Event(ord('x'), u'x'))
+	(u'7', '2', None)
+	"""
+	if event.unicode and event.unicode in DIGITS:
+		return event.unicode
+	return NUMBER_MAPPINGS.get(event.key, None)
+
+
+def allowedKeys(allowed, validator=textKey):
+	"""Makes a validator that only lets through what validator does when the key typed is one of the characters in
+	allowed"""
+
+	def validate(event):
+		if event.unicode not in allowed:
+			return None
+		return validator(event)
+
+	return validate
+
+
+def isEnter(event):
+	return event.scancode == 36 or event.key in (pygame.locals.K_RETURN, pygame.locals.K_KP_ENTER)
+
+
+class TextInput(object):
+	"""A prompt followed by what the player typed in so far, at x, y on the screen.
+
+	The text is drawn in fgcol on bgcol with textCache, a display.TextCache. "pos" is "left", "center" or "right",
+	which side of the prompt x is. At most maxlen characters can be typed in, each key press going through validator,
+	which returns the text to add or None to ignore the key. "cursor" is shown where the next character goes, and if
+	cursorBlink is set it blinks every blinkPeriod seconds.
+
+	Enter or a tap on the screen finishes the input, after which "done" is set and "value" holds what was typed in.
+
+	>>> class Event(object):
+	... 	def __init__(self, key, unicode, type=pygame.locals.KEYDOWN):
+	... 		self.type, self.key, self.unicode, self.mod, self.scancode = type, key, unicode, 0, 0
+	>>> textInput = TextInput('Angle: ', 0, 0, (255, 255, 255), (0, 0, 0), None, maxlen=2, validator=numberKey)
+	>>> [textInput.handle(Event(ord(c), c)) for c in 'w5x9']
+	[True, True, False, False]
+	>>> textInput.handle(Event(pygame.locals.K_BACKSPACE, u'')), textInput.value, textInput.done
+	(True, '2', False)
+	>>> textInput.handle(Event(pygame.locals.K_RETURN, u'\\r')), textInput.done, textInput.text()
+	(True, True, 'Angle: 2   ')
+	>>> textInput.handle(Event(ord('1'), '1')), textInput.value
+	(False, '2')
+	"""
+
+	def __init__(
+		self, prompt, x, y, fgcol, bgcol, textCache,
+		maxlen=12, validator=textKey, pos='left', cursor='_', cursorBlink=False, blinkPeriod=1.0,
+	):
+		self.prompt = prompt
+		self.value = ''
+		self.done = False
+		self._anchor = x, y
+		self._pos = pos
+		self._fgcol = fgcol
+		self._bgcol = bgcol
+		self._textCache = textCache
+		self._maxlen = maxlen
+		self._validator = validator
+		self._cursor = cursor
+		self._cursorShow = cursor
+		self._blinker = None
+		if cursor and cursorBlink:
+			self._blinker = events.Blinker(blinkPeriod)
+
+		self._topLeft = None
+		self._drawnText = ''
+		self._drawnSize = (0, 0)
+
+	def text(self):
+		"""Everything the input shows, prompt and cursor included"""
+		return self.prompt + self.value + self._cursorShow
+
+	def handle(self, event):
+		"""Takes in an event, returning whether it was for this input"""
+		if self.done:
+			return False
+		if event.type == pygame.locals.MOUSEBUTTONDOWN: # Use Screen Tap as Enter Key
+			self._finish()
+			return True
+		if event.type != pygame.locals.KEYDOWN:
+			return False
+
+		if isEnter(event):
+			self._finish()
+		elif event.key == pygame.locals.K_BACKSPACE:
+			self.value = self.value[:-1]
+		else:
+			if self._maxlen <= len(self.value):
+				return False
+			typed = self._validator(event)
+			if typed is None:
+				return False
+			self.value += typed
+		return True
+
+	def timeout(self, now=None):
+		"""How long until the input has to be drawn again without any events, or None if that is never"""
+		if self._blinker is None or self.done:
+			return None
+		return self._blinker.timeout(now)
+
+	def update(self, now=None):
+		"""Blinks the cursor if it is time to"""
+		if self._blinker is None or self.done:
+			return
+		if self._blinker.update(now):
+			if self._blinker.isOn:
+				self._cursorShow = self._cursor
+			else:
+				self._cursorShow = BLANK_CURSOR
+
+	def draw(self, surface):
+		"""Draws whatever changed since the last draw and returns the areas that changed.
+
+		Only the text from around the first character that is different is blitted, out of the rendering of the whole
+		line so that the glyphs join up like they would otherwise, and if the text got shorter the rest of what was
+		there before is filled with the background color."""
+		text = self.text()
+		if text == self._drawnText:
+			return []
+		if self._topLeft is None:
+			self._topLeft = self._place()
+		left, top = self._topLeft
+
+		same = 0
+		for old, new in zip(self._drawnText, text):
+			if old != new:
+				break
+			same += 1
+		textSurf = self._textCache.render(text, self._fgcol, self._bgcol)
+		width, height = textSurf.get_size()
+		drawnWidth, drawnHeight = self._drawnSize
+		changed = []
+		changedX = 0
+		if height != drawnHeight:
+			changed.append(surface.fill(self._bgcol, (left, top, drawnWidth, drawnHeight)))
+			"""The font makes the text taller when it has letters that hang below the line, like "y", and then
+			everything is drawn a little differently, so the old text is cleared away and all of it redrawn."""
+		elif same:
+			changedX = max(self._textCache.size(text[:same])[0] - height / 2, 0)
+			"""Glyphs can reach into the ones next to them, like the tail of a "y" going under the letter before it,
+			so what gets blitted starts half a line height before where the first changed character goes."""
+		changed.append(surface.blit(textSurf, (left + changedX, top), (changedX, 0, width - changedX, height)))
+		if width < drawnWidth and height == drawnHeight:
+			changed.append(surface.fill(self._bgcol, (left + width, top, drawnWidth - width, height)))
+
+		self._drawnText = text
+		self._drawnSize = width, height
+		return changed
+
+	def _place(self):
+		"""Where the text goes, lined up by the prompt and cursor so the input doesn't move around as it is typed into"""
+		x, y = self._anchor
+		width = self._textCache.size(self.prompt + self._cursor)[0]
+		if self._pos == 'left':
+			return x, y
+		elif self._pos == 'center':
+			return x - width / 2, y
+		elif self._pos == 'right':
+			return x - width, y
+		else:
+			raise NotImplementedError("Unknown pos %r" % self._pos)
+
+	def _finish(self):
+		self.done = True
+		if self._cursorShow:
+			self._cursorShow = BLANK_CURSOR
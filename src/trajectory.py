@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Whole banana arcs as numpy arrays.
+
+The arc formula from the game is evaluated for every time step of a throw in one go, and for batches of
+(angle, velocity) pairs at once, which is what the aiming code and balance testing need. The time steps are
+accumulated exactly like the frame loop does (t += 0.1), so positions match simulation.simulateShot() bit for bit.
+"""
+
+from __future__ import with_statement
+
+import math
+import logging
+
+import numpy
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+SCR_WIDTH = 800
+SCR_HEIGHT = 480
+
+TIME_START = 1.0
+TIME_STEP = 0.1
+
+MAX_STEPS = 4096
+_CHUNK_STEPS = 64
+
+_times = {}
+
+
+def sampleTimes(count, timeStep=TIME_STEP):
+	"""Returns the first count values t takes while a banana is in the air"""
+	times = _times.get(timeStep, ())
+	if len(times) < count:
+		times = list(times)
+		t = times[-1] + timeStep if times else TIME_START
+		while len(times) < count:
+			times.append(t)
+			t += timeStep
+		times = numpy.array(times)
+		_times[timeStep] = times
+	return times[:count]
+
+
+def isOutOfBounds(x, y):
+	"""The banana's flight ends once it goes off either side or below the bottom of the screen (but not the top)"""
+	return x >= SCR_WIDTH - 10 or x <= 3 or y >= SCR_HEIGHT
+
+
+def outOfBounds(x, y):
+	"""Array version of isOutOfBounds()"""
+	return (SCR_WIDTH - 10 <= x) | (x <= 3) | (SCR_HEIGHT <= y)
+
+
+class Arcs(object):
+	"""Sampled positions for a batch of throws.
+
+	"x" and "y" are (shots, steps) arrays and "lengths" says how many samples of each row are part of the flight,
+	up to and including the first sample that left the screen. Anything past that is junk.
+	"""
+
+	def __init__(self, x, y, lengths):
+		self.x = x
+		self.y = y
+		self.lengths = lengths
+
+	def __len__(self):
+		return len(self.lengths)
+
+	def arc(self, i):
+		"""Returns the x and y arrays of a single throw"""
+		length = self.lengths[i]
+		return self.x[i, :length], self.y[i, :length]
+
+
+def sampleArcs(startx, starty, angles, velocities, wind, gravity, maxSteps=MAX_STEPS, timeStep=TIME_STEP):
+	"""Samples every throw made from startx, starty (see simulation.throwOrigin()) for the given angles (in degrees)
+	and velocities, which can be scalars or arrays of the same shape. Sampling stops once every banana has left the
+	screen or after maxSteps. A bigger timeStep than the game's makes for fewer, further apart, samples.
+
+	>>> arcs = sampleArcs(100, 300, [45, 80], [50, 50], 0, 9.8)
+	>>> [int(length) for length in arcs.lengths]
+	[98, 120]
+	>>> x, y = arcs.arc(0)
+	>>> bool(outOfBounds(x[:-1], y[:-1]).any()), bool(outOfBounds(x[-1:], y[-1:]).all())
+	(False, True)
+	"""
+	angles = numpy.atleast_1d(numpy.asarray(angles, dtype=float)) / 180.0 * math.pi
+	velocities = numpy.atleast_1d(numpy.asarray(velocities, dtype=float))
+	angles, velocities = numpy.broadcast_arrays(angles, velocities)
+	initXVel = (numpy.cos(angles) * velocities)[:, numpy.newaxis]
+	initYVel = (numpy.sin(angles) * velocities)[:, numpy.newaxis]
+	windAccel = 0.5 * (wind / 5)
+
+	shotCount = len(angles)
+	lengths = numpy.zeros(shotCount, dtype=int)
+	xChunks = []
+	yChunks = []
+	steps = 0
+	chunkSteps = _CHUNK_STEPS
+	while steps < maxSteps:
+		chunkSteps = min(chunkSteps, maxSteps - steps)
+		t = sampleTimes(steps + chunkSteps, timeStep)[steps:]
+		flying = (lengths == 0).nonzero()[0]
+		if len(flying) == shotCount:
+			x = startx + (initXVel * t) + (windAccel * t**2)
+			y = starty + ((-1 * (initYVel * t)) + (0.5 * gravity * t**2))
+			flyingX, flyingY = x, y
+		else:
+			x = numpy.empty((shotCount, chunkSteps))
+			y = numpy.empty((shotCount, chunkSteps))
+			flyingX = startx + (initXVel[flying] * t) + (windAccel * t**2)
+			flyingY = starty + ((-1 * (initYVel[flying] * t)) + (0.5 * gravity * t**2))
+			x[flying] = flyingX
+			y[flying] = flyingY
+		"""Throws that already left the screen aren't worked out any further, their rows are left as junk."""
+		xChunks.append(x)
+		yChunks.append(y)
+
+		gone = outOfBounds(flyingX, flyingY)
+		landed = gone.any(axis=1)
+		lengths[flying[landed]] = steps + gone[landed].argmax(axis=1) + 1
+		steps += chunkSteps
+		if lengths.all():
+			break
+		chunkSteps *= 2
+	lengths[lengths == 0] = steps
+
+	return Arcs(numpy.hstack(xChunks), numpy.hstack(yChunks), lengths)
+
+
+def sampleArc(startx, starty, angle, velocity, wind, gravity, maxSteps=MAX_STEPS, timeStep=TIME_STEP):
+	"""Returns the x and y arrays for a single throw, cut at the first sample off the screen"""
+	return sampleArcs(startx, starty, angle, velocity, wind, gravity, maxSteps, timeStep).arc(0)
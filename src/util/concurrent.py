@@ -3,11 +3,14 @@
 from __future__ import with_statement
 
 import os
+import sys
 import errno
 import time
 import functools
 import contextlib
 import logging
+import threading
+import Queue
 
 import misc
 
@@ -145,3 +148,98 @@ def flock(path, timeout=-1):
 		yield fd
 	finally:
 		os.unlink(path)
+
+
+class Prefetcher(object):
+	"""
+	Calls factory in a background thread so its results are ready before
+	they are asked for.  At most maxsize results are made ahead of time.
+
+	>>> import itertools
+	>>> prefetcher = Prefetcher(itertools.count().next)
+	>>> prefetcher.start()
+	>>> prefetcher.get(), prefetcher.get()
+	(0, 1)
+	>>> prefetcher.stop()
+
+	A factory that fails only fails the results it was making, the ones
+	after them still get made.
+
+	>>> counter = itertools.count()
+	>>> def factory():
+	... 	n = counter.next()
+	... 	if n == 1:
+	... 		raise ValueError(n)
+	... 	return n
+	>>> prefetcher = Prefetcher(factory)
+	>>> prefetcher.start()
+	>>> prefetcher.get()
+	0
+	>>> prefetcher.get()
+	Traceback (most recent call last):
+	...
+	ValueError: 1
+	>>> prefetcher.get(timeout = 5)
+	2
+	>>> prefetcher.stop()
+	"""
+
+	_POLL_TIME = 0.1
+
+	def __init__(self, factory, maxsize = 1):
+		self._factory = factory
+		self._results = Queue.Queue()
+		self._slots = Queue.Queue()
+		for i in xrange(maxsize):
+			self._slots.put(None)
+		self._thread = None
+		self._stopping = threading.Event()
+
+	def start(self):
+		assert self._thread is None, "Prefetcher already started"
+		self._stopping.clear()
+		self._thread = threading.Thread(target = self._run, name = "Prefetch %r" % (self._factory, ))
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	def get(self, timeout = None):
+		"""
+		Returns the next result, waiting for it if it isn't ready yet.  If
+		factory raised an exception instead, it is raised here, with the
+		traceback from the background thread.
+		"""
+		isError, result = self._results.get(True, timeout)
+		self._slots.put(None)
+		if isError:
+			excType, excValue, excTraceback = result
+			raise excType, excValue, excTraceback
+		return result
+
+	def stop(self):
+		"""Stops making results and throws away any that were made already"""
+		if self._thread is None:
+			return
+		self._stopping.set()
+		self._thread.join()
+		self._thread = None
+		try:
+			while True:
+				self._results.get_nowait()
+				self._slots.put(None)
+		except Queue.Empty:
+			pass
+
+	def _run(self):
+		while not self._stopping.isSet():
+			try:
+				self._slots.get(True, self._POLL_TIME)
+			except Queue.Empty:
+				continue
+			try:
+				item = False, self._factory()
+			except Exception, e:
+				_moduleLogger.exception("Prefetching with %r failed" % (self._factory, ))
+				item = True, sys.exc_info()
+			self._results.put(item)
+			"""Carrying on after a failure, or every get() after the one
+			that raises it would wait forever."""
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+
+"""Making up the city, where the gorillas stand and the wind, without drawing any of it.
+
+Everything here draws from a random.Random seeded for the round rather than the global random module, so the same
+seed always gives the same World. A World is just numbers (the buildings, their colors and windows, the gorillas and
+the wind), which gorilla_pygame.makeCityScape() renders, collision.SkylineMask gets filled in from and toBytes()
+packs into a few hundred bytes for saving or comparing.
+
+The random numbers are drawn in the same order as the game always has, so a seed gives the city that seeding the
+global random module with it used to.
+"""
+
+from __future__ import with_statement
+
+import sys
+import array
+import struct
+import random
+import logging
+
+import numpy
+
+import collision
+import simulation
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+SCR_WIDTH = simulation.SCR_WIDTH
+SCR_HEIGHT = simulation.SCR_HEIGHT
+
+MAX_SEED = 2 ** 31 - 1
+
+BOTTOM_LINE = SCR_HEIGHT - 25 # the bottom line of the buildings. We want some space for the wind arrow to go
+HEIGHT_INC = 10 # a baseline for how much buildings grow or shrink compared to the last building
+DEF_BUILD_WIDTH = 37 # default building width, also judges how wide buildings can be
+RANDOM_HEIGHT_DIFF = 120 # about how much buildings grow or shrink
+WINDOW_WIDTH = 4 # the width of each window in pixels
+WINDOW_HEIGHT = 7 # the height of each window in pixels
+WINDOW_SPACING_X = 10 # how many pixels apart each window's left edge is
+WINDOW_SPACING_Y = 15 # how many pixels apart each window's top edge is
+G_HEIGHT = 25 # (I'm not sure what this suppoes to be in the original Qbasic code, but I copied it anyway)
+BUILDING_COLOR_COUNT = 3
+
+_MAGIC = 'GWLD'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBb4hB')
+_BUILDING = struct.Struct('<3hBH')
+_CRATER_COUNT = struct.Struct('<H')
+
+
+def newSeed():
+	"""A seed for a round nobody asked to be any round in particular"""
+	return random.randint(0, MAX_SEED)
+
+
+class Building(object):
+	"""One building. "left" is where its lot starts, "top" is the top of the building, "color" is an index into
+	gorilla_pygame.BUILDING_COLORS and "windows" says for each window whether its light is on, in the order
+	windowRects() gives them."""
+
+	def __init__(self, left, top, width, height, color, windows):
+		self.left = left
+		self.top = top
+		self.width = width
+		self.height = height
+		self.color = color
+		self.windows = windows
+
+	def __repr__(self):
+		return "<Building %d wide and %d high at %d>" % (self.width, self.height, self.left)
+
+	@property
+	def rect(self):
+		"""The (left, top, width, height) actually covered by the building"""
+		return (self.left + 1, BOTTOM_LINE - (self.height + 1), self.width - 1, self.height - 1)
+
+	def windowRects(self):
+		"""The (left, top, width, height) of each window, column by column"""
+		return [
+			(self.left + 1 + winx, self.top + 1 + winy, WINDOW_WIDTH, WINDOW_HEIGHT)
+			for winx in range(3, self.width - WINDOW_SPACING_X + WINDOW_WIDTH, WINDOW_SPACING_X)
+			for winy in range(3, self.height - WINDOW_SPACING_Y, WINDOW_SPACING_Y)
+		]
+
+
+class World(object):
+	"""Everything about a round that is made up at random.
+
+	"buildings" is a list of Buildings, left to right, "gorillas" the (left, top) of each player's gorilla and "wind"
+	the wind speed, positive blowing to the right. "seed" is what it was generated from, if anything.
+
+	>>> world = generateWorld(42)
+	>>> World.fromBytes(world.toBytes()) == world, generateWorld(42) == world
+	(True, True)
+	>>> len(world.toBytes()) < 512
+	True
+	"""
+
+	def __init__(self, buildings, gorillas, wind, seed=None):
+		self.buildings = buildings
+		self.gorillas = gorillas
+		self.wind = wind
+		self.seed = seed
+
+	def __repr__(self):
+		return "<World of %d buildings, wind %d, from seed %r>" % (len(self.buildings), self.wind, self.seed)
+
+	def __eq__(self, other):
+		return isinstance(other, World) and self.toBytes() == other.toBytes()
+
+	def __ne__(self, other):
+		return not (self == other)
+
+	@property
+	def buildingCoords(self):
+		"""The (left, top) of each building, left to right"""
+		return [(building.left, building.top) for building in self.buildings]
+
+	def windows(self):
+		"""Returns (lefts, tops, lit), arrays with the top left corner of every window in the city and whether its
+		light is on, building by building in the same order as each building's windowRects()
+
+		>>> world = generateWorld(42)
+		>>> lefts, tops, lit = world.windows()
+		>>> first = world.buildings[0]
+		>>> (lefts[1], tops[1], lit[1]) == (first.windowRects()[1][:2] + (first.windows[1], ))
+		True
+		"""
+		colCounts = numpy.array([
+			len(xrange(3, building.width - WINDOW_SPACING_X + WINDOW_WIDTH, WINDOW_SPACING_X))
+			for building in self.buildings
+		])
+		rowCounts = numpy.array([
+			len(xrange(3, building.height - WINDOW_SPACING_Y, WINDOW_SPACING_Y))
+			for building in self.buildings
+		])
+		counts = colCounts * rowCounts
+		whose = numpy.repeat(numpy.arange(len(self.buildings)), counts)
+		nth = numpy.arange(counts.sum()) - numpy.repeat(counts.cumsum() - counts, counts)
+		"""whose is the building each window belongs to and nth which of its windows it is, column by column."""
+		lefts = numpy.array([building.left for building in self.buildings])[whose]
+		tops = numpy.array([building.top for building in self.buildings])[whose]
+		lefts += 1 + 3 + WINDOW_SPACING_X * (nth // rowCounts[whose])
+		tops += 1 + 3 + WINDOW_SPACING_Y * (nth % rowCounts[whose])
+		lit = numpy.array([lit for building in self.buildings for lit in building.windows], dtype=bool)
+		return lefts, tops, lit
+
+	def skylineMask(self):
+		"""Returns a new collision.SkylineMask of the buildings. The windows are all inside the buildings, so the
+		whole rect of each one is solid."""
+		mask = collision.SkylineMask(SCR_WIDTH, SCR_HEIGHT)
+		for building in self.buildings:
+			mask.fillRect(*building.rect)
+		return mask
+
+	def toBytes(self):
+		"""Packs the world into a string, which fromBytes() turns back into the same world. The seed is left out, the
+		world stands on its own."""
+		(gor1x, gor1y), (gor2x, gor2y) = self.gorillas
+		parts = [_HEADER.pack(_MAGIC, _VERSION, self.wind, gor1x, gor1y, gor2x, gor2y, len(self.buildings))]
+		for building in self.buildings:
+			parts.append(_BUILDING.pack(
+				building.left, building.width, building.height, building.color, len(building.windows)
+			))
+			bits = 0
+			for i, lit in enumerate(building.windows):
+				if lit:
+					bits |= 1 << i
+			parts.append(''.join([chr((bits >> shift) & 0xff) for shift in range(0, len(building.windows), 8)]))
+		return ''.join(parts)
+
+	@classmethod
+	def fromBytes(cls, data):
+		magic, version, wind, gor1x, gor1y, gor2x, gor2y, buildingCount = _HEADER.unpack_from(data)
+		if magic != _MAGIC or version != _VERSION:
+			raise ValueError("Not a version %d world" % _VERSION)
+		offset = _HEADER.size
+		buildings = []
+		for i in xrange(buildingCount):
+			left, width, height, color, windowCount = _BUILDING.unpack_from(data, offset)
+			offset += _BUILDING.size
+			byteCount = (windowCount + 7) // 8
+			bits = 0
+			for shift, char in enumerate(data[offset:offset + byteCount]):
+				bits |= ord(char) << (8 * shift)
+			offset += byteCount
+			windows = [bool(bits & (1 << j)) for j in xrange(windowCount)]
+			buildings.append(Building(left, BOTTOM_LINE - height, width, height, color, windows))
+		return cls(buildings, [(gor1x, gor1y), (gor2x, gor2y)], wind)
+
+
+class CityState(object):
+	"""A World as it stands partway through its round, with every crater that has been blown into it.
+
+	The buildings come down to the top row of solid ground in each column of the screen ("tops", with SCR_HEIGHT
+	for columns between buildings) and the damage to a list of (x, y, radius) craters, kept flat in an array. That
+	is enough to say what is solid anywhere, to be packed into a few hundred bytes and to rebuild everything else.
+	"mask" is the collision.SkylineMask built from all of that, which is what bananas get checked against, and
+	addCrater() keeps it up to date.
+
+	>>> city = CityState(generateWorld(42))
+	>>> x, y = city.world.gorillas[0]
+	>>> y += simulation.GOR_SIZE[1] + 2
+	>>> city.isSolid(x, y)
+	True
+	>>> city.addCrater(x, y, 5)
+	>>> city.isSolid(x, y), city.craterList() == [(x, y, 5)]
+	(False, True)
+	>>> copy = CityState.fromBytes(city.toBytes())
+	>>> copy == city, (copy.mask.solid == city.mask.solid).all()
+	(True, True)
+	"""
+
+	def __init__(self, world, craters=()):
+		self.world = world
+		self.tops = numpy.empty(SCR_WIDTH, dtype=numpy.int16)
+		self.tops.fill(SCR_HEIGHT)
+		for building in world.buildings:
+			left, top, width, height = building.rect
+			self.tops[left:left + width] = top
+		self.bottom = BOTTOM_LINE - 3
+		"""The last row of every building, see Building.rect."""
+		self.craters = array.array('h')
+		self.mask = world.skylineMask()
+		for x, y, radius in craters:
+			self.addCrater(x, y, radius)
+
+	def __repr__(self):
+		return "<CityState of %r with %d craters>" % (self.world, len(self.craters) // 3)
+
+	def __eq__(self, other):
+		return isinstance(other, CityState) and self.toBytes() == other.toBytes()
+
+	def __ne__(self, other):
+		return not (self == other)
+
+	def craterList(self):
+		"""The (x, y, radius) of every crater, oldest first"""
+		craters = self.craters.tolist()
+		return zip(craters[0::3], craters[1::3], craters[2::3])
+
+	def addCrater(self, x, y, radius):
+		"""Blows a hole of radius around x, y out of the city"""
+		self.craters.extend((x, y, radius))
+		self.mask.carveCircle(x, y, radius)
+
+	def isSolid(self, x, y):
+		"""Whether there is building left at x, y, worked out from the profile and the craters alone"""
+		x, y = int(x), int(y)
+		if not (0 <= x < SCR_WIDTH) or not (self.tops[x] <= y <= self.bottom):
+			return False
+		if self.craters:
+			craters = numpy.frombuffer(self.craters, dtype=numpy.int16).reshape(-1, 3).astype(int)
+			dx = craters[:, 0] - x
+			dy = craters[:, 1] - y
+			if (dx * dx + dy * dy <= craters[:, 2] * craters[:, 2]).any():
+				return False
+		return True
+
+	def toBytes(self):
+		"""Packs the world and its craters into a string, which fromBytes() turns back into the same CityState"""
+		craters = array.array('h', self.craters)
+		if sys.byteorder != 'little':
+			craters.byteswap()
+		return self.world.toBytes() + _CRATER_COUNT.pack(len(craters) // 3) + craters.tostring()
+
+	@classmethod
+	def fromBytes(cls, data):
+		world = World.fromBytes(data)
+		offset = len(world.toBytes())
+		craterCount, = _CRATER_COUNT.unpack_from(data, offset)
+		offset += _CRATER_COUNT.size
+		craters = array.array('h')
+		craters.fromstring(data[offset:offset + craterCount * 3 * craters.itemsize])
+		if sys.byteorder != 'little':
+			craters.byteswap()
+		craterList = zip(craters[0::3], craters[1::3], craters[2::3])
+		return cls(world, craterList)
+
+
+def makeBuildings(rng):
+	"""Makes up the skyline, left to right"""
+
+	"""We will choose an upward, downward, valley "v" curve, or hilly "^" curve for the slope of the buildings.
+	Half of the time we will choose the valley slope shape, while the remaining three each have a 1/6 chance of
+	being choosen. The slope also determines the height of the first building, which is stored in newHeight."""
+	slopeIndex = rng.randint(1, 6)
+	if slopeIndex == 1:
+		slope = 'upward'
+		newHeight = 15
+	elif slopeIndex == 2:
+		slope = 'downward'
+		newHeight = 130
+	elif 3 <= slopeIndex and slopeIndex <= 5:
+		slope = 'v'
+		newHeight = 15
+	else:
+		slope = '^'
+		newHeight = 130
+
+	buildings = []
+	x = 2 # x refers to the top left corner of the current building
+	while x < SCR_WIDTH - HEIGHT_INC:
+		# First the slope type determines if the building should grow or shrink.
+		if slope == 'upward':
+			newHeight += HEIGHT_INC
+		elif slope == 'downward':
+			newHeight -= HEIGHT_INC
+		elif slope == 'v':
+			if x > SCR_WIDTH / 2:
+				newHeight -= (2 * HEIGHT_INC)
+			else:
+				newHeight += (2 * HEIGHT_INC)
+		else:
+			if x > SCR_WIDTH / 2:
+				newHeight += (2 * HEIGHT_INC)
+			else:
+				newHeight -= (2 * HEIGHT_INC)
+
+		buildWidth = DEF_BUILD_WIDTH + rng.randint(0, DEF_BUILD_WIDTH)
+		if buildWidth + x > SCR_WIDTH:
+			buildWidth = SCR_WIDTH - x -2
+
+		buildHeight = rng.randint(HEIGHT_INC, RANDOM_HEIGHT_DIFF) + newHeight
+		if BOTTOM_LINE - buildHeight <= G_HEIGHT:
+			buildHeight = G_HEIGHT
+
+		color = rng.randint(0, BUILDING_COLOR_COUNT - 1)
+
+		building = Building(x, BOTTOM_LINE - buildHeight, buildWidth, buildHeight, color, [])
+		building.windows = [rng.randint(1, 4) != 1 for rect in building.windowRects()]
+		# A quarter of the windows are dark
+		buildings.append(building)
+
+		x += buildWidth
+	return buildings
+
+
+def placeGorillas(buildCoords, rng):
+	"""Places the gorillas on the second or third building from each edge and returns their [(left, top), (left, top)]"""
+	gorPos = [] # item 0 is for (left, top) of player one, item 1 is for player two.
+	gorWidth, gorHeight = simulation.GOR_SIZE
+	xAdj = int(gorWidth / 2)
+	yAdj = gorHeight
+
+	for i in xrange(0, 2): # place first and then second player
+		if i == 0:
+			buildNum = rng.randint(1, 2)
+		else:
+			buildNum = rng.randint(len(buildCoords)-3, len(buildCoords)-2)
+
+		buildWidth = buildCoords[buildNum + 1][0] - buildCoords[buildNum][0]
+		gorPos.append( (buildCoords[buildNum][0] + int(buildWidth / 2) - xAdj, buildCoords[buildNum][1] - yAdj - 1) )
+	return gorPos
+
+
+def getWind(rng):
+	"""Randomly determine what the wind speed and direction should be for this round."""
+	wind = rng.randint(5, 15)
+	if rng.randint(0, 1):
+		wind *= -1
+	return wind
+
+
+def generateWorld(seed=None):
+	"""Makes up a whole round from seed, or from a new seed if there is none"""
+	if seed is None:
+		seed = newSeed()
+	rng = random.Random(seed)
+	buildings = makeBuildings(rng)
+	gorillas = placeGorillas([(building.left, building.top) for building in buildings], rng)
+	wind = getWind(rng)
+	return World(buildings, gorillas, wind, seed)
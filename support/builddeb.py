@@ -73,6 +73,7 @@ def build_package(distribution):
 	p.depends = ", ".join([
 		"python2.6 | python2.5",
 		"python-simplejson",
+		"python-numpy",
 	])
 	p.depends += {
 		"debian": ", python-qt4, python-pygame",